@@ -1,20 +1,34 @@
-import numpy as np
-import pandas as pd
+import functools as functools
+import os as os
 
 import dash as dash
+import flask as flask
 import dash_core_components as dash_component
 import dash_html_components as dash_html
 import dash_table as dash_table
 
 from datetime import datetime as dt
-from dash.dependencies import Input, Output
-from joblib import dump, load
+from dash.dependencies import Input, Output, State
+from callback_cache import get_cache_stats, memoize_callback
+from dashboard_data import get_dashboard_data, get_return_model_path, get_campaign_rows, get_activist_rows, get_activist_past_successes, get_campaign_value, get_company_chart_pricing, get_campaign_options, search_campaigns
+from prediction_service import load_campaign_return_model, make_campaign_predictor
 
-df = pd.read_csv('data/engineered_factset_campaign.csv')
-df_pricing = pd.read_csv('data/clean_factset_pricing.csv', parse_dates=['date'])
+# nothing is loaded at import, data and the model are loaded by the first callback that needs them
+# (from the pipeline's dashboard bundle when there is one, see dashboard_data.get_dashboard_data)
 
-df_campaign_return_data = pd.read_csv('results/campaign_return_model_data.csv')
-campaign_return_model = load('results/campaign_return_model.joblib') 
+@functools.lru_cache(maxsize=None)
+def get_campaign_predictor():
+    dict_data = get_dashboard_data()
+    return make_campaign_predictor(load_campaign_return_model(get_return_model_path()), dict_data['return_model_data'], dict_data['announcement_dates'])
+
+# the rendered tables, figure and prediction are memoized by the data version and what they show
+# (the campaign, activist or company and the filtration date), so a selection someone viewed before
+# is not rendered again, see callback_cache.py
+# set DASHBOARD_CACHE_DIRECTORY to also cache them on disk, shared by the gunicorn workers
+def get_data_version():
+    return get_dashboard_data()['version']
+
+memoize_render = memoize_callback(get_data_version, cache_directory=os.environ.get('DASHBOARD_CACHE_DIRECTORY'))
 
 app = dash.Dash(
     __name__,
@@ -26,6 +40,11 @@ app = dash.Dash(
 app.title = 'Moelis Capstone Dashboard'
 app.config['suppress_callback_exceptions'] = True
 
+@app.server.route('/_dashboard-cache')
+def show_cache_stats():
+    # hit and miss counters of the memoized callbacks in the worker process that answers
+    return flask.jsonify({'pid': os.getpid(), 'version': get_data_version(), 'callbacks': get_cache_stats()})
+
 app.layout = dash_html.Div(
     children=[
         dash_html.H1(children='Moelis Capstone Project Dashboard'),
@@ -51,17 +70,17 @@ app.layout = dash_html.Div(
         dash_html.H2(children='Inputs'),
         dash_html.H3('Selected Campaign'),
         dash_html.P(children='Select a specific campaign for analysis.'),
+        # options are searched on the server as you type, see update_campaign_options
         dash_component.Dropdown(
             id='selected-campaign-id',
-            options=[{'label': f"{row.campaign_title} ({row.campaign_id})", 'value': row.campaign_id} for index, row in df.iterrows()],
-            value='1023510334C'
+            options=[],
+            value='1023510334C',
+            placeholder='Search by campaign, company or activist'
         ),
         dash_html.H3('Selected Filtration Date'),
         dash_html.P(children='Select a filtration date. All analysis will be restricted to information available only up until this date.'),
         dash_component.DatePickerSingle(
             id='selected-filtration-date',
-            min_date_allowed=df.campaign_announcement_date.min(),
-            max_date_allowed=df.campaign_announcement_date.max(),
             initial_visible_month=dt(2017, 12, 15),
             date=str(dt(2017, 12, 31, 23, 59, 59))
         ),
@@ -75,7 +94,7 @@ app.layout = dash_html.Div(
         dash_html.H3(children='Activist Data'),
         dash_html.Div(id='activist-table-container'),
         dash_html.H3(children='Target Company Data'),
-        dash_html.Div(id='target-graph-container'),
+        dash_html.Div(id='target-graph-container', children=[dash_component.Graph(id='target-graph')]),
 
         dash_html.H2(children='Models'),
         # dash_html.H3(children='Campaign Objective Model'),
@@ -95,13 +114,39 @@ app.layout = dash_html.Div(
     }
 )
 
+@app.callback(
+    [Output('selected-filtration-date', 'min_date_allowed'), Output('selected-filtration-date', 'max_date_allowed')],
+    [Input('selected-filtration-date', 'id')]
+)
+def update_filtration_date_bounds(_):
+    # set on page load rather than in the layout so the layout needs no data
+    sr_announcement_dates = get_dashboard_data()['announcement_dates']
+    return sr_announcement_dates.min(), sr_announcement_dates.max()
+
+@app.callback(
+    Output('selected-campaign-id', 'options'),
+    [Input('selected-campaign-id', 'search_value')],
+    [State('selected-campaign-id', 'value'), State('selected-filtration-date', 'date')]
+)
+def update_campaign_options(search_value, selected_campaign_id, filtration_date):
+    # the selected campaign stays in the options so its label keeps showing
+    dict_data = get_dashboard_data()
+    list_options = search_campaigns(dict_data, search_value or '', as_of_date=filtration_date)
+    if selected_campaign_id not in [option['value'] for option in list_options]:
+        list_options = get_campaign_options(dict_data, [selected_campaign_id]) + list_options
+    return list_options
+
 @app.callback(
     Output('campaign-table-container', 'children'),
-    [Input('selected-campaign-id', 'value')]
+    [Input('selected-campaign-id', 'value'), Input('selected-filtration-date', 'date')]
 )
-def update_campaign_table(selected_campaign_id):
-    df_display = df.loc[
-        lambda df: df.campaign_id == selected_campaign_id,
+def update_campaign_table(selected_campaign_id, filtration_date):
+    return render_campaign_table(selected_campaign_id, filtration_date)
+
+@memoize_render
+def render_campaign_table(selected_campaign_id, filtration_date):
+    df_display = get_campaign_rows(
+        get_dashboard_data(), selected_campaign_id,
         [
             'campaign_id', 
             'activist_id',
@@ -113,19 +158,27 @@ def update_campaign_table(selected_campaign_id):
             'campaign_objective_primary',
             'value_demand',
             'governance_demand'
-        ]
-    ]
+        ],
+        as_of_date=filtration_date
+    )
+    if df_display.empty:
+        return dash_html.Div(children='The selected campaign was not announced by the filtration date.')
     df_display = df_display.set_index('campaign_id').transpose().reset_index()
     return dash_html.Div(children=[display_table(df_display)])
 
 @app.callback(
     Output('activist-table-container', 'children'),
-    [Input('selected-campaign-id', 'value')]
+    [Input('selected-campaign-id', 'value'), Input('selected-filtration-date', 'date')]
 )
-def update_activist_table(selected_campaign_id):
-    selected_activist_id = df[lambda df: df.campaign_id == selected_campaign_id].activist_id.iloc[0]
-    df_display = df.loc[
-        lambda df: df.activist_id == selected_activist_id,
+def update_activist_table(selected_campaign_id, filtration_date):
+    dict_data = get_dashboard_data()
+    return render_activist_table(get_campaign_value(dict_data, selected_campaign_id, 'activist_id'), filtration_date)
+
+@memoize_render
+def render_activist_table(selected_activist_id, filtration_date):
+    dict_data = get_dashboard_data()
+    df_display = get_activist_rows(
+        dict_data, selected_activist_id,
         [
             'campaign_id', 
             'campaign_announcement_date',
@@ -133,18 +186,43 @@ def update_activist_table(selected_campaign_id):
             'campaign_objective_primary',
             'activist_campaign_tactic',
             'ownership_pecent_on_announcement'
-        ]
-    ]
-    return dash_html.Div(children=[display_table(df_display)])
+        ],
+        as_of_date=filtration_date
+    )
+    past_return_successes = get_activist_past_successes(dict_data, selected_activist_id, as_of_date=filtration_date)
+    return dash_html.Div(children=[
+        dash_html.P(children=f'{df_display.campaign_id.nunique()} campaigns and {past_return_successes:.0f} known past successes by the filtration date.'),
+        display_table(df_display)
+    ])
+
+def get_relayout_range(relayout_data):
+    # the zoomed x axis range of a graph, (None, None) when not zoomed
+    relayout_data = relayout_data or {}
+    if 'xaxis.range' in relayout_data:
+        return tuple(relayout_data['xaxis.range'])
+    return relayout_data.get('xaxis.range[0]'), relayout_data.get('xaxis.range[1]')
 
 @app.callback(
-    Output('target-graph-container', 'children'),
-    [Input('selected-campaign-id', 'value')]
+    Output('target-graph', 'figure'),
+    [Input('selected-campaign-id', 'value'), Input('target-graph', 'relayoutData'), Input('selected-filtration-date', 'date')]
 )
-def update_graph(selected_campaign_id):
-    selected_company_id = df[lambda df: df.campaign_id == selected_campaign_id].company_id.iloc[0]
-    df_display = df_pricing[lambda df: df.company_id == selected_company_id]
-    return dash_component.Graph(figure={
+def update_graph(selected_campaign_id, relayout_data, filtration_date):
+    dict_data = get_dashboard_data()
+    selected_company_id = get_campaign_value(dict_data, selected_campaign_id, 'company_id')
+
+    # a new campaign shows the company's whole history, zooming reloads the zoomed range
+    # which is at full resolution once it is short enough
+    start_date, end_date = None, None
+    if any(trigger['prop_id'] == 'target-graph.relayoutData' for trigger in dash.callback_context.triggered):
+        start_date, end_date = get_relayout_range(relayout_data)
+    return render_graph(selected_company_id, start_date, end_date, filtration_date)
+
+@memoize_render
+def render_graph(selected_company_id, start_date, end_date, filtration_date):
+    dict_data = get_dashboard_data()
+    df_display = get_company_chart_pricing(dict_data, selected_company_id, start_date, end_date, as_of_date=filtration_date)
+
+    return {
         'data': [
             {
                 'x': df_display.date,
@@ -154,17 +232,23 @@ def update_graph(selected_campaign_id):
             }
         ],
         'layout': {
-            'title': f'Stock Price of Target Company ({selected_company_id})'
+            'title': f'Stock Price of Target Company ({selected_company_id})',
+            'xaxis': {'range': [start_date, end_date]} if start_date is not None else {}
         }
-    })
+    }
 
 @app.callback(
     Output('return-prediction-container', 'children'),
-    [Input('selected-campaign-id', 'value')]
+    [Input('selected-campaign-id', 'value'), Input('selected-filtration-date', 'date')]
 )
-def update_model_prediction(selected_campaign_id):
-    df_x = df_campaign_return_data[lambda df: df.campaign_id == selected_campaign_id].iloc[:, 1::]
-    y_predicted = campaign_return_model.predict(df_x)
+def update_model_prediction(selected_campaign_id, filtration_date):
+    return render_model_prediction(selected_campaign_id, filtration_date)
+
+@memoize_render
+def render_model_prediction(selected_campaign_id, filtration_date):
+    y_predicted = get_campaign_predictor()(selected_campaign_id, filtration_date)
+    if y_predicted is None:
+        return dash_html.Div(children='No campaign return prediction is available for this campaign by the filtration date.')
     y_predicted_label = 'POSITIVE' if y_predicted == 1 else 'NEGATIVE'
     return dash_html.Div(children=f"The predicted campaign return is: {y_predicted_label}")
 
@@ -0,0 +1,276 @@
+import argparse as argparse
+import collections as collections
+import logging as logging
+import os as os
+import tempfile as tempfile
+import time as time
+import joblib as joblib
+import numpy as np
+import pandas as pd
+
+from concurrent.futures import ProcessPoolExecutor
+from sklearn.base import clone
+from sklearn.ensemble import BaseEnsemble
+from sklearn.metrics import accuracy_score, roc_auc_score
+from prediction_service import campaign_return_model_path
+from train import dict_candidate_models, get_feature_types, make_model, prepare_campaign_return_data
+
+logger = logging.getLogger(__name__)
+
+# walk-forward backtest of the campaign return model on campaign_announcement_date
+# instead of a random train test split, every fold tests the campaigns announced in one period (a year
+# by default) with a model trained on the campaigns announced before it (an expanding window) or in the
+# periods before it (a rolling window), leaving out the ones whose 6 month return is not known yet
+# the feature matrix is built once and sorted by date, so the training rows of every fold are a slice
+# of it, and the preprocessing of the notebook (median imputing and scaling numeric columns, most
+# frequent imputing categorical ones) is fitted incrementally: its statistics are updated with the rows
+# that enter and leave the window between folds instead of being refitted on the whole window
+# models that can start their solver from the previous fold's solution are warm started through their
+# folds, the other ones fit each fold on its own, and candidates and folds are evaluated in processes
+# run from the repository root after the pipeline's encode stage:
+# python backtest.py --models lasso_logistic_regression random_forest --workers 4
+
+campaign_return_backtest_path = 'results/campaign_return_backtest.csv'
+
+# the return of a campaign is known 6 months after its announcement
+label_delay_days = 183
+
+
+def make_walk_forward_folds(sr_dates, frequency='Y', min_train_periods=3, window_periods=None, gap_days=label_delay_days):
+    # row ranges (train_start, train_end, test_start, test_end) of sr_dates sorted ascending, one fold per
+    # period after the first min_train_periods, window_periods sets a rolling window of that many periods
+    dates = sr_dates.values
+    period_starts = sr_dates.dt.to_period(frequency).drop_duplicates().dt.start_time.values
+    list_folds = []
+    for i in range(min_train_periods, len(period_starts)):
+        test_start = np.searchsorted(dates, period_starts[i])
+        test_end = np.searchsorted(dates, period_starts[i + 1]) if i + 1 < len(period_starts) else len(dates)
+        train_end = np.searchsorted(dates, period_starts[i] - np.timedelta64(gap_days, 'D'))
+        train_start = np.searchsorted(dates, period_starts[max(i - window_periods, 0)]) if window_periods else 0
+        if train_end > train_start:
+            list_folds.append((int(train_start), int(train_end), int(test_start), int(test_end)))
+    return list_folds
+
+def make_preprocessing_state(n_numeric, n_categorical):
+    # enough to get the fitted imputers and scaler of the rows in a window: the sorted non-missing values,
+    # their sum, sum of squares and missing count of numeric columns and the value counts of categorical ones
+    return {
+        'rows': 0,
+        'sorted_values': [np.empty(0) for _ in range(n_numeric)],
+        'sums': np.zeros(n_numeric),
+        'squares': np.zeros(n_numeric),
+        'missing': np.zeros(n_numeric),
+        'counts': [collections.Counter() for _ in range(n_categorical)]
+    }
+
+def insert_sorted(sorted_values, values):
+    # a stable sort of two sorted runs merges them
+    return np.sort(np.concatenate([sorted_values, np.sort(values)]), kind='stable')
+
+def remove_sorted(sorted_values, values):
+    # equal values are removed at consecutive positions
+    values = np.sort(values)
+    duplicate_offsets = np.arange(len(values)) - np.searchsorted(values, values, side='left')
+    return np.delete(sorted_values, np.searchsorted(sorted_values, values, side='left') + duplicate_offsets)
+
+def update_preprocessing_state(dict_state, x_numeric, x_categorical, sign):
+    # adds (sign 1) or removes (sign -1) rows
+    dict_state['rows'] += sign * len(x_numeric)
+    is_missing = np.isnan(x_numeric)
+    dict_state['missing'] += sign * is_missing.sum(axis=0)
+    dict_state['sums'] += sign * np.where(is_missing, 0, x_numeric).sum(axis=0)
+    dict_state['squares'] += sign * np.where(is_missing, 0, x_numeric ** 2).sum(axis=0)
+    update_sorted = insert_sorted if sign > 0 else remove_sorted
+    for j in range(x_numeric.shape[1]):
+        dict_state['sorted_values'][j] = update_sorted(dict_state['sorted_values'][j], x_numeric[~is_missing[:, j], j])
+    for j in range(x_categorical.shape[1]):
+        values, counts = np.unique(x_categorical[~np.isnan(x_categorical[:, j]), j], return_counts=True)
+        dict_state['counts'][j].update(dict(zip(values, sign * counts)))
+
+def get_preprocessing_parameters(dict_state):
+    # the fill values, means and scales of SimpleImputer and StandardScaler fitted on the window's rows
+    # (a column without values in the window is filled with 0)
+    medians = np.array([
+        (sorted_values[(len(sorted_values) - 1) // 2] + sorted_values[len(sorted_values) // 2]) / 2 if len(sorted_values) else 0
+        for sorted_values in dict_state['sorted_values']
+    ])
+    # the mean and variance after imputing, from the sums of the non-missing values
+    means = (dict_state['sums'] + dict_state['missing'] * medians) / dict_state['rows']
+    variances = np.maximum((dict_state['squares'] + dict_state['missing'] * medians ** 2) / dict_state['rows'] - means ** 2, 0)
+    scales = np.sqrt(variances)
+    scales[scales < 10 * np.finfo(float).eps] = 1
+    # the most frequent value, the smallest one of ties like SimpleImputer
+    modes = np.array([
+        min((value for value, count in counts.items() if count == max(counts.values())), default=0)
+        for counts in dict_state['counts']
+    ])
+    return {'medians': medians, 'means': means, 'scales': scales, 'modes': modes}
+
+def transform_rows(dict_parameters, x_numeric, x_categorical):
+    # the columns in the order of the notebook's ColumnTransformer, numeric then categorical
+    return np.hstack([
+        (np.where(np.isnan(x_numeric), dict_parameters['medians'], x_numeric) - dict_parameters['means']) / dict_parameters['scales'],
+        np.where(np.isnan(x_categorical), dict_parameters['modes'], x_categorical)
+    ])
+
+def prepare_fold_parameters(x_numeric, x_categorical, list_folds):
+    # the preprocessing parameters of every fold, in one pass that moves the window from fold to fold
+    dict_state = make_preprocessing_state(x_numeric.shape[1], x_categorical.shape[1])
+    window_start, window_end = 0, 0
+    list_parameters = []
+    for train_start, train_end, _, _ in list_folds:
+        start_time = time.perf_counter()
+        if train_start >= window_end:
+            dict_state = make_preprocessing_state(x_numeric.shape[1], x_categorical.shape[1])
+            window_start, window_end = train_start, train_start
+        update_preprocessing_state(dict_state, x_numeric[window_end:train_end], x_categorical[window_end:train_end], 1)
+        update_preprocessing_state(dict_state, x_numeric[window_start:train_start], x_categorical[window_start:train_start], -1)
+        window_start, window_end = train_start, train_end
+        list_parameters.append((get_preprocessing_parameters(dict_state), time.perf_counter() - start_time))
+    return list_parameters
+
+def supports_warm_start(model):
+    # warm starting initializes an iterative solver at the previous fold's solution, ensembles would
+    # instead keep the previous fold's trees and liblinear ignores it
+    return 'warm_start' in model.get_params() and not isinstance(model, BaseEnsemble) and getattr(model, 'solver', None) != 'liblinear'
+
+def score_predictions(model, x_test, y_test):
+    y_predicted = model.predict(x_test)
+    if len(np.unique(y_test)) < 2:
+        auc = np.nan
+    elif hasattr(model, 'predict_proba'):
+        auc = roc_auc_score(y_test, model.predict_proba(x_test)[:, -1])
+    else:
+        auc = roc_auc_score(y_test, model.decision_function(x_test))
+    return {'accuracy': accuracy_score(y_test, y_predicted), 'auc': auc, 'predicted_positive_rate': np.mean(y_predicted == 1)}
+
+def evaluate_folds(array_directory, candidate_name, model, list_fold_tasks):
+    # fits and scores the model on each fold in order, a warm started model continues from the previous fold
+    x_numeric = np.load(os.path.join(array_directory, 'x_numeric.npy'), mmap_mode='r')
+    x_categorical = np.load(os.path.join(array_directory, 'x_categorical.npy'), mmap_mode='r')
+    y = np.load(os.path.join(array_directory, 'y.npy'), mmap_mode='r')
+    is_warm_started = supports_warm_start(model)
+    if is_warm_started:
+        model = clone(model).set_params(warm_start=True)
+
+    list_results = []
+    for fold_number, (train_start, train_end, test_start, test_end), dict_parameters in list_fold_tasks:
+        start_time = time.perf_counter()
+        x_train = transform_rows(dict_parameters, x_numeric[train_start:train_end], x_categorical[train_start:train_end])
+        x_test = transform_rows(dict_parameters, x_numeric[test_start:test_end], x_categorical[test_start:test_end])
+        transform_seconds = time.perf_counter() - start_time
+
+        start_time = time.perf_counter()
+        fitted_model = (model if is_warm_started else clone(model)).fit(x_train, y[train_start:train_end])
+        fit_seconds = time.perf_counter() - start_time
+
+        start_time = time.perf_counter()
+        dict_scores = score_predictions(fitted_model, x_test, y[test_start:test_end])
+        list_results.append({
+            'candidate': candidate_name,
+            'fold': fold_number,
+            'train_rows': train_end - train_start,
+            'test_rows': test_end - test_start,
+            'warm_started': is_warm_started and fold_number > list_fold_tasks[0][0],
+            **dict_scores,
+            'transform_seconds': transform_seconds,
+            'fit_seconds': fit_seconds,
+            'score_seconds': time.perf_counter() - start_time
+        })
+    return list_results
+
+def map_fold_tasks(list_tasks, dict_arrays, n_workers):
+    # list_tasks has (candidate name, model, fold tasks) evaluated in order, the arrays are written
+    # once and memory-mapped by the workers
+    with tempfile.TemporaryDirectory() as array_directory:
+        for name, values in dict_arrays.items():
+            np.save(os.path.join(array_directory, name + '.npy'), values)
+        if n_workers <= 1:
+            return [evaluate_folds(array_directory, *task) for task in list_tasks]
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            list_futures = [executor.submit(evaluate_folds, array_directory, *task) for task in list_tasks]
+            return [future.result() for future in list_futures]
+
+def get_backtest_candidates(list_model_names, include_exported_model=True):
+    # the default configuration of each named candidate of train.py and the model of the exported
+    # campaign return model, when there is one
+    dict_candidates = {model_name: make_model(model_name, {}) for model_name in list_model_names}
+    if include_exported_model and os.path.exists(campaign_return_model_path):
+        dict_candidates['exported_model'] = clone(joblib.load(campaign_return_model_path).named_steps['model'])
+    return dict_candidates
+
+def run_backtest(dict_candidates, frequency='Y', min_train_periods=3, window_periods=None, gap_days=label_delay_days, n_workers=1):
+    df, list_x_columns = prepare_campaign_return_data()
+    df = df.sort_values('campaign_announcement_date', kind='stable').reset_index(drop=True)
+    list_numeric_features, list_categorical_features = get_feature_types(df[list_x_columns])
+    dict_arrays = {
+        'x_numeric': df[list_numeric_features].to_numpy(dtype=float),
+        'x_categorical': df[list_categorical_features].to_numpy(dtype=float),
+        'y': df.campaign_return_is_positive.to_numpy()
+    }
+
+    list_folds = make_walk_forward_folds(df.campaign_announcement_date, frequency, min_train_periods, window_periods, gap_days)
+    logger.info(f'{len(list_folds)} folds of {len(df)} campaigns, {len(dict_candidates)} candidates')
+    list_fold_parameters = prepare_fold_parameters(dict_arrays['x_numeric'], dict_arrays['x_categorical'], list_folds)
+    list_fold_tasks = [
+        (fold_number, fold, dict_parameters)
+        for fold_number, (fold, (dict_parameters, _)) in enumerate(zip(list_folds, list_fold_parameters))
+    ]
+
+    # a warm started candidate goes through its folds in order in one task, others have a task per fold
+    list_tasks = []
+    for candidate_name, model in dict_candidates.items():
+        if supports_warm_start(model):
+            list_tasks.append((candidate_name, model, list_fold_tasks))
+        else:
+            list_tasks.extend((candidate_name, model, [fold_task]) for fold_task in list_fold_tasks)
+    list_results = [dict_result for list_task_results in map_fold_tasks(list_tasks, dict_arrays, n_workers) for dict_result in list_task_results]
+
+    sr_dates = df.campaign_announcement_date
+    df_folds = pd.DataFrame([
+        {
+            'fold': fold_number,
+            'train_start_date': sr_dates.iloc[train_start],
+            'train_end_date': sr_dates.iloc[train_end - 1],
+            'test_start_date': sr_dates.iloc[test_start],
+            'test_end_date': sr_dates.iloc[test_end - 1],
+            'test_positive_rate': dict_arrays['y'][test_start:test_end].mean(),
+            'preprocess_seconds': preprocess_seconds
+        }
+        for fold_number, ((train_start, train_end, test_start, test_end), (_, preprocess_seconds)) in enumerate(zip(list_folds, list_fold_parameters))
+    ])
+    return pd.merge(pd.DataFrame(list_results), df_folds, how='left', on='fold').sort_values(['candidate', 'fold'], kind='stable').reset_index(drop=True)
+
+def parse_arguments(arguments=None):
+    parser = argparse.ArgumentParser(description='Walk-forward backtest of campaign return models on the announcement date.')
+    parser.add_argument('--models', nargs='+', choices=list(dict_candidate_models), default=['lasso_logistic_regression', 'ridge_logistic_regression'])
+    parser.add_argument('--no-exported-model', action='store_true', help=f'do not backtest the model of {campaign_return_model_path}')
+    parser.add_argument('--frequency', default='Y', help='length of the test periods as a pandas period frequency, Y or Q')
+    parser.add_argument('--min-train-periods', type=int, default=3, help='periods before the first test period')
+    parser.add_argument('--window', type=int, default=None, help='train on a rolling window of this many periods instead of all earlier ones')
+    parser.add_argument('--gap-days', type=int, default=label_delay_days, help='days between the last training and the first test announcement')
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--output', default=campaign_return_backtest_path)
+    return parser.parse_args(arguments)
+
+
+if __name__ == '__main__':
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s %(levelname)s [%(name)s] %(message)s'
+    )
+
+    args = parse_arguments()
+    df_backtest = run_backtest(
+        get_backtest_candidates(args.models, include_exported_model=not args.no_exported_model),
+        args.frequency, args.min_train_periods, args.window, args.gap_days, args.workers
+    )
+    logger.info(f'writing to {args.output}')
+    df_backtest.to_csv(args.output, index=False)
+    print(
+        df_backtest
+        .groupby('candidate')
+        .agg(folds=('fold', 'size'), accuracy=('accuracy', 'mean'), auc=('auc', 'mean'), fit_seconds=('fit_seconds', 'sum'))
+        .to_string(float_format=lambda value: f'{value:.3f}')
+    )
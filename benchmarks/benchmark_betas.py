@@ -0,0 +1,51 @@
+import argparse as argparse
+import os as os
+import time as time
+import pandas as pd
+
+from benchmarks.synthetic_data import make_campaign_windows, make_company_pricing, make_market_pricing
+from main import calculate_betas
+
+# run from the repository root:
+# python -m benchmarks.benchmark_betas --companies 10000 --years 30 --workers 1 2 4 8
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time calculate_betas on synthetic data for several worker counts.')
+    parser.add_argument('--companies', type=int, default=10000)
+    parser.add_argument('--years', type=int, default=30)
+    parser.add_argument('--campaigns-per-company', type=int, default=1)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, os.cpu_count()])
+    parser.add_argument('--partition-rows', type=int, default=2000000)
+    args = parser.parse_args()
+
+    print(f'generating {args.companies} companies x {args.years} years of pricing')
+    df_yahoo_finance_pricing = make_market_pricing(n_years=args.years)
+    df_factset_pricing = make_company_pricing(df_yahoo_finance_pricing, n_companies=args.companies)
+    df_factset_campaign = make_campaign_windows(df_factset_pricing, campaigns_per_company=args.campaigns_per_company)
+    print(f'{len(df_factset_pricing)} pricing rows, {len(df_factset_campaign)} campaigns')
+
+    list_results = []
+    df_reference = None
+    for n_workers in sorted(set(args.workers)):
+        start_time = time.perf_counter()
+        df_betas = calculate_betas(
+            df_factset_campaign, df_factset_pricing, df_yahoo_finance_pricing,
+            n_workers=n_workers, partition_rows=args.partition_rows
+        )
+        seconds = time.perf_counter() - start_time
+
+        # partitions do not depend on the worker count, so results must be identical
+        if df_reference is None:
+            df_reference = df_betas
+        pd.testing.assert_frame_equal(df_betas, df_reference)
+
+        list_results.append({'workers': n_workers, 'seconds': seconds})
+        print(f'{n_workers} workers: {seconds:.2f}s')
+
+    df_results = pd.DataFrame(list_results).assign(speedup=lambda df: df.seconds.iloc[0] / df.seconds)
+    print(df_results.to_string(index=False))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+import argparse as argparse
+import json as json
+import time as time
+import numpy as np
+import pandas as pd
+
+from benchmarks.synthetic_data import make_campaign_names
+from dashboard_data import build_campaign_search_index, get_campaign_options, search_campaigns
+
+# run from the repository root:
+# python -m benchmarks.benchmark_campaign_search --campaigns 20000
+
+
+def time_call(function, *args):
+    start_time = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start_time
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare building all campaign dropdown options up front with the search index.')
+    parser.add_argument('--campaigns', type=int, default=20000)
+    parser.add_argument('--rows-per-campaign', type=int, default=2)
+    parser.add_argument('--queries', type=int, default=1000)
+    args = parser.parse_args()
+
+    df_campaigns = make_campaign_names(n_campaigns=args.campaigns)
+    df_campaigns = df_campaigns.loc[df_campaigns.index.repeat(args.rows_per_campaign)].reset_index(drop=True)
+    print(f'{df_campaigns.campaign_id.nunique()} campaigns, {len(df_campaigns)} rows')
+
+    # before: every row becomes an option at startup and ships with the layout
+    list_all_options, iterrows_seconds = time_call(
+        lambda df: [{'label': f"{row.campaign_title} ({row.campaign_id})", 'value': row.campaign_id} for index, row in df.iterrows()],
+        df_campaigns
+    )
+
+    # after: the index is built at startup and the layout only has the selected campaign
+    dict_index, index_seconds = time_call(build_campaign_search_index, df_campaigns)
+    dict_data = {'campaign_search': dict_index}
+    list_initial_options = get_campaign_options(dict_data, [df_campaigns.campaign_id.iloc[0]])
+
+    # typed prefixes of names and ids
+    rng = np.random.default_rng(0)
+    list_queries = [
+        text[:rng.integers(1, len(text) + 1)]
+        for text in rng.choice(
+            np.concatenate([df_campaigns.company_name.values, df_campaigns.activist_name.values, df_campaigns.campaign_id.values]),
+            args.queries
+        )
+    ]
+    list_query_seconds = []
+    list_result_bytes = []
+    for query in list_queries:
+        list_options, seconds = time_call(search_campaigns, dict_data, query)
+        list_query_seconds.append(seconds)
+        list_result_bytes.append(len(json.dumps(list_options)))
+
+    df_results = pd.DataFrame([
+        {'options': 'all up front (iterrows)', 'startup_seconds': iterrows_seconds, 'layout_options_bytes': len(json.dumps(list_all_options))},
+        {'options': 'search index', 'startup_seconds': index_seconds, 'layout_options_bytes': len(json.dumps(list_initial_options))},
+    ])
+    print(df_results.to_string(index=False))
+    print(
+        f'search: p50 {np.percentile(list_query_seconds, 50) * 1000:.3f}ms, p99 {np.percentile(list_query_seconds, 99) * 1000:.3f}ms, '
+        f'median response {np.median(list_result_bytes):.0f} bytes'
+    )
+
+
+if __name__ == '__main__':
+    main()
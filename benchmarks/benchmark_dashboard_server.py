@@ -0,0 +1,136 @@
+import argparse as argparse
+import concurrent.futures as futures
+import json as json
+import os as os
+import subprocess as subprocess
+import sys as sys
+import tempfile as tempfile
+import time as time
+import urllib.request as request
+import numpy as np
+import pandas as pd
+
+from benchmarks.synthetic_data import write_dashboard_files
+from dashboard_data import dashboard_bundle_directory, write_dashboard_bundle
+
+# run from the repository root (needs gunicorn):
+# python -m benchmarks.benchmark_dashboard_server --campaigns 20000 --companies 5000 --workers 1 2 4 --clients 8
+# serves a synthetic dataset with wsgi.py under gunicorn for each worker count and simulates analysts
+# selecting campaigns in the dropdown, each selection makes the four requests the browser makes
+# the simulated clients are threads of this process, so leave it a core when comparing worker counts
+
+list_filtration_dates = [None, '2017-12-31 23:59:59', '2010-06-30', '2005-01-01']
+
+
+def make_callback_body(output, output_property, list_inputs):
+    # the json the dash renderer posts to /_dash-update-component for one callback
+    return {
+        'output': f'{output}.{output_property}',
+        'outputs': {'id': output, 'property': output_property},
+        'inputs': [{'id': component_id, 'property': component_property, 'value': value} for component_id, component_property, value in list_inputs],
+        'changedPropIds': ['selected-campaign-id.value'],
+    }
+
+def make_selection_bodies(campaign_id, filtration_date):
+    list_inputs = [('selected-campaign-id', 'value', campaign_id), ('selected-filtration-date', 'date', filtration_date)]
+    return [
+        make_callback_body('campaign-table-container', 'children', list_inputs),
+        make_callback_body('activist-table-container', 'children', list_inputs),
+        make_callback_body('target-graph', 'figure', list_inputs[:1] + [('target-graph', 'relayoutData', None)] + list_inputs[1:]),
+        make_callback_body('return-prediction-container', 'children', list_inputs),
+    ]
+
+def post_json(url, body):
+    http_request = request.Request(url, data=json.dumps(body).encode(), headers={'Content-Type': 'application/json'})
+    with request.urlopen(http_request, timeout=120) as response:
+        response.read()
+
+def simulate_selection(url, campaign_id, filtration_date):
+    # seconds per request of one dropdown selection
+    list_seconds = []
+    for body in make_selection_bodies(campaign_id, filtration_date):
+        start_time = time.perf_counter()
+        post_json(url + '/_dash-update-component', body)
+        list_seconds.append(time.perf_counter() - start_time)
+    return list_seconds
+
+def wait_for_server(url, process, timeout=300):
+    start_time = time.perf_counter()
+    while time.perf_counter() - start_time < timeout:
+        if process.poll() is not None:
+            raise RuntimeError(f'server exited with code {process.returncode}')
+        try:
+            with request.urlopen(url + '/_dash-layout', timeout=5):
+                return
+        except OSError:
+            time.sleep(0.5)
+    raise TimeoutError(f'server at {url} did not start in {timeout} seconds')
+
+def load_test(directory, n_workers, campaign_ids, args):
+    url = f'http://127.0.0.1:{args.port}'
+    environment = dict(os.environ, PYTHONPATH=os.getcwd())
+    process = subprocess.Popen(
+        [
+            sys.executable, '-m', 'gunicorn', 'wsgi:server', '--config', os.path.join(os.getcwd(), 'gunicorn.conf.py'),
+            '--workers', str(n_workers), '--bind', f'127.0.0.1:{args.port}'
+        ],
+        cwd=directory, env=environment, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        wait_for_server(url, process)
+        rng = np.random.default_rng(0)
+        list_selections = [
+            (url, campaign_id, list_filtration_dates[i])
+            for campaign_id, i in zip(rng.choice(campaign_ids, args.selections), rng.integers(0, len(list_filtration_dates), args.selections))
+        ]
+        # warm up every worker before measuring
+        with futures.ThreadPoolExecutor(args.clients) as executor:
+            list(executor.map(lambda selection: simulate_selection(*selection), list_selections[:args.clients * 2]))
+
+        start_time = time.perf_counter()
+        with futures.ThreadPoolExecutor(args.clients) as executor:
+            list_seconds = np.concatenate(list(executor.map(lambda selection: simulate_selection(*selection), list_selections)))
+        total_seconds = time.perf_counter() - start_time
+    finally:
+        process.terminate()
+        process.wait()
+
+    return {
+        'workers': n_workers,
+        'requests': len(list_seconds),
+        'requests_per_second': len(list_seconds) / total_seconds,
+        'p50_ms': np.percentile(list_seconds, 50) * 1000,
+        'p99_ms': np.percentile(list_seconds, 99) * 1000,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test the dashboard under gunicorn with simulated campaign selections.')
+    parser.add_argument('--campaigns', type=int, default=20000)
+    parser.add_argument('--companies', type=int, default=5000)
+    parser.add_argument('--years', type=int, default=30)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--clients', type=int, default=8, help='concurrent simulated analysts')
+    parser.add_argument('--selections', type=int, default=500, help='campaign selections per worker count')
+    parser.add_argument('--port', type=int, default=8051)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        df_campaigns, df_factset_pricing, df_cumulative_successes = write_dashboard_files(
+            directory, n_campaigns=args.campaigns, n_companies=args.companies, n_years=args.years
+        )
+        write_dashboard_bundle(
+            df_campaigns, df_factset_pricing, df_cumulative_successes,
+            return_model_data_path=os.path.join(directory, 'results/campaign_return_model_data.csv'),
+            return_model_path=os.path.join(directory, 'results/campaign_return_model.joblib'),
+            bundle_directory=os.path.join(directory, dashboard_bundle_directory)
+        )
+        print(f'{len(df_campaigns)} campaigns, {len(df_factset_pricing)} pricing rows, {args.clients} clients')
+        campaign_ids = df_campaigns.campaign_id.unique()
+        del df_campaigns, df_factset_pricing, df_cumulative_successes
+
+        df_results = pd.DataFrame([load_test(directory, n_workers, campaign_ids, args) for n_workers in args.workers])
+    print(df_results.to_string(index=False, float_format=lambda value: f'{value:.1f}'))
+
+
+if __name__ == '__main__':
+    main()
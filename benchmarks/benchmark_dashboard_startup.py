@@ -0,0 +1,77 @@
+import argparse as argparse
+import os as os
+import subprocess as subprocess
+import sys as sys
+import tempfile as tempfile
+import pandas as pd
+
+from benchmarks.synthetic_data import write_dashboard_files
+from dashboard_data import dashboard_bundle_directory, write_dashboard_bundle
+
+# run from the repository root:
+# python -m benchmarks.benchmark_dashboard_startup --campaigns 20000 --companies 5000
+# each measurement runs in a fresh process inside a temporary folder laid out like the repository,
+# so nothing is cached in memory between them (the OS page cache is warm after the first run)
+
+# loads the dashboard data and answers the first callbacks, printing seconds and peak memory
+# (the peak is read from /proc on linux, ru_maxrss would include the memory of this process)
+dashboard_process_code = '''
+import time
+start_time = time.perf_counter()
+import app
+import_seconds = time.perf_counter() - start_time
+app.get_dashboard_data()
+load_seconds = time.perf_counter() - start_time - import_seconds
+campaign_id = app.get_dashboard_data()['campaigns'].campaign_id.iloc[0]
+app.update_campaign_table.__wrapped__(campaign_id, None)
+app.update_model_prediction.__wrapped__(campaign_id, None)
+callback_seconds = time.perf_counter() - start_time - import_seconds - load_seconds
+with open('/proc/self/status') as f:
+    peak_mb = [int(line.split()[1]) / 1024 for line in f if line.startswith('VmHWM')][0]
+print(import_seconds, load_seconds, callback_seconds, peak_mb)
+'''
+
+def time_dashboard_process(directory):
+    environment = dict(os.environ, PYTHONPATH=os.getcwd())
+    output = subprocess.run(
+        [sys.executable, '-c', dashboard_process_code],
+        cwd=directory, env=environment, capture_output=True, text=True, check=True
+    ).stdout
+    return [float(value) for value in output.split()[-4:]]
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare dashboard startup from the pipeline tables and from the prebuilt bundle.')
+    parser.add_argument('--campaigns', type=int, default=20000)
+    parser.add_argument('--companies', type=int, default=5000)
+    parser.add_argument('--years', type=int, default=30)
+    parser.add_argument('--repeats', type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        df_campaigns, df_factset_pricing, df_cumulative_successes = write_dashboard_files(
+            directory, n_campaigns=args.campaigns, n_companies=args.companies, n_years=args.years
+        )
+        print(f'{len(df_campaigns)} campaigns, {len(df_factset_pricing)} pricing rows')
+
+        list_results = []
+        for source in ['tables', 'bundle']:
+            if source == 'bundle':
+                write_dashboard_bundle(
+                    df_campaigns, df_factset_pricing, df_cumulative_successes,
+                    return_model_data_path=os.path.join(directory, 'results/campaign_return_model_data.csv'),
+                    return_model_path=os.path.join(directory, 'results/campaign_return_model.joblib'),
+                    bundle_directory=os.path.join(directory, dashboard_bundle_directory)
+                )
+            for repeat in range(args.repeats):
+                import_seconds, load_seconds, callback_seconds, peak_mb = time_dashboard_process(directory)
+                list_results.append({
+                    'source': source, 'repeat': repeat, 'import_seconds': import_seconds, 'load_seconds': load_seconds,
+                    'first_callbacks_seconds': callback_seconds, 'peak_rss_mb': peak_mb
+                })
+
+    df_results = pd.DataFrame(list_results).groupby('source', sort=False).median().drop(columns='repeat')
+    print(df_results.to_string(float_format=lambda value: f'{value:.3f}'))
+
+
+if __name__ == '__main__':
+    main()
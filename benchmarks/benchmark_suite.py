@@ -0,0 +1,163 @@
+import argparse as argparse
+import json as json
+import subprocess as subprocess
+import tempfile as tempfile
+import time as time
+import numpy as np
+import pandas as pd
+
+from benchmarks.synthetic_data import write_factset_files
+from dashboard_data import build_pricing_arrays, get_activist_past_successes, get_activist_rows, get_campaign_rows, get_campaign_value, get_company_chart_pricing, index_dashboard_data, search_campaigns
+from main import calculate_betas, calculate_cumulative_successes, clean_factset_campaign_data, clean_factset_pricing_data, clean_yahoo_finance_pricing_data, encode_mappings, engineer_features, read_factset_campaign_data, read_factset_pricing_data
+
+# run from the repository root:
+# python -m benchmarks.benchmark_suite --scales small medium --output benchmark_results.json
+# python -m benchmarks.benchmark_suite --scales small medium --compare benchmark_results.json
+# writes raw factset files for each scale (see write_factset_files) and times the pipeline's hot paths on
+# them in order, each benchmark gets the outputs of the ones before it, like the pipeline stages
+# every selected benchmark is repeated and its fastest and median times are reported, --compare prints
+# the change against the results of an earlier run, e.g. before a change to main.py
+
+dict_scales = {
+    'small': {'n_companies': 200, 'n_years': 10, 'campaigns_per_company': 1},
+    'medium': {'n_companies': 1000, 'n_years': 20, 'campaigns_per_company': 2},
+    'large': {'n_companies': 4000, 'n_years': 30, 'campaigns_per_company': 2},
+}
+
+# campaigns selected in the dashboard benchmark
+dashboard_selections = 200
+
+
+def time_read_campaign_workbook(dict_state):
+    return {'df_raw_campaign': read_factset_campaign_data(dict_state['file_paths']['campaign'], use_snapshot=False)}
+
+def time_clean_campaign(dict_state):
+    return {'df_campaign': clean_factset_campaign_data(dict_state['df_raw_campaign'])}
+
+def time_read_pricing(dict_state):
+    return {'df_raw_pricing': read_factset_pricing_data(dict_state['file_paths']['pricing'], company_ids=dict_state['df_campaign'].company_id)}
+
+def time_clean_pricing(dict_state):
+    return {
+        'df_pricing': clean_factset_pricing_data(dict_state['df_raw_pricing'], dict_state['df_campaign']),
+        'df_market_pricing': clean_yahoo_finance_pricing_data(pd.read_csv(dict_state['file_paths']['market_pricing'], parse_dates=['Date']))
+    }
+
+def time_betas(dict_state):
+    return {'df_betas': calculate_betas(dict_state['df_campaign'], dict_state['df_pricing'], dict_state['df_market_pricing'])}
+
+def time_engineer(dict_state):
+    df_engineered = engineer_features(dict_state['df_campaign'], dict_state['df_betas'])
+    return {'df_engineered': df_engineered, 'df_cumulative_successes': calculate_cumulative_successes(df_engineered)}
+
+def time_encode(dict_state):
+    return {'df_design_matrix': encode_mappings(dict_state['df_engineered'])[1]}
+
+def time_dashboard_index(dict_state):
+    df_engineered = dict_state['df_engineered']
+    return {'dict_dashboard_data': index_dashboard_data(
+        df_engineered,
+        build_pricing_arrays(dict_state['df_pricing'][['company_id', 'date', 'price']]),
+        dict_state['df_cumulative_successes'],
+        df_engineered[['campaign_id', 'beta', 'past_return_successes']]
+    )}
+
+def time_dashboard_callbacks(dict_state):
+    # what the dashboard callbacks look up for a campaign selected in the dropdown, for random campaigns
+    dict_data = dict_state['dict_dashboard_data']
+    rng = np.random.default_rng(0)
+    df_engineered = dict_state['df_engineered']
+    for campaign_id in rng.choice(df_engineered.campaign_id.unique(), dashboard_selections):
+        filtration_date = '2017-12-31 23:59:59'
+        get_campaign_rows(dict_data, campaign_id, as_of_date=filtration_date)
+        activist_id = get_campaign_value(dict_data, campaign_id, 'activist_id')
+        get_activist_rows(dict_data, activist_id, as_of_date=filtration_date)
+        get_activist_past_successes(dict_data, activist_id, as_of_date=filtration_date)
+        get_company_chart_pricing(dict_data, get_campaign_value(dict_data, campaign_id, 'company_id'), as_of_date=filtration_date)
+        search_campaigns(dict_data, str(get_campaign_value(dict_data, campaign_id, 'campaign_title'))[:6], as_of_date=filtration_date)
+    # a cleared dropdown and an unknown campaign have no rows rather than failing the callbacks
+    for campaign_id in [None, 'unknown campaign']:
+        assert get_campaign_rows(dict_data, campaign_id, as_of_date='2017-12-31 23:59:59').empty
+        assert get_campaign_value(dict_data, campaign_id, 'activist_id') is None
+    return {}
+
+list_benchmarks = [
+    ('read_campaign_workbook', time_read_campaign_workbook),
+    ('clean_campaign', time_clean_campaign),
+    ('read_pricing', time_read_pricing),
+    ('clean_pricing', time_clean_pricing),
+    ('betas', time_betas),
+    ('engineer', time_engineer),
+    ('encode', time_encode),
+    ('dashboard_index', time_dashboard_index),
+    ('dashboard_callbacks', time_dashboard_callbacks),
+]
+
+def run_scale(scale, list_benchmark_names, n_repeats):
+    with tempfile.TemporaryDirectory() as directory:
+        start_time = time.perf_counter()
+        dict_state = {'file_paths': write_factset_files(directory, **dict_scales[scale])}
+        print(f'{scale}: wrote synthetic factset files in {time.perf_counter() - start_time:.1f}s')
+
+        list_results = []
+        for name, function in list_benchmarks:
+            # benchmarks that are not selected still run once for the ones after them
+            list_seconds = []
+            for _ in range(n_repeats if name in list_benchmark_names else 1):
+                start_time = time.perf_counter()
+                dict_outputs = function(dict_state)
+                list_seconds.append(time.perf_counter() - start_time)
+            dict_state.update(dict_outputs)
+            if name in list_benchmark_names:
+                list_results.append({
+                    'scale': scale,
+                    'benchmark': name,
+                    'campaigns': len(dict_state['df_raw_campaign']),
+                    'pricing_rows': dict_scales[scale]['n_companies'] * int(dict_scales[scale]['n_years'] * 252),
+                    'repeats': n_repeats,
+                    'min_seconds': np.min(list_seconds),
+                    'median_seconds': np.median(list_seconds),
+                })
+                print(f'{scale} {name}: {np.min(list_seconds):.3f}s')
+    return list_results
+
+def get_git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main():
+    list_benchmark_names = [name for name, _ in list_benchmarks]
+    parser = argparse.ArgumentParser(description='Time the pipeline and dashboard hot paths on synthetic factset files of several sizes.')
+    parser.add_argument('--scales', nargs='+', choices=list(dict_scales), default=['small', 'medium'])
+    parser.add_argument('--benchmarks', nargs='+', choices=list_benchmark_names, default=list_benchmark_names)
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--output', help='write the results to this json file')
+    parser.add_argument('--compare', help='json file of an earlier run to compare the median times with')
+    args = parser.parse_args()
+
+    df_results = pd.DataFrame([
+        dict_result for scale in args.scales for dict_result in run_scale(scale, args.benchmarks, args.repeats)
+    ])
+    if args.compare:
+        with open(args.compare) as f:
+            df_previous = pd.DataFrame(json.load(f)['results'])
+        df_results = pd.merge(
+            df_results, df_previous[['scale', 'benchmark', 'median_seconds']].rename(columns={'median_seconds': 'previous_median_seconds'}),
+            how='left', on=['scale', 'benchmark']
+        ).assign(ratio=lambda df: df.median_seconds / df.previous_median_seconds)
+    print(df_results.to_string(index=False, float_format=lambda value: f'{value:.3f}'))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                'commit': get_git_commit(),
+                'run_at': pd.Timestamp('now').isoformat(),
+                'scales': {scale: dict_scales[scale] for scale in args.scales},
+                'results': df_results.to_dict('records'),
+            }, f, indent=2, default=str)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+import argparse as argparse
+import filecmp as filecmp
+import logging as logging
+import os as os
+import tempfile as tempfile
+import numpy as np
+import pandas as pd
+
+from benchmarks.synthetic_data import write_factset_files
+from main import clean_factset_campaign_data, clean_factset_pricing_data, clean_yahoo_finance_pricing_data, read_factset_campaign_data, read_factset_pricing_data, run_pipeline
+from table_store import read_table, write_table
+
+# run from the repository root:
+# python -m benchmarks.check_incremental --companies 200 --years 10
+# builds synthetic raw files, runs the betas, engineer and encode stages on an earlier version of the data
+# (with campaigns missing, tactics, results and prices changed), updates them incrementally to the current
+# data and checks every output is identical to a full rebuild on the current data
+
+# the tables the incremental stages write, and the ones downstream of them
+list_checked_tables = [
+    'data/factset_betas',
+    'data/engineered_factset_campaign',
+    'data/engineered_factset_campaign_state',
+    'data/engineered_cumulative_successes',
+    'data/encoded_factset_campaign',
+    'data/encoded_design_matrix',
+    'data/encoding_vocabularies',
+]
+
+list_checked_files = ['data/engineered_factset_campaign.csv']
+
+
+def make_clean_tables(dict_file_paths):
+    # cleaned like the clean stage, without the read stage's download of the market prices
+    df_factset_campaign = clean_factset_campaign_data(read_factset_campaign_data(dict_file_paths['campaign'], use_snapshot=False))
+    return {
+        'data/clean_factset_campaign': df_factset_campaign,
+        'data/clean_factset_pricing': clean_factset_pricing_data(
+            read_factset_pricing_data(dict_file_paths['pricing'], company_ids=df_factset_campaign.company_id),
+            df_factset_campaign
+        ),
+        'data/clean_yahoo_finance_pricing': clean_yahoo_finance_pricing_data(pd.read_csv(dict_file_paths['market_pricing'], parse_dates=['Date'])),
+    }
+
+def make_earlier_tables(dict_clean_tables, seed=0):
+    # an earlier version of the data: some campaigns not yet announced, others with different tactics and
+    # results, and one company with different prices
+    rng = np.random.default_rng(seed)
+    df_factset_campaign = dict_clean_tables['data/clean_factset_campaign']
+    campaign_ids = df_factset_campaign.campaign_id.unique()
+    removed_ids = rng.choice(campaign_ids, max(1, len(campaign_ids) // 10), replace=False)
+    changed_ids = rng.choice(np.setdiff1d(campaign_ids, removed_ids), max(1, len(campaign_ids) // 10), replace=False)
+    df_factset_campaign = (
+        df_factset_campaign
+        .loc[lambda df: ~df.campaign_id.isin(removed_ids)]
+        .assign(activist_campaign_tactic=lambda df: df.activist_campaign_tactic.mask(df.campaign_id.isin(changed_ids), 'Earlier Tactic'))
+        .assign(activist_campaign_results=lambda df: df.activist_campaign_results.mask(df.campaign_id.isin(changed_ids[::2]), None))
+    )
+
+    df_factset_pricing = dict_clean_tables['data/clean_factset_pricing']
+    company_id = df_factset_campaign.company_id.iloc[0]
+    df_factset_pricing = df_factset_pricing.assign(price=lambda df: df.price.mask(df.company_id == company_id, df.price * 1.1))
+
+    print(f'earlier data: {len(removed_ids)} campaigns removed, {len(changed_ids)} changed, prices of {company_id} changed')
+    return {
+        'data/clean_factset_campaign': df_factset_campaign,
+        'data/clean_factset_pricing': df_factset_pricing,
+        'data/clean_yahoo_finance_pricing': dict_clean_tables['data/clean_yahoo_finance_pricing'],
+    }
+
+def run_stages(dict_clean_tables, incremental):
+    for table_path, df in dict_clean_tables.items():
+        write_table(df, table_path)
+    run_pipeline(
+        force_stages=['betas', 'engineer', 'encode'],
+        skip_stages=['read', 'clean', 'bundle'],
+        dict_runtime_parameters={'betas': {'incremental': incremental}, 'engineer': {'incremental': incremental}}
+    )
+    return {table_path: read_table(table_path) for table_path in list_checked_tables + ['data/engineered_tactic_columns']}
+
+def main():
+    parser = argparse.ArgumentParser(description='Check incremental pipeline runs give the same outputs as full runs on synthetic data.')
+    parser.add_argument('--companies', type=int, default=200)
+    parser.add_argument('--years', type=int, default=10)
+    parser.add_argument('--campaigns-per-company', type=int, default=2)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+
+    working_directory = os.getcwd()
+    with tempfile.TemporaryDirectory() as directory:
+        dict_file_paths = write_factset_files(
+            directory, n_companies=args.companies, n_years=args.years,
+            campaigns_per_company=args.campaigns_per_company, seed=args.seed
+        )
+        dict_clean_tables = make_clean_tables(dict_file_paths)
+        dict_earlier_tables = make_earlier_tables(dict_clean_tables, seed=args.seed)
+
+        # the stages read and write relative to the repository layout written into directory
+        os.chdir(directory)
+        try:
+            run_stages(dict_earlier_tables, incremental=False)
+            dict_incremental = run_stages(dict_clean_tables, incremental=True)
+            for file_path in list_checked_files:
+                os.replace(file_path, file_path + '.incremental')
+            dict_full = run_stages(dict_clean_tables, incremental=False)
+
+            for table_path in list_checked_tables:
+                pd.testing.assert_frame_equal(dict_incremental[table_path], dict_full[table_path], check_exact=True)
+                print(f'{table_path}: {len(dict_full[table_path])} rows identical')
+            for file_path in list_checked_files:
+                assert filecmp.cmp(file_path + '.incremental', file_path, shallow=False), f'{file_path} differs'
+                print(f'{file_path}: identical')
+            # the known tactics are every tactic seen so far, a rebuild only knows the current ones
+            df_missing_tactics = dict_full['data/engineered_tactic_columns'].merge(dict_incremental['data/engineered_tactic_columns'], how='left', indicator=True).loc[lambda df: df._merge == 'left_only']
+            assert df_missing_tactics.empty, f'incremental tactics are missing {df_missing_tactics.activist_campaign_tactic.tolist()}'
+        finally:
+            os.chdir(working_directory)
+
+    print('incremental and full runs are identical')
+
+
+if __name__ == '__main__':
+    main()
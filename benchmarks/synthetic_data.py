@@ -0,0 +1,281 @@
+import os as os
+import shutil as shutil
+import numpy as np
+import pandas as pd
+
+from joblib import dump
+from sklearn.linear_model import LogisticRegression
+from main import clean_column_name, dict_manual_renamings, dict_mapping_tables, list_column_order, list_drop_columns, read_mapping_tables
+from table_store import write_table
+
+# synthetic stand-ins for the raw and cleaned tables, so performance can be measured without the licensed data
+
+
+def make_market_pricing(start_date='1990-01-01', n_years=30, seed=0):
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range(start_date, periods=int(n_years * 252))
+    sp_daily_return = rng.normal(0.0003, 0.01, len(dates))
+    df_yahoo_finance_pricing = pd.DataFrame({
+        'date': dates,
+        'price': 100 * np.cumprod(1 + sp_daily_return),
+        'sp_daily_return': sp_daily_return,
+    })
+    df_yahoo_finance_pricing.loc[0, 'sp_daily_return'] = np.nan
+    return df_yahoo_finance_pricing
+
+def make_company_pricing(df_yahoo_finance_pricing, n_companies=10000, seed=0):
+    # every company trades on every market date, with a random beta and idiosyncratic noise
+    rng = np.random.default_rng(seed + 1)
+    n_dates = len(df_yahoo_finance_pricing)
+    company_codes = np.repeat(np.arange(n_companies, dtype='int32'), n_dates)
+    betas = rng.uniform(0.2, 1.8, n_companies)
+
+    market_return = np.nan_to_num(df_yahoo_finance_pricing.sp_daily_return.values)
+    stock_daily_return = (
+        np.repeat(betas, n_dates) * np.tile(market_return, n_companies) +
+        rng.normal(0, 0.02, n_companies * n_dates)
+    ).clip(-0.50, 0.50)
+    stock_daily_return[np.arange(0, n_companies * n_dates, n_dates)] = np.nan
+
+    df_factset_pricing = pd.DataFrame({
+        'company_id': pd.Categorical.from_codes(company_codes, categories=[f'{i:06d}-E' for i in range(n_companies)]),
+        'date': np.tile(df_yahoo_finance_pricing.date.values, n_companies),
+        'price': (50 * np.exp(np.log1p(np.nan_to_num(stock_daily_return)).reshape(n_companies, n_dates).cumsum(axis=1))).ravel().astype('float32'),
+        'stock_daily_return': stock_daily_return,
+    })
+    return df_factset_pricing
+
+def make_campaign_windows(df_factset_pricing, campaigns_per_company=1, seed=0):
+    # campaigns announced at random dates at least 18 months inside each company's history
+    rng = np.random.default_rng(seed + 2)
+    company_ids = df_factset_pricing.company_id.unique()
+    first_date, last_date = df_factset_pricing.date.min(), df_factset_pricing.date.max()
+    n_campaigns = len(company_ids) * campaigns_per_company
+
+    announcement_dates = first_date + pd.DateOffset(months=18) + pd.to_timedelta(
+        rng.uniform(0, 1, n_campaigns) * ((last_date - pd.DateOffset(months=18)) - (first_date + pd.DateOffset(months=18))).days,
+        unit='D'
+    ).floor('D')
+
+    df_factset_campaign = pd.DataFrame({
+        'campaign_id': [f'{i:010d}C' for i in range(n_campaigns)],
+        'company_id': np.repeat(np.asarray(company_ids), campaigns_per_company),
+        'campaign_announcement_date': announcement_dates,
+    })
+    for column, months in [('pre_18m', -18), ('pre_12m', -12), ('pre_6m', -6), ('pre_3m', -3), ('post_6m', 6), ('post_12m', 12), ('post_18m', 18)]:
+        df_factset_campaign[f'{column}_announcement_date'] = df_factset_campaign.campaign_announcement_date + pd.DateOffset(months=months)
+    return df_factset_campaign
+
+def make_campaign_names(n_campaigns=20000, n_activists=2000, seed=0):
+    # campaign, company and activist names like '<company> / <activist>' titles in factset
+    rng = np.random.default_rng(seed + 3)
+    list_words = ['capital', 'partners', 'holdings', 'global', 'value', 'management', 'group', 'investors', 'energy', 'pharma', 'systems', 'bank', 'retail', 'media', 'technologies', 'industries']
+    def make_names(prefix, n):
+        return [f'{prefix}{i} {list_words[i % len(list_words)].title()} {list_words[(i // len(list_words)) % len(list_words)].title()}' for i in range(n)]
+    company_names = np.array(make_names('Company', n_campaigns // 2 + 1))
+    activist_names = np.array(make_names('Activist', n_activists))
+    companies = rng.integers(0, len(company_names), n_campaigns)
+    activists = rng.integers(0, n_activists, n_campaigns)
+    df_campaign_names = pd.DataFrame({
+        'campaign_id': [f'{i:010d}C' for i in range(n_campaigns)],
+        'campaign_announcement_date': pd.Timestamp('1995-01-01') + pd.to_timedelta(rng.integers(0, 9000, n_campaigns), unit='D'),
+        'activist_id': [f'{i:07d}P' for i in activists],
+        'activist_name': activist_names[activists],
+        'company_name': company_names[companies],
+    })
+    df_campaign_names['campaign_title'] = df_campaign_names.company_name + ' / ' + df_campaign_names.activist_name
+    return df_campaign_names
+
+def make_dashboard_tables(n_campaigns=20000, n_companies=5000, n_years=30, seed=0):
+    # the tables the dashboard reads: engineered campaigns, clean pricing, cumulative successes
+    # and the campaign return model data, campaigns are spread over the priced companies
+    rng = np.random.default_rng(seed + 4)
+    df_yahoo_finance_pricing = make_market_pricing(start_date='1990-01-01', n_years=n_years, seed=seed)
+    df_factset_pricing = make_company_pricing(df_yahoo_finance_pricing, n_companies=n_companies, seed=seed)[['company_id', 'date', 'price']]
+
+    df_campaigns = make_campaign_names(n_campaigns=n_campaigns, seed=seed).assign(
+        company_id=lambda df: np.asarray(df_factset_pricing.company_id.cat.categories)[rng.integers(0, n_companies, len(df))],
+        campaign_objective_primary=lambda df: rng.choice(['Board Seats', 'Maximize Shareholder Value', 'Vote For A Stockholder Proposal'], len(df)),
+        value_demand=lambda df: rng.integers(0, 2, len(df)),
+        governance_demand=lambda df: rng.integers(0, 2, len(df)),
+        activist_campaign_tactic=lambda df: rng.choice(['Letter to Board', 'Proxy Fight', 'Public Campaign'], len(df)),
+        ownership_pecent_on_announcement=lambda df: rng.uniform(0, 20, len(df)).round(2),
+        pre_6m_price_return=lambda df: rng.normal(0, 0.2, len(df)),
+    ).sort_values(['activist_id', 'campaign_announcement_date', 'campaign_id']).reset_index(drop=True)
+
+    df_cumulative_successes = df_campaigns.assign(
+        lagged_campaign_announcement_date=lambda df: df.campaign_announcement_date + pd.DateOffset(years=1),
+        past_return_successes=lambda df: (df.pre_6m_price_return > 0).groupby(df.activist_id).cumsum().astype(float),
+    )[['activist_id', 'lagged_campaign_announcement_date', 'past_return_successes']]
+
+    df_campaign_return_model_data = df_campaigns[['campaign_id', 'pre_6m_price_return', 'ownership_pecent_on_announcement', 'value_demand']]
+
+    return df_campaigns, df_factset_pricing, df_cumulative_successes, df_campaign_return_model_data
+
+def write_dashboard_files(directory, n_campaigns=20000, n_companies=5000, n_years=30, seed=0):
+    # writes the dashboard tables and a small campaign return model into directory, laid out like the repository
+    df_campaigns, df_factset_pricing, df_cumulative_successes, df_campaign_return_model_data = make_dashboard_tables(
+        n_campaigns=n_campaigns, n_companies=n_companies, n_years=n_years, seed=seed
+    )
+    os.makedirs(os.path.join(directory, 'data'))
+    os.makedirs(os.path.join(directory, 'results'))
+    write_table(df_campaigns, os.path.join(directory, 'data/engineered_factset_campaign'), export_csv=True)
+    write_table(df_factset_pricing, os.path.join(directory, 'data/clean_factset_pricing'))
+    write_table(df_cumulative_successes, os.path.join(directory, 'data/engineered_cumulative_successes'))
+    df_campaign_return_model_data.to_csv(os.path.join(directory, 'results/campaign_return_model_data.csv'), index=False)
+    dump(
+        LogisticRegression().fit(df_campaign_return_model_data.iloc[:, 1:], df_campaign_return_model_data.pre_6m_price_return > 0),
+        os.path.join(directory, 'results/campaign_return_model.joblib')
+    )
+    return df_campaigns, df_factset_pricing, df_cumulative_successes
+
+# raw factset files
+# the campaign workbook has the raw column headers, inverting dict_manual_renamings and clean_column_name,
+# so the pipeline reads, renames and cleans it like the real one
+
+dict_raw_header_replacements = {
+    'pre_18m': '18_months_pre',
+    'pre_12m': '1_year_pre',
+    'pre_6m': '6_months_pre',
+    'pre_3m': '90_days_pre',
+    'post_18m': '18_months_post',
+    'post_12m': '1_year_post',
+    'post_6m': '6_months_post',
+    'pecent': '%',
+    '_or_': '/',
+}
+
+dict_raw_manual_renamings = {column_name: raw_column_name for raw_column_name, column_name in dict_manual_renamings.items()}
+
+def get_raw_column_name(column_name):
+    # e.g. 'pre_18m_stock_price' -> '18 Months Pre Stock Price', 'ownership_pecent_on_announcement' -> 'Ownership % On Announcement'
+    raw_column_name = dict_raw_manual_renamings.get(column_name, column_name)
+    for clean_part, raw_part in dict_raw_header_replacements.items():
+        raw_column_name = raw_column_name.replace(clean_part, raw_part)
+    raw_column_name = raw_column_name.replace('_', ' ').title()
+    if dict_manual_renamings.get(clean_column_name(raw_column_name), clean_column_name(raw_column_name)) != column_name:
+        raise ValueError(f'no raw header found for {column_name}, got {raw_column_name}')
+    return raw_column_name
+
+def take_company_prices(df_factset_pricing, company_codes, dates):
+    # price of each company on the last trading date up to each date, every company has the same dates
+    pricing_dates = df_factset_pricing.date.values[:df_factset_pricing.company_id.cat.codes.eq(0).sum()]
+    date_positions = np.maximum(np.searchsorted(pricing_dates, np.asarray(dates, dtype='datetime64[ns]'), side='right') - 1, 0)
+    return df_factset_pricing.price.values[company_codes * len(pricing_dates) + date_positions].astype(float)
+
+def make_factset_campaign_workbook(df_factset_pricing, campaigns_per_company=1, n_activists=None, missing_share=0.05, seed=0):
+    # the rows of the raw campaign workbook with its headers, one campaign row per activist of the campaign
+    # mapped columns take values of the mapping tables, missing values are written like factset does ('-', 'n.a.')
+    rng = np.random.default_rng(seed + 5)
+    df_campaign = make_campaign_windows(df_factset_pricing, campaigns_per_company=campaigns_per_company, seed=seed)
+    n_campaigns = len(df_campaign)
+    n_activists = n_activists or max(n_campaigns // 3, 1)
+    company_codes = pd.Categorical(df_campaign.company_id, categories=df_factset_pricing.company_id.cat.categories).codes
+    dict_mapping_frames = read_mapping_tables()
+
+    def choose(values, n=n_campaigns, missing=0.1):
+        chosen = rng.choice(np.asarray(values, dtype=object), n)
+        chosen[rng.random(n) < missing] = None
+        return chosen
+
+    def choose_mapped(name, missing=0.1):
+        return choose(dict_mapping_frames[name][dict_mapping_tables[name]['column']].dropna().unique(), missing=missing)
+
+    activist_codes = rng.integers(0, n_activists, n_campaigns)
+    company_names = np.array([f'Company {i} Inc' for i in range(len(df_factset_pricing.company_id.cat.categories))], dtype=object)
+    activist_names = np.array([f'Activist {i} Capital' for i in range(n_activists)], dtype=object)
+    list_tactics = dict_mapping_frames['tactic'][dict_mapping_tables['tactic']['column']].dropna().unique()
+    board_seats = rng.integers(5, 16, n_campaigns).astype(float)
+    board_seats_sought = np.where(rng.random(n_campaigns) < 0.4, rng.integers(1, 4, n_campaigns), np.nan)
+    price_at_announcement = take_company_prices(df_factset_pricing, company_codes, df_campaign.campaign_announcement_date)
+
+    df = df_campaign.assign(
+        announcement_date_date=lambda df: df.campaign_announcement_date,
+        campaign_title=company_names[company_codes] + ' / ' + activist_names[activist_codes],
+        campaign_objective_primary=choose_mapped('campaign_objective', missing=0.02),
+        value_demand=choose_mapped('value_demand', missing=0.5),
+        governance_demand=choose_mapped('governance_demand', missing=0.5),
+        activist_campaign_tactic=[', '.join(rng.choice(list_tactics, rng.integers(1, 4), replace=False)) for _ in range(n_campaigns)],
+        total_number_of_board_seats=board_seats,
+        number_of_board_seats_sought=board_seats_sought,
+        short_or_majority_or_full_slate=choose(['Short Slate', 'Majority Slate', 'Full Slate'], missing=0.6),
+        proxy_proposal=choose(['Yes', 'No'], missing=0.5),
+        glass_lewis_support=choose(['Management', 'Dissident'], missing=0.7),
+        iss_support=choose(['Management', 'Dissident'], missing=0.7),
+        activist_id=[f'{i:07d}P' for i in activist_codes],
+        activist_name=activist_names[activist_codes],
+        activist_group=activist_names[activist_codes],
+        first_trade_date=lambda df: df.campaign_announcement_date - pd.to_timedelta(rng.integers(0, 720, n_campaigns), unit='D'),
+        last_trade_date=lambda df: (df.campaign_announcement_date + pd.to_timedelta(rng.integers(30, 1500, n_campaigns), unit='D')).where(rng.random(n_campaigns) < 0.7),
+        ownership_pecent_on_announcement=rng.uniform(0, 0.25, n_campaigns).round(4),
+        company_name=company_names[company_codes],
+        sector=choose(['Technology', 'Healthcare', 'Financials', 'Energy', 'Consumer', 'Industrials'], missing=0.02),
+        price_at_announcement=price_at_announcement,
+        ltm_eps_at_announcement=rng.normal(2, 3, n_campaigns).round(2),
+        earnings_yield_at_announcement=lambda df: df.ltm_eps_at_announcement / df.price_at_announcement,
+        current_entity_status=choose(['Active', 'Acquired', 'Private', 'Bankrupt'], missing=0.05),
+        current_entity_detail=choose(['Listed', 'Merged', 'Delisted'], missing=0.3),
+        public_before_or_after_campaign_announcement=choose(['Before', 'After'], missing=0.1),
+        poison_pill_in_force_prior_to_announcement=choose(['Yes', 'No'], missing=0.3),
+        poison_pill_adopted_in_response_to_campaign=choose(['Yes', 'No'], missing=0.3),
+        number_of_board_seats_gained=np.where(np.isnan(board_seats_sought), np.nan, np.floor(rng.uniform(0, 1, n_campaigns) * (np.nan_to_num(board_seats_sought) + 1))),
+        proxy_campaign_winner_or_result=choose_mapped('proxy_result', missing=0.6),
+        activist_campaign_results=choose(['Successful', 'Partially Successful', 'Unsuccessful', 'Pending'], missing=0.2),
+    )
+    for window in ['pre_18m', 'pre_12m', 'pre_6m', 'pre_3m', 'post_6m', 'post_12m', 'post_18m']:
+        window_price = take_company_prices(df_factset_pricing, company_codes, df[f'{window}_announcement_date'])
+        price_return = window_price / price_at_announcement - 1 if window.startswith('post') else price_at_announcement / window_price - 1
+        dividends = rng.uniform(0, 0.02, n_campaigns).round(4) * window_price
+        df[f'{window}_stock_price'] = window_price.round(2)
+        df[f'{window}_price_to_earnings'] = (window_price / df.ltm_eps_at_announcement.values).round(2)
+        df[f'{window}_dividends'] = dividends.round(2)
+        df[f'{window}_price_return'] = price_return
+        df[f'{window}_total_return'] = price_return + dividends / window_price
+
+    # a campaign with several activists has a row for each
+    df_other_activists = df.sample(frac=0.05, random_state=seed)
+    other_activist_codes = rng.integers(0, n_activists, len(df_other_activists))
+    df = pd.concat([df, df_other_activists.assign(
+        activist_id=[f'{i:07d}P' for i in other_activist_codes],
+        activist_name=activist_names[other_activist_codes],
+        activist_group=activist_names[other_activist_codes]
+    )], ignore_index=True).sort_values(['campaign_announcement_date', 'campaign_id'], kind='stable')
+
+    # factset writes missing numbers as dashes and n.a.
+    list_columns = [column for column in list_column_order + list_drop_columns if column in df.columns]
+    for column in list_columns:
+        if pd.api.types.is_float_dtype(df[column]):
+            is_missing = df[column].isnull() | (rng.random(len(df)) < missing_share)
+            df[column] = df[column].astype(object).where(~is_missing, rng.choice(['-', 'n.a.'], len(df)))
+    return df[list_columns].rename(columns=get_raw_column_name).reset_index(drop=True)
+
+def write_factset_files(directory, n_companies=1000, n_years=20, campaigns_per_company=1, seed=0):
+    # writes the raw inputs of the pipeline into directory, laid out like the repository: the campaign
+    # workbook, the pricing text file, the backup market prices and a copy of the mapping tables
+    df_yahoo_finance_pricing = make_market_pricing(start_date='1990-01-01', n_years=n_years, seed=seed)
+    df_factset_pricing = make_company_pricing(df_yahoo_finance_pricing, n_companies=n_companies, seed=seed)
+    df_factset_campaign = make_factset_campaign_workbook(df_factset_pricing, campaigns_per_company=campaigns_per_company, seed=seed)
+
+    os.makedirs(os.path.join(directory, 'data'), exist_ok=True)
+    shutil.copytree('mapping', os.path.join(directory, 'mapping'), dirs_exist_ok=True)
+    dict_file_paths = {
+        'campaign': os.path.join(directory, 'data/factset_campaign_v9.xlsx'),
+        'pricing': os.path.join(directory, 'data/factset_pricing.txt'),
+        'market_pricing': os.path.join(directory, 'data/yahoo_finance_pricing_backup.csv'),
+    }
+    # the workbook's headers are on its third row
+    df_factset_campaign.to_excel(dict_file_paths['campaign'], startrow=2, index=False)
+    (
+        df_factset_pricing
+        .assign(FGVolume=np.random.default_rng(seed + 6).integers(0, 10000000, len(df_factset_pricing)))
+        .rename(columns={'company_id': 'FactSetID', 'date': 'FSDate', 'price': 'FGPRICE'})
+        .loc[:, ['FactSetID', 'FSDate', 'FGPRICE', 'FGVolume']]
+        .to_csv(dict_file_paths['pricing'], index=False, date_format='%Y-%m-%d')
+    )
+    (
+        df_yahoo_finance_pricing
+        .rename(columns={'date': 'Date', 'price': 'Adj Close'})
+        .loc[:, ['Date', 'Adj Close']]
+        .to_csv(dict_file_paths['market_pricing'], index=False)
+    )
+    return dict_file_paths
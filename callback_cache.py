@@ -0,0 +1,107 @@
+import collections as collections
+import functools as functools
+import hashlib as hashlib
+import logging as logging
+import os as os
+import pickle as pickle
+import shutil as shutil
+import threading as threading
+
+logger = logging.getLogger(__name__)
+
+# memoized dashboard callbacks
+# results are cached by the data version and the arguments, in a bounded in-process LRU cache per
+# function and optionally in a cache directory shared by every worker process and kept across restarts
+# results cached for one data version are never returned for another, and the cache directory only
+# keeps the current version's files
+
+callback_cache_size = 1024
+
+# hit and miss counters by function name, for this process
+dict_cache_stats = {}
+cache_stats_lock = threading.Lock()
+
+
+def get_cache_file_path(cache_directory, version, name, args):
+    args_hash = hashlib.sha256(repr(args).encode()).hexdigest()
+    return os.path.join(cache_directory, str(version), name, args_hash + '.pkl')
+
+@functools.lru_cache(maxsize=None)
+def remove_stale_versions(cache_directory, version):
+    # once per version and process, before its first file is written
+    if not os.path.isdir(cache_directory):
+        return
+    for directory_name in os.listdir(cache_directory):
+        if directory_name != str(version):
+            logger.info(f'removing stale callback cache {directory_name}')
+            shutil.rmtree(os.path.join(cache_directory, directory_name), ignore_errors=True)
+
+def read_cache_file(file_path):
+    try:
+        with open(file_path, 'rb') as f:
+            return True, pickle.load(f)
+    except (OSError, EOFError, pickle.UnpicklingError):
+        return False, None
+
+def write_cache_file(file_path, result):
+    # written to a temporary file first so other processes never read a partial file
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    temporary_file_path = f'{file_path}.{os.getpid()}.tmp'
+    with open(temporary_file_path, 'wb') as f:
+        pickle.dump(result, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(temporary_file_path, file_path)
+
+def memoize_callback(get_version, cache_size=callback_cache_size, cache_directory=None):
+    # get_version returns the current data version, arguments must be hashable and have a stable repr
+    def decorator(function):
+        name = function.__name__
+        dict_stats = dict_cache_stats.setdefault(name, {'memory_hits': 0, 'file_hits': 0, 'misses': 0, 'size': 0})
+        dict_cache = collections.OrderedDict()
+
+        def count(counter):
+            with cache_stats_lock:
+                dict_stats[counter] += 1
+
+        @functools.wraps(function)
+        def memoized_function(*args):
+            version = get_version()
+            key = (version,) + args
+            with cache_stats_lock:
+                if key in dict_cache:
+                    dict_cache.move_to_end(key)
+                    dict_stats['memory_hits'] += 1
+                    return dict_cache[key]
+
+            file_path = get_cache_file_path(cache_directory, version, name, args) if cache_directory else None
+            is_cached, result = read_cache_file(file_path) if file_path else (False, None)
+            if is_cached:
+                count('file_hits')
+            else:
+                count('misses')
+                result = function(*args)
+                if file_path:
+                    remove_stale_versions(cache_directory, version)
+                    write_cache_file(file_path, result)
+
+            with cache_stats_lock:
+                dict_cache[key] = result
+                while len(dict_cache) > cache_size:
+                    dict_cache.popitem(last=False)
+                dict_stats['size'] = len(dict_cache)
+            return result
+
+        def cache_clear():
+            with cache_stats_lock:
+                dict_cache.clear()
+                dict_stats.update({'memory_hits': 0, 'file_hits': 0, 'misses': 0, 'size': 0})
+
+        memoized_function.cache_clear = cache_clear
+        return memoized_function
+    return decorator
+
+def get_cache_stats():
+    with cache_stats_lock:
+        return {
+            name: {**dict_stats, 'hit_rate': (dict_stats['memory_hits'] + dict_stats['file_hits']) / max(dict_stats['memory_hits'] + dict_stats['file_hits'] + dict_stats['misses'], 1)}
+            for name, dict_stats in dict_cache_stats.items()
+        }
@@ -0,0 +1,366 @@
+import bisect as bisect
+import functools as functools
+import hashlib as hashlib
+import json as json
+import logging as logging
+import os as os
+import re as re
+import shutil as shutil
+import numpy as np
+import pandas as pd
+
+from table_store import find_table_file_path, hash_file, read_table, table_exists, write_table
+
+logger = logging.getLogger(__name__)
+
+# data access for the dashboard callbacks
+# the tables are indexed once at startup so a selection never scans a whole table:
+# campaign_id and activist_id map to the positions of their rows, and company_id maps to the
+# (offset, length) of its rows in pricing sorted by company and date
+# a lookup then costs the rows it returns, however large the tables grow
+
+
+def build_row_index(sr_keys):
+    # key -> array of row positions, in table order
+    return pd.Series(sr_keys.values).groupby(sr_keys.values, sort=False).indices
+
+def build_slice_index(sr_keys):
+    # key -> (offset, length) of its rows, the keys must be sorted so each key's rows are contiguous
+    codes, keys = pd.factorize(sr_keys, sort=False)
+    offsets = np.flatnonzero(np.diff(codes, prepend=-2) != 0)
+    lengths = np.diff(np.append(offsets, len(codes)))
+    return {
+        keys[code]: (offset, length)
+        for code, offset, length in zip(codes[offsets], offsets, lengths)
+        if code >= 0
+    }
+
+def get_date_keys(sr_dates):
+    # dates as int64 for binary search, missing dates sort last so they are never as of any date
+    date_keys = sr_dates.values.astype('datetime64[ns]').view('int64').copy()
+    date_keys[np.isnat(sr_dates.values.astype('datetime64[ns]'))] = np.iinfo('int64').max
+    return date_keys
+
+def get_as_of_key(as_of_date):
+    return pd.Timestamp(as_of_date).value if as_of_date is not None else np.iinfo('int64').max
+
+def build_dated_slice_index(sr_keys, sr_dates):
+    # rows sorted by key and then date, with each key's (offset, length) in that order
+    # a key's rows as of a date are then the first searchsorted(dates, as_of_date) rows of its slice
+    codes, _ = pd.factorize(sr_keys, sort=True)
+    date_keys = get_date_keys(sr_dates)
+    order = np.lexsort((date_keys, codes))
+    return {
+        'order': order,
+        'date_keys': date_keys[order],
+        'slices': build_slice_index(sr_keys.iloc[order]),
+    }
+
+def get_dated_slice(dict_index, key, as_of_date=None):
+    # positions of the key's rows dated on or before as_of_date, in date order
+    offset, length = dict_index['slices'].get(key, (0, 0))
+    if as_of_date is not None:
+        length = np.searchsorted(dict_index['date_keys'][offset:offset + length], get_as_of_key(as_of_date), side='right')
+    return dict_index['order'][offset:offset + length]
+
+def sort_pricing(df_pricing):
+    return df_pricing.sort_values(['company_id', 'date'], kind='mergesort').reset_index(drop=True)
+
+# price charts are downsampled to at most max_points points
+# for every bucket size the lowest and highest price of each bucket of a company's rows are kept,
+# which keeps the visual extremes, and a chart uses the finest bucket size that fits its date range
+# ranges with at most max_points rows are shown at full resolution
+list_chart_bucket_sizes = [4, 16, 64, 256]
+chart_max_points = 1000
+
+def get_bucket_extreme_positions(sr_keys, values, bucket_size):
+    # positions of the min and max of values in buckets of bucket_size rows, buckets do not cross keys
+    # rows must be sorted by key, missing values are never picked
+    codes, _ = pd.factorize(sr_keys, sort=False)
+    rows = np.arange(len(codes))
+    key_starts = np.maximum.accumulate(np.where(np.diff(codes, prepend=-2) != 0, rows, 0))
+    is_bucket_start = (rows - key_starts) % bucket_size == 0
+    bucket_starts = np.flatnonzero(is_bucket_start)
+    if len(bucket_starts) == 0:
+        return rows
+    bucket_lengths = np.diff(np.append(bucket_starts, len(codes)))
+    buckets = np.cumsum(is_bucket_start) - 1
+
+    is_missing = np.isnan(values)
+    list_positions = []
+    for fill_value, reduce in [(np.inf, np.minimum), (-np.inf, np.maximum)]:
+        filled = np.where(is_missing, fill_value, values)
+        is_extreme = (filled == np.repeat(reduce.reduceat(filled, bucket_starts), bucket_lengths)) & ~is_missing
+        candidates = np.flatnonzero(is_extreme)
+        # first extreme row of every bucket
+        list_positions.append(candidates[np.diff(buckets[candidates], prepend=-1) != 0])
+    return np.union1d(*list_positions)
+
+def build_chart_levels(df_pricing):
+    logger.info(f'downsampling pricing with bucket sizes {list_chart_bucket_sizes}')
+    values = df_pricing.price.to_numpy(dtype=float)
+    return {
+        bucket_size: get_bucket_extreme_positions(df_pricing.company_id, values, bucket_size)
+        for bucket_size in list_chart_bucket_sizes
+    }
+
+# the campaign dropdown searches as you type instead of listing every campaign up front
+# campaign_title, company_name, activist_name and campaign_id are split into lowercase tokens kept in
+# one sorted list, so the campaigns with a token starting with a typed word are a bisected range
+# every typed word has to match, results are the most recent campaigns first
+campaign_search_limit = 50
+campaign_search_columns = ['campaign_title', 'company_name', 'activist_name', 'campaign_id']
+campaign_search_token_pattern = r'[a-z0-9]+'
+
+def build_campaign_search_index(df_campaigns):
+    df_options = (
+        df_campaigns
+        .drop_duplicates('campaign_id')
+        .sort_values('campaign_announcement_date', ascending=False, kind='mergesort')
+        .reset_index(drop=True)
+    )
+    df_tokens = (
+        pd.concat([df_options[column].astype(str) for column in campaign_search_columns])
+        .str.lower()
+        .str.findall(campaign_search_token_pattern)
+        .explode()
+        .dropna()
+        .rename('token')
+        .rename_axis('option')
+        .reset_index()
+        .drop_duplicates()
+        .sort_values(['token', 'option'])
+    )
+    return {
+        'values': df_options.campaign_id.tolist(),
+        'labels': (df_options.campaign_title.astype(str) + ' (' + df_options.campaign_id.astype(str) + ')').tolist(),
+        'option_positions': {campaign_id: position for position, campaign_id in enumerate(df_options.campaign_id)},
+        'date_keys': get_date_keys(df_options.campaign_announcement_date),
+        'tokens': df_tokens.token.tolist(),
+        'token_options': df_tokens.option.to_numpy(),
+    }
+
+def get_campaign_options(dict_data, campaign_ids):
+    dict_index = dict_data['campaign_search']
+    return [
+        {'label': dict_index['labels'][position], 'value': dict_index['values'][position]}
+        for position in (dict_index['option_positions'].get(campaign_id) for campaign_id in campaign_ids)
+        if position is not None
+    ]
+
+def search_campaigns(dict_data, query, limit=campaign_search_limit, as_of_date=None):
+    # dropdown options of the top limit campaigns matching every word of query by prefix,
+    # announced on or before as_of_date when given
+    dict_index = dict_data['campaign_search']
+    options = None
+    for word in re.findall(campaign_search_token_pattern, str(query).lower()):
+        left = bisect.bisect_left(dict_index['tokens'], word)
+        right = bisect.bisect_left(dict_index['tokens'], word + '\uffff')
+        word_options = np.unique(dict_index['token_options'][left:right])
+        options = word_options if options is None else np.intersect1d(options, word_options, assume_unique=True)
+    if options is None:
+        return []
+    if as_of_date is not None:
+        options = options[dict_index['date_keys'][options] <= get_as_of_key(as_of_date)]
+    return get_campaign_options(dict_data, [dict_index['values'][position] for position in options[:limit]])
+
+# everything can be looked up as of a filtration date, using only information available by then:
+# campaigns announced on or before it, prices up to it and past successes known by then
+# (a campaign's success is only counted a year after its announcement, see main.calculate_cumulative_successes)
+# rows are kept in date order per key so an as of lookup is a binary search within the key's rows
+
+def build_pricing_arrays(df_pricing):
+    # pricing is kept as arrays sorted by company and date rather than a frame, so it can be
+    # memory-mapped from the bundle, and each company is an (offset, length) slice of them
+    df_pricing = sort_pricing(df_pricing)
+    return {
+        'pricing_dates': df_pricing.date.values.astype('datetime64[ns]'),
+        'pricing_prices': df_pricing.price.values,
+        'company_pricing_slices': build_slice_index(df_pricing.company_id),
+        'chart_levels': build_chart_levels(df_pricing),
+    }
+
+def index_dashboard_data(df_campaigns, dict_pricing, df_cumulative_successes, df_return_model_data, version=None):
+    return {
+        'version': version,
+        'campaigns': df_campaigns,
+        'return_model_data': df_return_model_data,
+        'campaign_rows': build_row_index(df_campaigns.campaign_id),
+        'activist_rows': build_dated_slice_index(df_campaigns.activist_id, df_campaigns.campaign_announcement_date),
+        'cumulative_successes': df_cumulative_successes,
+        'activist_successes': build_dated_slice_index(df_cumulative_successes.activist_id, df_cumulative_successes.lagged_campaign_announcement_date),
+        'campaign_search': build_campaign_search_index(df_campaigns),
+        'announcement_dates': df_campaigns.drop_duplicates('campaign_id').set_index('campaign_id').campaign_announcement_date,
+        **dict_pricing,
+    }
+
+def get_file_signature(file_path):
+    # path, size and mtime, which change whenever the file is rewritten, without reading it
+    file_stat = os.stat(file_path)
+    return f'{file_path}:{file_stat.st_size}:{file_stat.st_mtime_ns}'
+
+def get_files_version(list_file_paths, by_content=True):
+    # changes whenever any of the files does, missing files are skipped
+    # by_content=False versions the files by their signature rather than hashing their contents
+    get_file_version = hash_file if by_content else get_file_signature
+    return hashlib.sha256(''.join(get_file_version(file_path) for file_path in sorted(list_file_paths) if os.path.exists(file_path)).encode()).hexdigest()
+
+def load_dashboard_data(engineered_table_path='data/engineered_factset_campaign', pricing_table_path='data/clean_factset_pricing', cumulative_successes_table_path='data/engineered_cumulative_successes', return_model_data_path='results/campaign_return_model_data.csv', return_model_path='results/campaign_return_model.joblib'):
+    # builds everything from the pipeline tables, see load_dashboard_bundle for the faster prebuilt bundle
+    # versioned by file signatures, hashing the pricing table's contents would read it twice at every startup
+    logger.info('loading and indexing dashboard data')
+    version = get_files_version(
+        [find_table_file_path(table_path)[0] for table_path in [engineered_table_path, pricing_table_path, cumulative_successes_table_path]] +
+        [return_model_data_path, return_model_path],
+        by_content=False
+    )
+    return index_dashboard_data(
+        read_table(engineered_table_path),
+        build_pricing_arrays(read_table(pricing_table_path, columns=['company_id', 'date', 'price'])),
+        read_table(cumulative_successes_table_path, columns=['activist_id', 'lagged_campaign_announcement_date', 'past_return_successes']),
+        pd.read_csv(return_model_data_path),
+        version=version
+    )
+
+# the dashboard bundle is written by the pipeline's bundle stage
+# pricing and its downsampling levels are .npy arrays that are memory-mapped when loaded, so the
+# pages are read on first use and shared by every process serving the dashboard through the OS
+# page cache, the small tables are uncompressed feather and the model is copied alongside
+dashboard_bundle_directory = 'data/dashboard_bundle'
+
+def write_dashboard_bundle(df_campaigns, df_pricing, df_cumulative_successes, return_model_data_path='results/campaign_return_model_data.csv', return_model_path='results/campaign_return_model.joblib', bundle_directory=dashboard_bundle_directory):
+    os.makedirs(bundle_directory, exist_ok=True)
+    dict_pricing = build_pricing_arrays(df_pricing)
+
+    list_file_paths = []
+    def save_array(name, values):
+        file_path = os.path.join(bundle_directory, name + '.npy')
+        np.save(file_path, values)
+        list_file_paths.append(file_path)
+    def save_table(name, df):
+        list_file_paths.append(write_table(df, os.path.join(bundle_directory, name), table_format='feather', compression=None))
+
+    logger.info(f'writing dashboard bundle to {bundle_directory}')
+    save_array('pricing_dates', dict_pricing['pricing_dates'].view('int64'))
+    save_array('pricing_prices', dict_pricing['pricing_prices'])
+    for bucket_size, positions in dict_pricing['chart_levels'].items():
+        save_array(f'chart_levels_{bucket_size}', positions)
+    save_table('pricing_companies', pd.DataFrame(
+        [(company_id, offset, length) for company_id, (offset, length) in dict_pricing['company_pricing_slices'].items()],
+        columns=['company_id', 'offset', 'length']
+    ))
+    save_table('campaigns', df_campaigns)
+    save_table('cumulative_successes', df_cumulative_successes[['activist_id', 'lagged_campaign_announcement_date', 'past_return_successes']])
+    if os.path.exists(return_model_data_path):
+        save_table('return_model_data', pd.read_csv(return_model_data_path))
+    if os.path.exists(return_model_path):
+        shutil.copyfile(return_model_path, os.path.join(bundle_directory, 'campaign_return_model.joblib'))
+        list_file_paths.append(os.path.join(bundle_directory, 'campaign_return_model.joblib'))
+
+    # the version changes whenever any file in the bundle does
+    version = get_files_version(list_file_paths)
+    with open(os.path.join(bundle_directory, 'bundle.json'), 'w') as f:
+        json.dump({'version': version, 'chart_bucket_sizes': list(dict_pricing['chart_levels'])}, f, indent=2)
+    return version
+
+def dashboard_bundle_exists(bundle_directory=dashboard_bundle_directory):
+    return os.path.exists(os.path.join(bundle_directory, 'bundle.json'))
+
+def load_dashboard_bundle(bundle_directory=dashboard_bundle_directory):
+    logger.info(f'loading dashboard bundle from {bundle_directory}')
+    with open(os.path.join(bundle_directory, 'bundle.json')) as f:
+        dict_bundle = json.load(f)
+    def load_array(name):
+        return np.load(os.path.join(bundle_directory, name + '.npy'), mmap_mode='r')
+    def load_table(name):
+        return read_table(os.path.join(bundle_directory, name), table_format='feather')
+
+    df_pricing_companies = load_table('pricing_companies')
+    dict_pricing = {
+        'pricing_dates': load_array('pricing_dates').view('datetime64[ns]'),
+        'pricing_prices': load_array('pricing_prices'),
+        'company_pricing_slices': dict(zip(df_pricing_companies.company_id, zip(df_pricing_companies.offset, df_pricing_companies.length))),
+        'chart_levels': {bucket_size: load_array(f'chart_levels_{bucket_size}') for bucket_size in dict_bundle['chart_bucket_sizes']},
+    }
+    return index_dashboard_data(
+        load_table('campaigns'),
+        dict_pricing,
+        load_table('cumulative_successes'),
+        load_table('return_model_data') if table_exists(os.path.join(bundle_directory, 'return_model_data')) else pd.read_csv('results/campaign_return_model_data.csv'),
+        version=dict_bundle['version']
+    )
+
+@functools.lru_cache(maxsize=None)
+def get_dashboard_data():
+    # loaded on first use rather than at import, from the bundle when the pipeline has written one
+    if dashboard_bundle_exists():
+        return load_dashboard_bundle()
+    return load_dashboard_data()
+
+def get_return_model_path():
+    bundle_model_path = os.path.join(dashboard_bundle_directory, 'campaign_return_model.joblib')
+    return bundle_model_path if dashboard_bundle_exists() and os.path.exists(bundle_model_path) else 'results/campaign_return_model.joblib'
+
+def take_rows(df, positions, columns=None):
+    if columns is None:
+        return df.iloc[positions]
+    return df.iloc[positions, df.columns.get_indexer(columns)]
+
+def get_campaign_rows(dict_data, campaign_id, columns=None, as_of_date=None):
+    # no rows for a cleared dropdown (None) or an unknown campaign
+    positions = dict_data['campaign_rows'].get(campaign_id, np.empty(0, dtype=np.intp))
+    if as_of_date is not None:
+        positions = positions[dict_data['campaigns'].campaign_announcement_date.values[positions] <= np.datetime64(pd.Timestamp(as_of_date))]
+    return take_rows(dict_data['campaigns'], positions, columns)
+
+def get_activist_rows(dict_data, activist_id, columns=None, as_of_date=None):
+    positions = get_dated_slice(dict_data['activist_rows'], activist_id, as_of_date)
+    return take_rows(dict_data['campaigns'], positions, columns)
+
+def get_activist_past_successes(dict_data, activist_id, as_of_date=None):
+    # the activist's cumulative successes known by as_of_date
+    positions = get_dated_slice(dict_data['activist_successes'], activist_id, as_of_date)
+    if len(positions) == 0:
+        return 0
+    return dict_data['cumulative_successes'].past_return_successes.iloc[positions[-1]]
+
+def get_campaign_value(dict_data, campaign_id, column):
+    # value of column in the campaign's first row, None for an unknown campaign
+    positions = dict_data['campaign_rows'].get(campaign_id, [])
+    if len(positions) == 0:
+        return None
+    return dict_data['campaigns'][column].iloc[positions[0]]
+
+def make_pricing_frame(dict_data, company_id, rows):
+    return pd.DataFrame({
+        'company_id': company_id,
+        'date': dict_data['pricing_dates'][rows],
+        'price': dict_data['pricing_prices'][rows],
+    })
+
+def get_company_pricing(dict_data, company_id, as_of_date=None):
+    offset, length = dict_data['company_pricing_slices'].get(company_id, (0, 0))
+    if as_of_date is not None:
+        length = np.searchsorted(dict_data['pricing_dates'][offset:offset + length], np.datetime64(pd.Timestamp(as_of_date)), side='right')
+    return make_pricing_frame(dict_data, company_id, slice(offset, offset + length))
+
+def get_company_chart_pricing(dict_data, company_id, start_date=None, end_date=None, max_points=chart_max_points, as_of_date=None):
+    # the company's prices between start_date and end_date (both optional and inclusive), downsampled
+    # to at most max_points rows unless even the coarsest bucket size has more
+    if as_of_date is not None and (end_date is None or pd.Timestamp(end_date) > pd.Timestamp(as_of_date)):
+        end_date = as_of_date
+    offset, length = dict_data['company_pricing_slices'].get(company_id, (0, 0))
+    dates = dict_data['pricing_dates'][offset:offset + length]
+    left = offset + (np.searchsorted(dates, np.datetime64(pd.Timestamp(start_date)), side='left') if start_date is not None else 0)
+    right = offset + (np.searchsorted(dates, np.datetime64(pd.Timestamp(end_date)), side='right') if end_date is not None else length)
+    if right - left <= max_points:
+        return make_pricing_frame(dict_data, company_id, slice(left, right))
+
+    for bucket_size in list_chart_bucket_sizes:
+        level_positions = dict_data['chart_levels'][bucket_size]
+        level_left, level_right = np.searchsorted(level_positions, [left, right], side='left')
+        if level_right - level_left + 2 <= max_points or bucket_size == list_chart_bucket_sizes[-1]:
+            break
+    # keep the ends of the range so the line spans all of it
+    positions = np.union1d(level_positions[level_left:level_right], [left, right - 1])
+    return make_pricing_frame(dict_data, company_id, positions)
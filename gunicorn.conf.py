@@ -0,0 +1,13 @@
+import multiprocessing as multiprocessing
+
+# gunicorn settings for wsgi.py, anything can be overridden on the command line or in GUNICORN_CMD_ARGS, e.g.
+# gunicorn wsgi:server --workers 8 --bind 0.0.0.0:8050
+
+# local only by default, the dashboard serves licensed factset data, so serving it to the network
+# (--bind 0.0.0.0:8050) is a deliberate choice of the deployment
+bind = '127.0.0.1:8050'
+# callbacks are cpu bound pandas work, so one single threaded worker process per core
+workers = multiprocessing.cpu_count()
+# load the data in the master process so the workers share it, see wsgi.py
+preload_app = True
+timeout = 120
@@ -0,0 +1,161 @@
+import contextlib as contextlib
+import cProfile as cProfile
+import functools as functools
+import inspect as inspect
+import io as io
+import json as json
+import logging as logging
+import os as os
+import pstats as pstats
+import sys as sys
+import time as time
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+try:
+    import resource as resource
+except ImportError:
+    resource = None
+
+
+# run reports of the pipeline
+# while a report is recorded (see record_run_report), every call of an instrumented function is a step
+# with its wall and cpu time, the growth of the process' peak rss and the rows of the first table it got
+# and returned (see count_rows), nested in the stage and steps that called it
+# outside a report instrumented functions are called as they are
+# a stage that raises is recorded as failed, and the report is written either way
+
+dict_run_report = {'steps': None, 'stage': None, 'depth': 0}
+
+list_report_columns = [
+    'run_started_at', 'input_version', 'stage', 'status', 'step', 'depth',
+    'wall_seconds', 'cpu_seconds', 'peak_rss_mb', 'peak_rss_delta_mb', 'rows_in', 'rows_out'
+]
+
+
+def get_peak_rss_mb():
+    # peak resident set size of this process so far, ru_maxrss is in kilobytes on linux and bytes on macos
+    if resource is None:
+        return float('nan')
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak_rss / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+
+def get_cpu_seconds():
+    # user and system time of this process and its finished child processes, like the workers of a pool
+    if resource is None:
+        return time.process_time()
+    return sum(
+        usage.ru_utime + usage.ru_stime
+        for usage in [resource.getrusage(resource.RUSAGE_SELF), resource.getrusage(resource.RUSAGE_CHILDREN)]
+    )
+
+def count_rows(value):
+    # rows of a table, or of the first table in a tuple or list (like the arguments of a call), None when
+    # there is none
+    # tables of different kinds are not added up, calculate_betas gets campaigns, pricing and market
+    # pricing and its rows in are the campaigns
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return len(value)
+    if isinstance(value, (tuple, list)):
+        return next((count for count in map(count_rows, value) if count is not None), None)
+    return None
+
+@contextlib.contextmanager
+def measure_step(step, rows_in=None):
+    # yields the step's record, set its rows_out
+    if dict_run_report['steps'] is None:
+        yield {}
+        return
+
+    dict_step = {
+        'stage': dict_run_report['stage'],
+        'step': step,
+        'depth': dict_run_report['depth'],
+        'rows_in': rows_in,
+        'rows_out': None
+    }
+    dict_run_report['steps'].append(dict_step)
+    dict_run_report['depth'] += 1
+    start_time, start_cpu_seconds, start_peak_rss_mb = time.perf_counter(), get_cpu_seconds(), get_peak_rss_mb()
+    try:
+        yield dict_step
+    finally:
+        dict_run_report['depth'] -= 1
+        peak_rss_mb = get_peak_rss_mb()
+        dict_step.update({
+            'wall_seconds': time.perf_counter() - start_time,
+            'cpu_seconds': get_cpu_seconds() - start_cpu_seconds,
+            'peak_rss_mb': peak_rss_mb,
+            'peak_rss_delta_mb': peak_rss_mb - start_peak_rss_mb
+        })
+
+def instrumented(function=None, label_argument=None):
+    # records calls of the function as steps, label_argument names an argument whose value is added to
+    # the step name, like the path of a table
+    if function is None:
+        return functools.partial(instrumented, label_argument=label_argument)
+    signature = inspect.signature(function)
+
+    @functools.wraps(function)
+    def instrumented_function(*args, **kwargs):
+        if dict_run_report['steps'] is None:
+            return function(*args, **kwargs)
+        dict_arguments = signature.bind(*args, **kwargs).arguments
+        step = f'{function.__name__} {dict_arguments.get(label_argument)}' if label_argument else function.__name__
+        with measure_step(step, rows_in=count_rows(list(dict_arguments.values()))) as dict_step:
+            result = function(*args, **kwargs)
+            dict_step['rows_out'] = count_rows(result)
+            return result
+
+    return instrumented_function
+
+@contextlib.contextmanager
+def record_run_report():
+    # yields the list the steps of the run are added to
+    list_steps = []
+    dict_run_report.update({'steps': list_steps, 'stage': None, 'depth': 0})
+    try:
+        yield list_steps
+    finally:
+        dict_run_report.update({'steps': None, 'stage': None, 'depth': 0})
+
+@contextlib.contextmanager
+def measure_stage(stage):
+    # a stage is a step of depth 0 that the steps run inside it belong to, set its status
+    dict_run_report['stage'] = stage
+    try:
+        with measure_step(stage) as dict_step:
+            yield dict_step
+    finally:
+        dict_run_report['stage'] = None
+
+def run_profiled(function, profile_path, **kwargs):
+    # runs the function under cProfile and writes its stats to profile_path (open with pstats or snakeviz)
+    # and the 30 slowest functions by cumulative time to a text file next to it
+    # only this process is profiled, not the workers of a process pool
+    profiler = cProfile.Profile()
+    try:
+        return profiler.runcall(function, **kwargs)
+    finally:
+        os.makedirs(os.path.dirname(profile_path), exist_ok=True)
+        profiler.dump_stats(profile_path)
+        stream = io.StringIO()
+        pstats.Stats(profiler, stream=stream).sort_stats('cumulative').print_stats(30)
+        with open(os.path.splitext(profile_path)[0] + '.txt', 'w') as f:
+            f.write(stream.getvalue())
+        logger.info(f'wrote profile to {profile_path}')
+
+def write_run_report(dict_report, list_steps, report_path, history_path):
+    # the run as json, and its steps appended to a csv of every run to compare runs across data refreshes
+    logger.info(f'writing run report to {report_path}')
+    with open(report_path, 'w') as f:
+        json.dump({**dict_report, 'steps': list_steps}, f, indent=2, default=str)
+
+    df_steps = (
+        pd.DataFrame(list_steps)
+        .assign(run_started_at=dict_report['started_at'], input_version=dict_report['input_version'])
+        .reindex(columns=list_report_columns)
+    )
+    df_steps.to_csv(history_path, mode='a', header=not os.path.exists(history_path), index=False)
+    return df_steps
@@ -1,9 +1,24 @@
+import argparse as argparse
+import fnmatch as fnmatch
+import hashlib as hashlib
+import inspect as inspect
+import json as json
 import logging as logging
+import os as os
+import platform as platform
+import sys as sys
+import tempfile as tempfile
 import numpy as np
 import pandas as pd
 import pandas_datareader as pdr
 
+from concurrent.futures import ProcessPoolExecutor
+from pandas.api.types import union_categoricals
+from scipy import sparse
 from scipy.stats import mstats
+from dashboard_data import build_chart_levels, build_pricing_arrays, build_slice_index, get_bucket_extreme_positions, list_chart_bucket_sizes, sort_pricing, write_dashboard_bundle
+from instrumentation import get_peak_rss_mb, instrumented, measure_stage, record_run_report, run_profiled, write_run_report
+from table_store import find_table_file_path, hash_file, read_snapshot, read_table, table_exists, write_table
 
 logger = logging.getLogger(__name__)
 
@@ -141,17 +156,86 @@ def clean_column_name(column_name):
     )
 
 
-def read_factset_campaign_data():
+list_factset_campaign_na_values = ['', ' ', '_', '-', ' - ', '- ', ' -', 'na', 'NA', 'n.a.', '#NAME?']
+
+def is_factset_campaign_column_used(column_name):
+    # whether a raw workbook column ends up in list_column_order (or is dropped explicitly) after cleaning
+    column_name = clean_column_name(str(column_name))
+    column_name = dict_manual_renamings.get(column_name, column_name)
+    return column_name in list_column_order or column_name in list_drop_columns
+
+@instrumented
+def read_factset_campaign_data(file_path='data/factset_campaign_v9.xlsx', use_snapshot=True, engine=None, used_columns_only=True):
+    # parsing the workbook is slow, so by default the parsed table is kept as a snapshot next to it
+    # and only re-read from excel when the workbook changes
+    # engine can be set to a faster reader than openpyxl, e.g. 'calamine' with python-calamine installed
     logger.info('reading factset campaign data')
-    df_factset_campaign = pd.read_excel('data/factset_campaign_v9.xlsx', skiprows=2, na_values=['', ' ', '_', '-', ' - ', '- ', ' -', 'na', 'NA', 'n.a.', '#NAME?'])
+
+    def read_workbook():
+        return pd.read_excel(
+            file_path,
+            skiprows=2,
+            na_values=list_factset_campaign_na_values,
+            usecols=is_factset_campaign_column_used if used_columns_only else None,
+            engine=engine
+        )
+
+    if not use_snapshot:
+        return read_workbook()
+
+    snapshot_path = os.path.splitext(file_path)[0] + '_snapshot'
+    df_factset_campaign = read_snapshot(
+        file_path, snapshot_path, read_workbook,
+        options={'used_columns_only': used_columns_only, 'columns': list_column_order + list_drop_columns}
+    )
     return df_factset_campaign
 
-def read_factset_pricing_data():
+@instrumented
+def read_factset_pricing_data(file_path='data/factset_pricing.txt', company_ids=None, chunksize=1000000):
+    # the pricing file is read in chunks and rows of companies outside company_ids are dropped
+    # as each chunk arrives, so only the kept rows are ever held in memory
+    # company_id is categorical, price float32 and volume int32 when every value fits
     logger.info('reading factset pricing data')
-    df_factset_pricing = pd.read_csv('data/factset_pricing.txt', parse_dates=['FSDate'])
-    return df_factset_pricing
+    if company_ids is not None:
+        company_ids = pd.Index(company_ids).dropna().unique().sort_values()
+
+    list_chunks = []
+    n_rows_read = 0
+    for df_chunk in pd.read_csv(
+        file_path,
+        usecols=['FactSetID', 'FSDate', 'FGPRICE', 'FGVolume'],
+        dtype={'FactSetID': str, 'FGPRICE': float, 'FGVolume': float},
+        parse_dates=['FSDate'],
+        chunksize=chunksize
+    ):
+        n_rows_read += len(df_chunk)
+        if company_ids is not None:
+            df_chunk = df_chunk[df_chunk.FactSetID.isin(company_ids)]
+        else:
+            # rows without a company are dropped, as the company filter drops them
+            df_chunk = df_chunk[df_chunk.FactSetID.notnull()]
+        list_chunks.append(
+            df_chunk
+            .assign(FactSetID=lambda df: pd.Categorical(df.FactSetID, categories=company_ids))
+            .assign(FGPRICE=lambda df: df.FGPRICE.astype('float32'))
+        )
 
+    if company_ids is None:
+        # without a filter each chunk has the categories it read, every chunk gets all of them so the
+        # column stays categorical when concatenated
+        categories = union_categoricals([df_chunk.FactSetID for df_chunk in list_chunks], sort_categories=True).categories
+        for df_chunk in list_chunks:
+            df_chunk['FactSetID'] = df_chunk.FactSetID.cat.set_categories(categories)
+    df_factset_pricing = pd.concat(list_chunks, ignore_index=True)
 
+    volume = df_factset_pricing.FGVolume
+    if volume.notnull().all() and volume.between(np.iinfo('int32').min, np.iinfo('int32').max).all() and (volume % 1 == 0).all():
+        df_factset_pricing['FGVolume'] = volume.astype('int32')
+
+    logger.info(f'kept {len(df_factset_pricing)} of {n_rows_read} pricing rows, peak rss {get_peak_rss_mb():.0f} MB')
+    return df_factset_pricing
+
+@instrumented
 def read_yahoo_finance_pricing_data():
     logger.info('reading yahoo finance pricing data')
     try:
@@ -168,6 +252,7 @@ def read_yahoo_finance_pricing_data():
         df_yahoo_finance_pricing = pd.read_csv('data/yahoo_finance_pricing_backup.csv', parse_dates=['Date'])
     return df_yahoo_finance_pricing
 
+@instrumented
 def clean_yahoo_finance_pricing_data(df_yahoo_finance_pricing):
     df_yahoo_finance_pricing = (
         df_yahoo_finance_pricing
@@ -183,8 +268,14 @@ def clean_yahoo_finance_pricing_data(df_yahoo_finance_pricing):
     return df_yahoo_finance_pricing
 
 
+@instrumented
 def clean_factset_pricing_data(df_factset_pricing, df_factset_campaign):
     logger.info('cleaning factset pricing data')
+
+    # drop companies without campaigns first, returns are per company so this changes nothing else
+    company_id_to_keep = df_factset_campaign.company_id.unique().tolist()
+    df_factset_pricing = df_factset_pricing[df_factset_pricing.FactSetID.isin(company_id_to_keep)]
+
     df_factset_pricing = (
         df_factset_pricing
         .rename(columns={
@@ -194,17 +285,15 @@ def clean_factset_pricing_data(df_factset_pricing, df_factset_campaign):
             'FGVolume': 'volume'
         })
         .sort_values(['company_id', 'date'])
-        .assign(price=lambda df: df.price.astype(float))
-        .assign(stock_daily_return=lambda df: df.groupby('company_id').price.pct_change())
+        # returns are calculated in float64 even when prices are stored as float32
+        .assign(stock_daily_return=lambda df: df.price.astype(float).groupby(df.company_id, observed=True).pct_change())
         .assign(stock_daily_return=lambda df: df.stock_daily_return.clip(-0.50, 0.50))
     )
 
-    company_id_to_keep = df_factset_campaign.company_id.unique().tolist()
-    df_factset_pricing = df_factset_pricing[df_factset_pricing.company_id.isin(company_id_to_keep)]
-
     return df_factset_pricing
 
 
+@instrumented
 def clean_factset_campaign_data(df_factset_campaign):
 
     df_cleaning = df_factset_campaign.copy()
@@ -253,90 +342,523 @@ def clean_factset_campaign_data(df_factset_campaign):
 
     return df_factset_campaign_cleaned
 
-def calculate_betas(df_factset_campaign, df_factset_pricing, df_yahoo_finance_pricing):
+list_campaign_window_columns = [
+    'pre_18m_announcement_date',
+    'pre_12m_announcement_date',
+    'pre_6m_announcement_date',
+    'pre_3m_announcement_date',
+    'campaign_announcement_date',
+    'post_6m_announcement_date',
+    'post_12m_announcement_date',
+    'post_18m_announcement_date'
+]
+
+# market return windows as (start, end) date columns, both ends inclusive like Series.between
+dict_market_return_windows = {
+    'pre_18m_market_return': ('pre_18m_announcement_date', 'campaign_announcement_date'),
+    'pre_12m_market_return': ('pre_12m_announcement_date', 'campaign_announcement_date'),
+    'pre_6m_market_return': ('pre_6m_announcement_date', 'campaign_announcement_date'),
+    'post_6m_market_return': ('campaign_announcement_date', 'post_6m_announcement_date'),
+    'post_12m_market_return': ('campaign_announcement_date', 'post_12m_announcement_date'),
+    'post_18m_market_return': ('campaign_announcement_date', 'post_18m_announcement_date'),
+}
 
-    logger.info('merging factset pricing and sp pricing')
-    df_pricing = (
-        df_factset_pricing
-        .pipe(pd.merge, df_yahoo_finance_pricing[['date', 'sp_daily_return']], how='left', on='date')
-    )
-
-    logger.info('merging factset pricing and factset campaign')
-    df_pricing_relevant_for_campaign = (
-        pd.merge(
-            df_pricing,
-            df_factset_campaign[[
-                'campaign_id',
-                'company_id',
-                'pre_18m_announcement_date',
-                'pre_12m_announcement_date',
-                'pre_6m_announcement_date',
-                'pre_3m_announcement_date',
-                'campaign_announcement_date',
-                'post_6m_announcement_date',
-                'post_12m_announcement_date',
-                'post_18m_announcement_date'
-            ]],
-            on=['company_id'],
-            how='left'
+list_beta_columns = [
+    'campaign_id',
+    'company_id',
+    'pre_18m_announcement_date',
+    'campaign_announcement_date',
+    'post_18m_announcement_date',
+] + list(dict_market_return_windows) + [
+    'beta'
+]
+
+def prefix_sums(values):
+    # prefix_sums(values)[j] - prefix_sums(values)[i] is the sum of values[i:j]
+    return np.concatenate([[0.0], np.cumsum(values, dtype=float)])
+
+def window_sums(values, left, right):
+    # sums of values[left:right] for every window, each one added up from its own rows only
+    # so a window's sum does not depend on which other windows are calculated alongside it
+    # (a difference of prefix sums carries the rounding of every row before the window)
+    values = np.append(np.asarray(values, dtype=float), 0.0)
+    order = np.argsort(left, kind='stable')
+    boundaries = np.empty(2 * len(left), dtype='int64')
+    boundaries[0::2] = left[order]
+    boundaries[1::2] = right[order]
+    sums = np.zeros(len(left))
+    if len(left):
+        sums[order] = np.add.reduceat(values, boundaries)[0::2]
+    sums[right <= left] = 0.0
+    return sums
+
+def locate_windows(row_groups, row_dates, group_ids, start_dates, end_dates):
+    # rows must be sorted by group and then date, with missing dates last as np.lexsort sorts them
+    # returns [left, right) row offsets of each group's rows with start <= date <= end
+    # missing start or end dates give an empty window, matching Series.between on NaT
+    row_dates = np.asarray(row_dates, dtype='datetime64[ns]')
+    start_dates = np.asarray(start_dates, dtype='datetime64[ns]')
+    end_dates = np.asarray(end_dates, dtype='datetime64[ns]')
+    is_valid = ~(np.isnat(start_dates) | np.isnat(end_dates))
+
+    # missing row dates rank last like they are sorted (NaT is the smallest int64), so they are never
+    # inside a window
+    row_date_keys = row_dates.view('int64').copy()
+    row_date_keys[np.isnat(row_dates)] = np.iinfo('int64').max
+
+    # rank every date against every boundary so the search keys stay exact integers
+    _, ranks = np.unique(
+        np.concatenate([row_date_keys, start_dates[is_valid].view('int64'), end_dates[is_valid].view('int64')]),
+        return_inverse=True
+    )
+    n_rows, n_valid = len(row_dates), is_valid.sum()
+    row_keys = (np.asarray(row_groups, dtype='int64') << 32) | ranks[:n_rows]
+    group_keys = np.asarray(group_ids, dtype='int64')[is_valid] << 32
+
+    left = np.zeros(len(start_dates), dtype='int64')
+    right = np.zeros(len(start_dates), dtype='int64')
+    left[is_valid] = np.searchsorted(row_keys, group_keys | ranks[n_rows:n_rows + n_valid], side='left')
+    right[is_valid] = np.searchsorted(row_keys, group_keys | ranks[n_rows + n_valid:], side='right')
+    right = np.maximum(left, right)
+
+    return left, right
+
+def join_campaign_windows(df_pricing, df_campaign_windows, columns=None, start_column='pre_18m_announcement_date', end_column='post_18m_announcement_date'):
+    # range join of pricing rows onto campaign rows on company_id and start <= date <= end
+    # pricing is sorted once per company and each campaign takes a slice of it, so the result
+    # only ever holds rows inside a window (no campaigns x full history intermediate)
+    # result is sorted by campaign_row and then date
+    company_codes, _ = pd.factorize(
+        pd.concat([df_pricing.company_id, df_campaign_windows.company_id], ignore_index=True),
+        sort=True
+    )
+    pricing_codes = company_codes[:len(df_pricing)]
+    campaign_codes = company_codes[len(df_pricing):]
+    pricing_dates = df_pricing.date.values
+
+    pricing_order = np.lexsort((pricing_dates, pricing_codes))
+    left, right = locate_windows(
+        pricing_codes[pricing_order], pricing_dates[pricing_order], campaign_codes,
+        df_campaign_windows[start_column].values,
+        df_campaign_windows[end_column].values
+    )
+
+    # expand each [left, right) slice into row positions
+    lengths = right - left
+    slice_offsets = np.cumsum(lengths) - lengths
+    positions = np.arange(lengths.sum()) - np.repeat(slice_offsets - left, lengths)
+
+    columns = df_pricing.columns.tolist() if columns is None else columns
+    df_window_pricing = (
+        df_pricing
+        .iloc[pricing_order[positions], df_pricing.columns.get_indexer(columns)]
+        .reset_index(drop=True)
+        .assign(campaign_row=np.repeat(df_campaign_windows.campaign_row.values, lengths))
+    )
+
+    return df_window_pricing
+
+def calculate_window_statistics(df_window_pricing, df_campaign_windows):
+    # df_window_pricing holds the pricing rows inside each campaign's pre_18m..post_18m window,
+    # sorted by campaign_row and then date
+    # all campaigns are done in one pass, every window summed on its own rows (see window_sums)
+    row_groups = df_window_pricing.campaign_row.values
+    row_dates = df_window_pricing.date.values
+    x = df_window_pricing.stock_daily_return.values.astype(float)
+    y = df_window_pricing.sp_daily_return.values.astype(float)
+    campaign_rows = df_campaign_windows.campaign_row.values
+
+    # the full window is every row of the campaign
+    window_left = np.searchsorted(row_groups, campaign_rows, side='left')
+    window_right = np.searchsorted(row_groups, campaign_rows, side='right')
+
+    df_statistics = df_campaign_windows.assign(n_rows=window_right - window_left)
+
+    for column, (start_column, end_column) in dict_market_return_windows.items():
+        left, right = locate_windows(
+            row_groups, row_dates, campaign_rows,
+            df_campaign_windows[start_column].values,
+            df_campaign_windows[end_column].values
         )
-        .loc[lambda df: df.date.between(df['pre_18m_announcement_date'], df['post_18m_announcement_date'])]
-    )
-
-    def calculate_beta(gb):
-        return pd.Series({
-            'pre_18m_announcement_date': gb['pre_18m_announcement_date'].iloc[0],
-            'campaign_announcement_date': gb['campaign_announcement_date'].iloc[0],
-            'post_18m_announcement_date': gb['post_18m_announcement_date'].iloc[0],
-            'pre_18m_market_return': gb.loc[lambda df: df.date.between(df['pre_18m_announcement_date'], df['campaign_announcement_date'])].sp_daily_return.sum(),
-            'pre_12m_market_return': gb.loc[lambda df: df.date.between(df['pre_12m_announcement_date'], df['campaign_announcement_date'])].sp_daily_return.sum(),
-            'pre_6m_market_return': gb.loc[lambda df: df.date.between(df['pre_6m_announcement_date'], df['campaign_announcement_date'])].sp_daily_return.sum(),
-            'post_6m_market_return': gb.loc[lambda df: df.date.between(df['campaign_announcement_date'], df['post_6m_announcement_date'])].sp_daily_return.sum(),
-            'post_12m_market_return': gb.loc[lambda df: df.date.between(df['campaign_announcement_date'], df['post_12m_announcement_date'])].sp_daily_return.sum(),
-            'post_18m_market_return': gb.loc[lambda df: df.date.between(df['campaign_announcement_date'], df['post_18m_announcement_date'])].sp_daily_return.sum(),
-            'beta': gb[['stock_daily_return', 'sp_daily_return']].dropna().cov().iloc[0, 1] / gb[['sp_daily_return']].var().iloc[0]
-        })
+        df_statistics[column] = window_sums(np.nan_to_num(y), left, right)
+
+    # running sums for the covariance over rows with both returns
+    # and for the variance over rows with a market return, as in calculate_beta previously
+    is_paired = ~(np.isnan(x) | np.isnan(y))
+    is_market = ~np.isnan(y)
+    dict_running_sums = {
+        'n_xy': is_paired,
+        'sum_x': np.where(is_paired, x, 0),
+        'sum_y': np.where(is_paired, y, 0),
+        'sum_xy': np.where(is_paired, x * y, 0),
+        'n_yy': is_market,
+        'sum_y_market': np.where(is_market, y, 0),
+        'sum_yy': np.where(is_market, y * y, 0),
+    }
+    for column, values in dict_running_sums.items():
+        df_statistics[column] = window_sums(values, window_left, window_right)
+
+    return df_statistics
+
+def calculate_beta_from_statistics(df_statistics):
+    # sample covariance and variance (ddof=1) from the running sums, nan with fewer than two rows
+    with np.errstate(divide='ignore', invalid='ignore'):
+        covariance = np.where(
+            df_statistics.n_xy > 1,
+            (df_statistics.sum_xy - df_statistics.sum_x * df_statistics.sum_y / df_statistics.n_xy) / (df_statistics.n_xy - 1),
+            np.nan
+        )
+        variance = np.where(
+            df_statistics.n_yy > 1,
+            (df_statistics.sum_yy - df_statistics.sum_y_market ** 2 / df_statistics.n_yy) / (df_statistics.n_yy - 1),
+            np.nan
+        )
+        return covariance / variance
+
+list_partition_arrays = ['company_id', 'date', 'stock_daily_return']
+
+def calculate_partition_statistics(dict_arrays, row_start, row_end, df_campaign_windows, sr_market_returns):
+    # window statistics for the campaigns of one partition, i.e. a range of whole companies
+    # in pricing sorted by company code and date
+    df_pricing = pd.DataFrame({
+        'company_id': dict_arrays['company_id'][row_start:row_end],
+        'date': dict_arrays['date'][row_start:row_end].view('datetime64[ns]'),
+        'stock_daily_return': dict_arrays['stock_daily_return'][row_start:row_end],
+    })
+    df_window_pricing = join_campaign_windows(df_pricing, df_campaign_windows, columns=['date', 'stock_daily_return'])
+    df_window_pricing['sp_daily_return'] = df_window_pricing.date.map(sr_market_returns)
+    return calculate_window_statistics(df_window_pricing, df_campaign_windows)
+
+def partition_companies(company_codes, partition_rows):
+    # split rows sorted by company into ranges of about partition_rows rows without splitting a company
+    # partitions depend only on the data, so results are the same for any number of workers
+    targets = company_codes[np.arange(0, len(company_codes), partition_rows)]
+    cuts = np.unique(np.append(np.searchsorted(company_codes, targets, side='left'), len(company_codes)))
+    return list(zip(cuts[:-1], cuts[1:]))
+
+def prepare_partitions(df_factset_campaign, df_factset_pricing, partition_rows):
+    # campaign_row identifies a campaign row, campaign_id can repeat across rows
+    df_campaign_windows = (
+        df_factset_campaign[['campaign_id', 'company_id'] + list_campaign_window_columns]
+        .reset_index(drop=True)
+        .rename_axis('campaign_row')
+        .reset_index()
+    )
+
+    logger.info('sorting factset pricing by company and date')
+    company_codes, _ = pd.factorize(
+        pd.concat([df_factset_pricing.company_id.astype(object), df_campaign_windows.company_id.astype(object)], ignore_index=True),
+        sort=True
+    )
+    pricing_codes = company_codes[:len(df_factset_pricing)]
+    campaign_codes = company_codes[len(df_factset_pricing):]
+    pricing_order = np.lexsort((df_factset_pricing.date.values, pricing_codes))
+    dict_arrays = {
+        'company_id': pricing_codes[pricing_order],
+        'date': df_factset_pricing.date.values[pricing_order].view('int64'),
+        'stock_daily_return': df_factset_pricing.stock_daily_return.values.astype(float)[pricing_order],
+    }
+
+    # each partition gets the campaigns of its companies, identified by company code
+    df_campaign_windows_coded = df_campaign_windows.assign(company_id=campaign_codes)
+    list_partition_tasks = [
+        (
+            row_start, row_end,
+            df_campaign_windows_coded.loc[lambda df: df.company_id.between(dict_arrays['company_id'][row_start], dict_arrays['company_id'][row_end - 1])]
+        )
+        for row_start, row_end in partition_companies(dict_arrays['company_id'], partition_rows)
+    ]
+
+    return df_campaign_windows, dict_arrays, list_partition_tasks
+
+def run_partition_from_files(function, array_directory, row_start, row_end, *args):
+    # worker entry point, the pricing arrays are memory-mapped rather than pickled to each process
+    dict_arrays = {
+        name: np.load(os.path.join(array_directory, name + '.npy'), mmap_mode='r')
+        for name in list_partition_arrays
+    }
+    return function(dict_arrays, row_start, row_end, *args)
+
+def map_partitions(function, dict_arrays, list_partition_tasks, n_workers, *args):
+    # calls function(dict_arrays, row_start, row_end, df_partition_windows, *args) for every partition
+    # and returns the results in partition order
+    logger.info(f'processing {len(list_partition_tasks)} partitions with {n_workers} workers')
+    if n_workers <= 1:
+        return [
+            function(dict_arrays, row_start, row_end, df_partition_windows, *args)
+            for row_start, row_end, df_partition_windows in list_partition_tasks
+        ]
+
+    with tempfile.TemporaryDirectory() as array_directory:
+        for name, values in dict_arrays.items():
+            np.save(os.path.join(array_directory, name + '.npy'), values)
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            list_futures = [
+                executor.submit(run_partition_from_files, function, array_directory, row_start, row_end, df_partition_windows, *args)
+                for row_start, row_end, df_partition_windows in list_partition_tasks
+            ]
+            return [future.result() for future in list_futures]
+
+@instrumented
+def calculate_betas(df_factset_campaign, df_factset_pricing, df_yahoo_finance_pricing, n_workers=1, partition_rows=2000000):
+
+    # output matches the previous groupby-apply implementation: same columns and rows,
+    # market returns and betas agree to within 1e-9 absolute (only the order of float summation differs)
+    # with n_workers > 1 company partitions are processed in a pool of worker processes
+
+    df_campaign_windows, dict_arrays, list_partition_tasks = prepare_partitions(df_factset_campaign, df_factset_pricing, partition_rows)
+    sr_market_returns = df_yahoo_finance_pricing.drop_duplicates('date').set_index('date').sp_daily_return
 
-    df_factset_pricing_beta = df_pricing_relevant_for_campaign.groupby(['campaign_id', 'company_id']).apply(calculate_beta).reset_index()
+    logger.info('calculating window returns and betas')
+    list_statistics = map_partitions(calculate_partition_statistics, dict_arrays, list_partition_tasks, n_workers, sr_market_returns)
+
+    # seeded with the statistics columns, so no partitions (like pricing without rows) gives no betas
+    list_sum_columns = list(dict_market_return_windows) + ['n_xy', 'sum_x', 'sum_y', 'sum_xy', 'n_yy', 'sum_y_market', 'sum_yy']
+    df_statistics = (
+        pd.concat([df_campaign_windows.iloc[:0].reindex(columns=list(df_campaign_windows.columns) + ['n_rows'] + list_sum_columns)] + list_statistics, ignore_index=True)
+        .sort_values('campaign_row')
+        # restore the original company ids
+        .assign(company_id=lambda df: df_campaign_windows.company_id.values[df.campaign_row.values])
+        .loc[lambda df: df.n_rows > 0]
+    )
+
+    # a campaign_id with several rows pools the windows of all of its rows
+    df_factset_pricing_beta = (
+        df_statistics
+        .groupby(['campaign_id', 'company_id'])
+        .agg({
+            'pre_18m_announcement_date': 'first',
+            'campaign_announcement_date': 'first',
+            'post_18m_announcement_date': 'first',
+            **{column: 'sum' for column in list_sum_columns}
+        })
+        .assign(beta=calculate_beta_from_statistics)
+        .reset_index()
+        .loc[:, list_beta_columns]
+    )
     df_factset_pricing_beta['beta'] = df_factset_pricing_beta['beta'].clip(-1, 2)
 
     return df_factset_pricing_beta
 
-def engineer_features(df_factset_campaign_cleaned, df_factset_betas):
+def get_estimation_window_column(start_offset, end_offset):
+    # (-250, -30) -> 'beta_m250_m30'
+    def format_offset(offset):
+        return ('m' if offset < 0 else 'p') + str(abs(offset))
+    return f'beta_{format_offset(start_offset)}_{format_offset(end_offset)}'
+
+def calculate_partition_estimation_betas(dict_arrays, row_start, row_end, df_campaign_windows, sr_market_returns, estimation_windows, min_observations):
+    # betas over windows of trading days relative to the announcement, for the campaigns of one partition
+    # running sums over the partition make every window O(1), so each extra window costs one
+    # pass over the campaigns rather than over the prices
+    company_codes = dict_arrays['company_id'][row_start:row_end]
+    dates = np.asarray(dict_arrays['date'][row_start:row_end]).view('datetime64[ns]')
+    x = np.asarray(dict_arrays['stock_daily_return'][row_start:row_end], dtype=float)
+    y = pd.Series(dates).map(sr_market_returns).values.astype(float)
+
+    is_paired = ~(np.isnan(x) | np.isnan(y))
+    dict_cumulative = {
+        'n_xy': prefix_sums(is_paired),
+        'sum_x': prefix_sums(np.where(is_paired, x, 0)),
+        'sum_y': prefix_sums(np.where(is_paired, y, 0)),
+        'sum_xy': prefix_sums(np.where(is_paired, x * y, 0)),
+        'sum_yy': prefix_sums(np.where(is_paired, y * y, 0)),
+    }
+
+    # trading day 0 is the company's first trading day on or after the announcement
+    campaign_codes = df_campaign_windows.company_id.values
+    announcement_dates = df_campaign_windows.campaign_announcement_date.values
+    company_left = np.searchsorted(company_codes, campaign_codes, side='left')
+    company_right = np.searchsorted(company_codes, campaign_codes, side='right')
+    announcement_row, _ = locate_windows(company_codes, dates, campaign_codes, announcement_dates, announcement_dates)
+    has_announcement = ~np.isnat(announcement_dates.astype('datetime64[ns]'))
+
+    df_estimation_betas = df_campaign_windows[['campaign_row', 'campaign_id', 'company_id']].copy()
+    for start_offset, end_offset in estimation_windows:
+        left = np.clip(announcement_row + start_offset, company_left, company_right)
+        right = np.maximum(np.clip(announcement_row + end_offset + 1, company_left, company_right), left)
+        df_window = pd.DataFrame({
+            column: cumulative[right] - cumulative[left]
+            for column, cumulative in dict_cumulative.items()
+        })
+        with np.errstate(divide='ignore', invalid='ignore'):
+            covariance = (df_window.sum_xy - df_window.sum_x * df_window.sum_y / df_window.n_xy) / (df_window.n_xy - 1)
+            variance = (df_window.sum_yy - df_window.sum_y ** 2 / df_window.n_xy) / (df_window.n_xy - 1)
+            beta = (covariance / variance).values
+        beta[(df_window.n_xy.values < max(min_observations, 2)) | ~has_announcement] = np.nan
+        df_estimation_betas[get_estimation_window_column(start_offset, end_offset)] = beta
+
+    return df_estimation_betas
+
+@instrumented
+def calculate_estimation_window_betas(df_factset_campaign, df_factset_pricing, df_yahoo_finance_pricing, estimation_windows=((-250, -30),), min_observations=60, n_workers=1, partition_rows=2000000):
+
+    # betas estimated only on trading days before the announcement, unlike calculate_betas whose
+    # single window spans pre_18m..post_18m and so includes the returns being explained
+    # estimation_windows are (first, last) trading day offsets from the announcement, both inclusive,
+    # and give one column each, e.g. (-250, -30) -> beta_m250_m30
+    # windows with fewer than min_observations paired returns get no beta
+
+    df_campaign_windows, dict_arrays, list_partition_tasks = prepare_partitions(df_factset_campaign, df_factset_pricing, partition_rows)
+    sr_market_returns = df_yahoo_finance_pricing.drop_duplicates('date').set_index('date').sp_daily_return
+
+    logger.info(f'calculating betas over estimation windows {list(estimation_windows)}')
+    list_estimation_betas = map_partitions(
+        calculate_partition_estimation_betas, dict_arrays, list_partition_tasks, n_workers,
+        sr_market_returns, list(estimation_windows), min_observations
+    )
+
+    list_beta_columns = [get_estimation_window_column(start_offset, end_offset) for start_offset, end_offset in estimation_windows]
+    df_estimation_betas = (
+        pd.concat([df_campaign_windows.iloc[:0].reindex(columns=['campaign_row', 'campaign_id', 'company_id'] + list_beta_columns)] + list_estimation_betas, ignore_index=True)
+        .sort_values('campaign_row')
+        .assign(company_id=lambda df: df_campaign_windows.company_id.values[df.campaign_row.values])
+        .groupby(['campaign_id', 'company_id'])
+        [list_beta_columns]
+        .first()
+        .clip(-1, 2)
+        .reset_index()
+    )
 
-    df_engineering = df_factset_campaign_cleaned.copy()
+    return df_estimation_betas
+
+# one entry per horizon, returns are divided by months to get monthly returns
+# return_types lists the returns engineered for the horizon: price_return is calculated from
+# the stock prices, total_return comes from factset and residual_return needs the horizon's
+# market return from calculate_betas (see dict_market_return_windows)
+# a new horizon needs its input columns, e.g. post_24m_stock_price and post_24m_price_to_earnings
+list_horizon_specs = [
+    {'direction': 'pre', 'months': 18, 'return_types': ['price_return', 'total_return', 'residual_return']},
+    {'direction': 'pre', 'months': 12, 'return_types': ['price_return', 'total_return', 'residual_return']},
+    {'direction': 'pre', 'months': 6, 'return_types': ['price_return', 'total_return', 'residual_return']},
+    {'direction': 'pre', 'months': 3, 'return_types': ['price_return', 'total_return']},
+    {'direction': 'post', 'months': 6, 'return_types': ['price_return', 'total_return', 'residual_return']},
+    {'direction': 'post', 'months': 12, 'return_types': ['price_return', 'total_return', 'residual_return']},
+    {'direction': 'post', 'months': 18, 'return_types': ['price_return', 'total_return', 'residual_return']},
+]
+
+# winsorizing bounds by column name pattern
+dict_winsorize_bounds = {
+    'return': (-1, 2),
+    'earnings_yield': (-1, 2),
+    'dividend': (0, 1),
+}
+
+def get_horizon_columns(list_specs, feature):
+    return [f"{spec['direction']}_{spec['months']}m_{feature}" for spec in list_specs]
+
+def get_horizon_specs(list_specs, return_type):
+    return [spec for spec in list_specs if return_type in spec['return_types']]
+
+def assign_block(df, columns, block):
+    # writes a 2-d block of columns, replacing existing columns in place and appending new ones
+    df_block = pd.DataFrame(block, index=df.index, columns=columns)
+    list_existing_columns = [column for column in columns if column in df.columns]
+    list_new_columns = [column for column in columns if column not in df.columns]
+    if list_existing_columns:
+        df[list_existing_columns] = df_block[list_existing_columns]
+    if list_new_columns:
+        df = pd.concat([df, df_block[list_new_columns]], axis=1)
+    return df
+
+def winsorize_block(columns, block):
+    # clips a block in place with the bounds of every pattern its columns match
+    for pattern, (lower, upper) in dict_winsorize_bounds.items():
+        is_matched = np.array([pattern in column for column in columns])
+        if is_matched.any():
+            block[:, is_matched] = np.clip(block[:, is_matched], lower, upper)
+    return block
+
+def engineer_horizon_features(df_engineering, list_specs=list_horizon_specs):
+
+    # every feature family is calculated as one 2-d array with a column per horizon
+    # so adding a horizon adds a column to each block rather than more dataframe assignments
+
+    list_price_specs = get_horizon_specs(list_specs, 'price_return')
+    list_total_specs = get_horizon_specs(list_specs, 'total_return')
+    list_residual_specs = get_horizon_specs(list_specs, 'residual_return')
+
+    def read_block(list_specs, feature):
+        return df_engineering[get_horizon_columns(list_specs, feature)].to_numpy(dtype=float)
+
+    def get_months(list_specs):
+        return np.array([spec['months'] for spec in list_specs], dtype=float)
+
+    price_at_announcement = df_engineering.price_at_announcement.to_numpy(dtype=float)[:, None]
 
     # fundamentals
     logger.info('calculating earnings yield')
-    df_engineering = (
-        df_engineering
-        .assign(pre_18m_earnings_yield=lambda df: 1 / df.pre_18m_price_to_earnings)
-        .assign(pre_12m_earnings_yield=lambda df: 1 / df.pre_12m_price_to_earnings)
-        .assign(pre_6m_earnings_yield=lambda df: 1 / df.pre_6m_price_to_earnings)
-        .assign(pre_3m_earnings_yield=lambda df: 1 / df.pre_3m_price_to_earnings)
-        .assign(earnings_yield_at_announcement=lambda df: df.ltm_eps_at_announcement / df.price_at_announcement)
-        .assign(post_6m_earnings_yield=lambda df: 1 / df.post_6m_price_to_earnings)
-        .assign(post_12m_earnings_yield=lambda df: 1 / df.post_12m_price_to_earnings)
-        .assign(post_18m_earnings_yield=lambda df: 1 / df.post_18m_price_to_earnings)
-    )
+    with np.errstate(divide='ignore', invalid='ignore'):
+        earnings_yield = 1 / read_block(list_specs, 'price_to_earnings')
+        earnings_yield_at_announcement = df_engineering.ltm_eps_at_announcement.to_numpy(dtype=float)[:, None] / price_at_announcement
 
-    # price returns
+    # price returns, from the earlier price to the later one
     logger.info('calculating price returns')
-    df_engineering['pre_18m_price_return'] = df_engineering['price_at_announcement'] / df_engineering['pre_18m_stock_price'] - 1
-    df_engineering['pre_12m_price_return'] = df_engineering['price_at_announcement'] / df_engineering['pre_12m_stock_price'] - 1
-    df_engineering['pre_6m_price_return'] = df_engineering['price_at_announcement'] / df_engineering['pre_6m_stock_price'] - 1
-    df_engineering['pre_3m_price_return'] = df_engineering['price_at_announcement'] / df_engineering['pre_3m_stock_price'] - 1
-    df_engineering['post_6m_price_return'] = df_engineering['post_6m_stock_price'] / df_engineering['price_at_announcement'] - 1
-    df_engineering['post_12m_price_return'] = df_engineering['post_12m_stock_price'] / df_engineering['price_at_announcement'] - 1
-    df_engineering['post_18m_price_return'] = df_engineering['post_18m_stock_price'] / df_engineering['price_at_announcement'] - 1
+    stock_price = read_block(list_price_specs, 'stock_price')
+    is_pre = np.array([spec['direction'] == 'pre' for spec in list_price_specs])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        price_return = np.where(is_pre, price_at_announcement / stock_price, stock_price / price_at_announcement) - 1
 
-    # campaign tactics
+    # residual returns, missing betas and market returns count as zero
+    logger.info('calculating residual returns')
+    market_return = np.nan_to_num(read_block(list_residual_specs, 'market_return'), nan=0)
+    beta = df_engineering.beta.fillna(0).to_numpy(dtype=float)[:, None]
+    residual_total_return = read_block(list_residual_specs, 'total_return')
+    residual_price_return = price_return[:, [list_price_specs.index(spec) for spec in list_residual_specs]]
+    residual_return = residual_total_return - market_return * beta
+
+    logger.info('coalescing residual, total and price returns')
+    residual_return = np.where(
+        np.isnan(residual_return),
+        np.where(np.isnan(residual_total_return), residual_price_return, residual_total_return),
+        residual_return
+    )
+
+    logger.info('converting all returns to monthly frequency returns')
+    price_return /= get_months(list_price_specs)
+    total_return = read_block(list_total_specs, 'total_return') / get_months(list_total_specs)
+    residual_return /= get_months(list_residual_specs)
+
+    logger.info('winsorizing returns')
+    dict_blocks = {
+        tuple(get_horizon_columns(list_specs, 'earnings_yield')): earnings_yield,
+        ('earnings_yield_at_announcement',): earnings_yield_at_announcement,
+        tuple(get_horizon_columns(list_price_specs, 'price_return')): price_return,
+        tuple(get_horizon_columns(list_total_specs, 'total_return')): total_return,
+        tuple(get_horizon_columns(list_residual_specs, 'market_return')): market_return,
+        ('beta',): beta,
+        tuple(get_horizon_columns(list_residual_specs, 'residual_return')): residual_return,
+    }
+    list_dividend_columns = [column for column in df_engineering.columns if 'dividend' in column]
+    if list_dividend_columns:
+        dict_blocks[tuple(list_dividend_columns)] = df_engineering[list_dividend_columns].to_numpy(dtype=float)
+
+    for columns, block in dict_blocks.items():
+        df_engineering = assign_block(df_engineering, list(columns), winsorize_block(columns, block))
+
+    # cumulative abnormal returns, for horizons with both a pre and post residual return
+    logger.info('calculating cumulative abnormal returns')
+    list_residual_columns = get_horizon_columns(list_residual_specs, 'residual_return')
+    list_cumulative_months = [
+        spec['months'] for spec in list_residual_specs
+        if spec['direction'] == 'post' and f"pre_{spec['months']}m_residual_return" in list_residual_columns
+    ]
+    df_engineering = assign_block(
+        df_engineering,
+        [f'cumulative_{months}m_residual_return' for months in list_cumulative_months],
+        df_engineering[[f'pre_{months}m_residual_return' for months in list_cumulative_months]].to_numpy(dtype=float) +
+        df_engineering[[f'post_{months}m_residual_return' for months in list_cumulative_months]].to_numpy(dtype=float)
+    )
+
+    return df_engineering
+
+def get_tactic_column(tactic):
+    # 'Letter to Stockholders' -> 'used_letter_to_stockholders_tactic'
+    return 'used_' + clean_column_name(tactic) + '_tactic'
+
+def calculate_campaign_tactics(df_engineering):
+    # one row per campaign and tactic, taken from the campaign's last row
     # originally provided as a single column with each value being a tuple of tactics
-    # explode this tuple into columns, then pivot so each tactic gets one column
-    # then create dummies for whether a tactic was used by an activist for a given campaign
-    # merge back onto the main data set
-    logger.info('calculating campaign tactics')
-    df_tactic = (
+    return (
         df_engineering
         .groupby('campaign_id')
         [
@@ -351,119 +873,21 @@ def engineer_features(df_factset_campaign_cleaned, df_factset_betas):
         .explode('activist_campaign_tactic')
         .assign(activist_campaign_tactic_indicator=1)
     )
-    df_tactics_indicators = (
-        pd.pivot_table(df_tactic, index=['campaign_id'], columns=['activist_campaign_tactic'], values='activist_campaign_tactic_indicator', fill_value=0)
-        .rename(columns=clean_column_name)
-        .rename(columns=lambda c: 'used_' + c + '_tactic')
-        .drop(columns=['used_unknown_tactic'])
-    )
-    df_engineering = pd.merge(
-        df_engineering, df_tactics_indicators,
-        on='campaign_id', how='left'
-    ) 
 
-    # betas
-    logger.info('calculating residual returns')
-    df_engineering = pd.merge(
-        df_engineering,
-        df_factset_betas[[
-            'campaign_id',
-            'company_id',
-            'pre_18m_market_return',
-            'pre_12m_market_return',
-            'pre_6m_market_return',
-            'post_6m_market_return',
-            'post_12m_market_return',
-            'post_18m_market_return',
-            'beta',
-        ]],
-        how='left',
-        on=['campaign_id', 'company_id']
+def calculate_tactic_indicators(df_tactic):
+    # pivot so each tactic gets one column, ordered by tactic name
+    # then create dummies for whether a tactic was used by an activist for a given campaign
+    return (
+        pd.pivot_table(df_tactic, index=['campaign_id'], columns=['activist_campaign_tactic'], values='activist_campaign_tactic_indicator', fill_value=0)
+        .rename(columns=get_tactic_column)
+        .drop(columns=['used_unknown_tactic'], errors='ignore')
     )
 
-    # clean market returns and beta when missing
-    for column in df_engineering.columns.tolist():
-        if 'market_return' in column:
-            df_engineering[column] = df_engineering[column].fillna(0)
-        if 'beta' in column:
-            df_engineering[column] = df_engineering[column].fillna(0)
-
-    df_engineering['pre_6m_residual_return'] = df_engineering['pre_6m_total_return'] - df_engineering['pre_6m_market_return'] * df_engineering['beta']
-    df_engineering['pre_12m_residual_return'] = df_engineering['pre_12m_total_return'] - df_engineering['pre_12m_market_return'] * df_engineering['beta']
-    df_engineering['pre_18m_residual_return'] = df_engineering['pre_18m_total_return'] - df_engineering['pre_18m_market_return'] * df_engineering['beta']    
-    df_engineering['post_6m_residual_return'] = df_engineering['post_6m_total_return'] - df_engineering['post_6m_market_return'] * df_engineering['beta']
-    df_engineering['post_12m_residual_return'] = df_engineering['post_12m_total_return'] - df_engineering['post_12m_market_return'] * df_engineering['beta']
-    df_engineering['post_18m_residual_return'] = df_engineering['post_18m_total_return'] - df_engineering['post_18m_market_return'] * df_engineering['beta']
-
-    # coalsece returns
-    logger.info('coalescing residual, total and price returns')
-    df_engineering['pre_6m_residual_return']   = df_engineering['pre_6m_residual_return'].fillna(df_engineering['pre_6m_total_return'].fillna(df_engineering['pre_6m_price_return']))  
-    df_engineering['pre_12m_residual_return']  = df_engineering['pre_12m_residual_return'].fillna(df_engineering['pre_12m_total_return'].fillna(df_engineering['pre_12m_price_return'])) 
-    df_engineering['pre_18m_residual_return']  = df_engineering['pre_18m_residual_return'].fillna(df_engineering['pre_18m_total_return'].fillna(df_engineering['pre_18m_price_return'])) 
-    df_engineering['post_6m_residual_return']  = df_engineering['post_6m_residual_return'].fillna(df_engineering['post_6m_total_return'].fillna(df_engineering['post_6m_price_return'])) 
-    df_engineering['post_12m_residual_return'] = df_engineering['post_12m_residual_return'].fillna(df_engineering['post_12m_total_return'].fillna(df_engineering['post_12m_price_return']))
-    df_engineering['post_18m_residual_return'] = df_engineering['post_18m_residual_return'].fillna(df_engineering['post_18m_total_return'].fillna(df_engineering['post_18m_price_return']))
-
-    # annualize
-    logger.info('converting all returns to monthly frequency returns')
-
-    df_engineering['pre_18m_price_return'] = df_engineering['pre_18m_price_return'] / 18
-    df_engineering['pre_12m_price_return'] = df_engineering['pre_12m_price_return'] / 12
-    df_engineering['pre_6m_price_return'] = df_engineering['pre_6m_price_return'] / 6
-    df_engineering['pre_3m_price_return'] = df_engineering['pre_3m_price_return'] / 3
-    df_engineering['post_6m_price_return'] = df_engineering['post_6m_price_return'] / 3
-    df_engineering['post_12m_price_return'] = df_engineering['post_12m_price_return'] / 12
-    df_engineering['post_18m_price_return'] = df_engineering['post_18m_price_return'] / 18
-
-    df_engineering['pre_18m_total_return'] = df_engineering['pre_18m_total_return'] / 18
-    df_engineering['pre_12m_total_return'] = df_engineering['pre_12m_total_return'] / 12
-    df_engineering['pre_6m_total_return'] = df_engineering['pre_6m_total_return'] / 6
-    df_engineering['pre_3m_total_return'] = df_engineering['pre_3m_total_return'] / 3
-    df_engineering['post_6m_total_return'] = df_engineering['post_6m_total_return'] / 6
-    df_engineering['post_12m_total_return'] = df_engineering['post_12m_total_return'] / 12
-    df_engineering['post_18m_total_return'] = df_engineering['post_18m_total_return'] / 18
-
-    df_engineering['pre_18m_residual_return'] = df_engineering['pre_18m_residual_return'] / 18
-    df_engineering['pre_12m_residual_return'] = df_engineering['pre_12m_residual_return'] / 12
-    df_engineering['pre_6m_residual_return'] = df_engineering['pre_6m_residual_return'] / 6
-    df_engineering['post_6m_residual_return'] = df_engineering['post_6m_residual_return'] / 6
-    df_engineering['post_12m_residual_return'] = df_engineering['post_12m_residual_return'] / 12
-    df_engineering['post_18m_residual_return'] = df_engineering['post_18m_residual_return'] / 18
-
-    # winsorize
-
-    logger.info('winsorizing returns')
-
-    # clean market returns and beta when missing
-    for column in df_engineering.columns.tolist():
-        if 'return' in column:
-            df_engineering[column] = df_engineering[column].clip(-1, 2)
-        if 'earnings_yield' in column:
-            df_engineering[column] = df_engineering[column].clip(-1, 2)
-        if 'dividend' in column:
-            df_engineering[column] = df_engineering[column].clip(0, 1)
-
-    # for horizon in ['3m', '6m', '12m', '18m']:
-    #     for direction in ['pre', 'post']:
-    #         for return_type in ['price_return', 'total_return', 'residual_return']:
-    #             return_column = f'{direction}_{horizon}_{return_type}_return'
-    #             try:
-    #                 df_engineering[return_column] = df_engineering[return_column].clip(-1, 2)
-    #             except:
-    #                 pass
-
-    # cumulative abnormal returns
-    logger.info('calculating cumulative abnormal returns')
-    df_engineering['cumulative_6m_residual_return'] = df_engineering['pre_6m_residual_return'] + df_engineering['post_6m_residual_return']
-    df_engineering['cumulative_12m_residual_return'] = df_engineering['pre_12m_residual_return'] + df_engineering['post_12m_residual_return']
-    df_engineering['cumulative_18m_residual_return'] = df_engineering['pre_18m_residual_return'] + df_engineering['post_18m_residual_return']
-
-   # past successes
+@instrumented
+def calculate_cumulative_successes(df_engineering):
     # create a simple measure of success like whether one year future returns were positive
     # count the cumulative successes by activist
     # make sure to lag our knowledge of successes by more than one year to ensure no look-ahead bias
-    # merge back onto the main data set
-    logger.info('calculating past successes')
     df_successes = (
         df_engineering
         .assign(is_return_success=lambda df: 1 * (
@@ -483,15 +907,19 @@ def engineer_features(df_factset_campaign_cleaned, df_factset_betas):
         .assign(past_return_successes=lambda df: df.groupby(['activist_id']).is_return_success.cumsum())
         .assign(lagged_campaign_announcement_date=lambda df: df.campaign_announcement_date + pd.offsets.DateOffset(365))
     )
-    df_engineering = pd.merge_asof(
-        df_engineering.sort_values('campaign_announcement_date'),
+    return df_cumulative_successes
+
+def merge_past_successes(df_engineering, df_cumulative_successes):
+    # the stable sort keeps rows with the same announcement date in their original order,
+    # so the output order is reproducible (see update_engineered_features)
+    return pd.merge_asof(
+        df_engineering.sort_values('campaign_announcement_date', kind='mergesort'),
         df_cumulative_successes[['activist_id', 'lagged_campaign_announcement_date', 'past_return_successes']].sort_values('lagged_campaign_announcement_date'),
         by=['activist_id'], left_on=['campaign_announcement_date'], right_on=['lagged_campaign_announcement_date']
     )
 
-    # calculating board seat features
-    logger.info('calculating board seat features')
-    df_engineering = (
+def engineer_board_seat_features(df_engineering):
+    return (
         df_engineering
         .assign(board_seats_percentage_sought=lambda df: np.where(
             df.total_number_of_board_seats > 0,
@@ -519,21 +947,486 @@ def engineer_features(df_factset_campaign_cleaned, df_factset_betas):
         ))
     )
 
+# mapping tables
+# each maps the values of a factset column to a short code and a group, (Missing) is the group of
+# values without one like '13D Filer - No Publicly Disclosed Activism'
+dict_mapping_tables = {
+    'campaign_objective': {'mapping_path': 'mapping/campaign_mapping.csv', 'column': 'campaign_objective_primary', 'group_column': 'campaign_objective_group', 'separator': None},
+    'value_demand': {'mapping_path': 'mapping/value_demand_mapping.csv', 'column': 'value_demand', 'group_column': 'value_demand_group', 'separator': None},
+    'governance_demand': {'mapping_path': 'mapping/governance_demand_mapping.csv', 'column': 'governance_demand', 'group_column': 'governance_demand_group', 'separator': None},
+    'proxy_result': {'mapping_path': 'mapping/proxy_result_mapping.csv', 'column': 'proxy_campaign_winner_or_result', 'group_column': 'proxy_result_group', 'separator': None},
+    # a campaign lists all of its tactics in one value
+    'tactic': {'mapping_path': 'mapping/tactic_mapping.csv', 'column': 'activist_campaign_tactic', 'group_column': 'activist_campaign_tactic_group', 'separator': ', '},
+}
 
+def read_mapping_tables(list_names=None):
+    return {
+        name: pd.read_csv(dict_mapping_tables[name]['mapping_path'], encoding='utf-8-sig').drop_duplicates(dict_mapping_tables[name]['column'])
+        for name in list_names or dict_mapping_tables
+    }
+
+def get_mapping_values(df, name):
+    # each row's values indexed by row position, with a separator (like for tactics) a row has one entry per value
+    dict_table = dict_mapping_tables[name]
+    sr_values = pd.Series(df[dict_table['column']].values)
+    if dict_table['separator']:
+        sr_values = sr_values.str.split(dict_table['separator']).explode()
+    return sr_values
+
+# activist history features
+# for each family of groups (objectives, tactics, value and governance demands), the share of each group
+# among the activist's earlier campaign rows, announced strictly before the row's own announcement
+# values mapped to (Missing) do not count
+# ratio column prefix to mapping table
+dict_history_groups = {
+    'objective': 'campaign_objective',
+    'tactic': 'tactic',
+    'value_demand': 'value_demand',
+    'governance_demand': 'governance_demand',
+}
+
+def read_history_mappings():
+    # value to group for each family
+    dict_mapping_frames = read_mapping_tables(list(dict_history_groups.values()))
+    return {
+        prefix: (
+            dict_mapping_frames[name]
+            .loc[lambda df: df[dict_mapping_tables[name]['group_column']] != '(Missing)']
+            .set_index(dict_mapping_tables[name]['column'])
+            [dict_mapping_tables[name]['group_column']]
+        )
+        for prefix, name in dict_history_groups.items()
+    }
+
+def get_history_ratio_column(prefix, group):
+    # ('objective', 'Block M&A') -> 'ratio_objective_block_m_and_a'
+    return f'ratio_{prefix}_' + clean_column_name(group).replace('&', '_and_')
+
+def calculate_history_ratios(df, sr_groups, list_groups):
+    # counts each group by activist and announcement date, accumulates them over the activist's dates
+    # and subtracts the date itself, so rows see neither later campaigns nor those announced the same day
+    # rows without an activist or date have no history and all ratios are zero without any history
+    df_row_counts = (
+        pd.get_dummies(pd.Categorical(sr_groups.values, categories=list_groups))
+        .groupby(sr_groups.index.values).sum()
+        .reindex(np.arange(len(df)), fill_value=0)
+    )
+    list_keys = [df.activist_id.values, df.campaign_announcement_date.values]
+    df_date_counts = df_row_counts.groupby(list_keys).sum()
+    df_before_counts = df_date_counts.groupby(level=0).cumsum() - df_date_counts
+    before_counts = df_before_counts.reindex(pd.MultiIndex.from_arrays(list_keys)).fillna(0).to_numpy(dtype=float)
+    totals = before_counts.sum(axis=1, keepdims=True)
+    return np.divide(before_counts, totals, out=np.zeros_like(before_counts), where=totals > 0)
+
+def engineer_history_features(df_engineering, dict_history_mappings):
+    # ratio_<family>_<group> columns for every group in the mappings, ordered by group
+    for prefix, name in dict_history_groups.items():
+        sr_mapping = dict_history_mappings[prefix]
+        list_groups = sorted(sr_mapping.unique())
+        df_engineering = assign_block(
+            df_engineering,
+            [get_history_ratio_column(prefix, group) for group in list_groups],
+            calculate_history_ratios(
+                df_engineering,
+                get_mapping_values(df_engineering, name).map(sr_mapping).dropna(),
+                list_groups
+            )
+        )
     return df_engineering
 
-def read_table(file_path):
-    logger.info(f'writing to {file_path}')
-    df = pd.read_csv(file_path)
+# mapping encoding
+# rather than merging each mapping on strings, values are dictionary-encoded once: a value's code is its
+# row in the mapping table, and a take through the table's group codes gives its group code
+# group vocabularies start with (Missing), for values without a group or not in the mapping, followed
+# by the groups by name
+
+def get_group_vocabulary(df_mapping, group_column):
+    return ['(Missing)'] + sorted(set(df_mapping[group_column].dropna()) - {'(Missing)'})
+
+def encode_mapping_groups(values, df_mapping, column, group_column, list_vocabulary):
+    value_codes = pd.Categorical(values, categories=df_mapping[column]).codes
+    # code -1 (not in the mapping) takes the appended last entry
+    mapping_group_codes = np.append(np.maximum(pd.Categorical(df_mapping[group_column], categories=list_vocabulary).codes, 0), 0)
+    return mapping_group_codes.take(value_codes)
+
+def build_design_matrix(n_rows, list_encodings, is_sparse=False):
+    # one-hot <name>=<group> columns of every encoding, allocated once as uint8 (or a scipy sparse matrix)
+    # list_encodings has (name, vocabulary, row positions, group codes), a row with several values
+    # (like tactics) has a one for each of their groups
+    list_columns = [f'{name}={group}' for name, list_vocabulary, _, _ in list_encodings for group in list_vocabulary]
+    offsets = np.cumsum([0] + [len(list_vocabulary) for _, list_vocabulary, _, _ in list_encodings])
+    rows = np.concatenate([row_positions for _, _, row_positions, _ in list_encodings])
+    columns = np.concatenate([offset + group_codes for offset, (_, _, _, group_codes) in zip(offsets, list_encodings)])
+    if is_sparse:
+        design_matrix = sparse.csr_matrix((np.ones(len(rows), dtype=np.uint8), (rows, columns)), shape=(n_rows, len(list_columns)))
+        design_matrix.data[:] = 1
+    else:
+        design_matrix = np.zeros((n_rows, len(list_columns)), dtype=np.uint8)
+        design_matrix[rows, columns] = 1
+    return design_matrix, list_columns
+
+@instrumented
+def encode_mappings(df, dict_mapping_frames=None):
+    # returns three tables:
+    # df_encoded, campaign_id and a categorical <name>_group column for each single valued mapping
+    # df_design_matrix, campaign_id and the uint8 one-hot columns of every mapping, see build_design_matrix
+    # df_vocabularies, the code of every group by mapping
+    # both are row by row with df
+    dict_mapping_frames = dict_mapping_frames or read_mapping_tables()
+    list_encodings = []
+    for name, dict_table in dict_mapping_tables.items():
+        df_mapping = dict_mapping_frames[name]
+        list_vocabulary = get_group_vocabulary(df_mapping, dict_table['group_column'])
+        sr_values = get_mapping_values(df, name)
+        group_codes = encode_mapping_groups(sr_values.values, df_mapping, dict_table['column'], dict_table['group_column'], list_vocabulary)
+        list_encodings.append((name, list_vocabulary, sr_values.index.values, group_codes))
+
+    df_encoded = pd.DataFrame({'campaign_id': df.campaign_id.values})
+    for name, list_vocabulary, _, group_codes in list_encodings:
+        if not dict_mapping_tables[name]['separator']:
+            df_encoded[f'{name}_group'] = pd.Categorical.from_codes(group_codes, categories=list_vocabulary)
+
+    design_matrix, list_columns = build_design_matrix(len(df), list_encodings)
+    df_design_matrix = pd.DataFrame(design_matrix, columns=list_columns)
+    df_design_matrix.insert(0, 'campaign_id', df.campaign_id.values)
+
+    df_vocabularies = pd.DataFrame(
+        [(name, code, group) for name, list_vocabulary, _, _ in list_encodings for code, group in enumerate(list_vocabulary)],
+        columns=['mapping', 'code', 'group']
+    )
+    return df_encoded, df_design_matrix, df_vocabularies
+
+# compact dtypes
+# the engineered table is stored with the dtypes of mapping/column_mapping.csv's storage_type column:
+# repeated strings as categoricals, returns and ratios as float32, counts as nullable small integers
+# and tactic indicators as uint8, a column_name can be an fnmatch pattern like ratio_* for families of
+# columns whose names depend on the data
+# every compacted column is checked to hold the same values, and expand_dtypes turns a stored table
+# back into the dtypes the pipeline computes with
+column_schema_path = 'mapping/column_mapping.csv'
+
+def read_column_schema(schema_path=column_schema_path):
+    # column name or pattern to storage type, in file order
+    return (
+        pd.read_csv(schema_path, encoding='utf-8-sig')
+        .dropna(subset=['storage_type'])
+        .set_index('column_name')
+        .storage_type
+        .to_dict()
+    )
+
+def get_storage_type(column, dict_schema):
+    # exact names first, then the first pattern that matches, None for columns not in the schema
+    if column in dict_schema:
+        return dict_schema[column]
+    return next((storage_type for pattern, storage_type in dict_schema.items() if fnmatch.fnmatchcase(column, pattern)), None)
+
+def check_compact_column(sr, sr_compact):
+    # what changed when compacting, None when the values are the same
+    # float32 keeps about 7 significant digits, anything more is an overflow or a wrong storage type
+    is_missing = sr.isna().to_numpy()
+    if not np.array_equal(is_missing, sr_compact.isna().to_numpy()):
+        return 'missing values changed'
+    if pd.api.types.is_datetime64_any_dtype(sr_compact):
+        return None
+    if pd.api.types.is_numeric_dtype(sr_compact) and not pd.api.types.is_bool_dtype(sr_compact):
+        values = sr.to_numpy(dtype=float, na_value=np.nan)[~is_missing]
+        compact_values = sr_compact.to_numpy(dtype=float, na_value=np.nan)[~is_missing]
+        if sr_compact.dtype == 'float32':
+            is_same = np.isclose(compact_values, values, rtol=np.finfo('float32').eps, atol=np.finfo('float32').tiny)
+        else:
+            is_same = compact_values == values
+    else:
+        is_same = sr_compact.to_numpy(dtype=object)[~is_missing] == sr.to_numpy(dtype=object)[~is_missing]
+    if not is_same.all():
+        return f'{(~is_same).sum()} values changed, e.g. {sr.to_numpy()[~is_missing][~is_same][0]!r}'
+    return None
+
+def compact_dtypes(df, dict_schema=None, table_name='table'):
+    # df with every column in the schema cast to its storage type, columns not in it are kept as they are
+    # raises a ValueError listing the columns whose values do not fit their storage type
+    dict_schema = dict_schema or read_column_schema()
+    df_compact = df.copy()
+    list_errors = []
+    list_unknown_columns = []
     for column in df.columns:
-        if 'date' in column:
-            df[column] = pd.to_datetime(df[column], infer_datetime_format=True)
-    return df
+        storage_type = get_storage_type(column, dict_schema)
+        if storage_type is None:
+            list_unknown_columns.append(column)
+            continue
+        try:
+            df_compact[column] = df[column].astype(storage_type)
+        except (TypeError, ValueError) as error:
+            list_errors.append(f'{column} ({storage_type}): {error}')
+            continue
+        error = check_compact_column(df[column], df_compact[column])
+        if error:
+            list_errors.append(f'{column} ({storage_type}): {error}')
+    if list_errors:
+        raise ValueError(f'{table_name} does not fit the storage types of {column_schema_path}:\n' + '\n'.join(list_errors))
+    if list_unknown_columns:
+        logger.warning(f'{table_name} columns not in {column_schema_path} are stored as they are: {list_unknown_columns}')
+
+    memory_mb = df.memory_usage(deep=True).sum() / 1024 ** 2
+    compact_memory_mb = df_compact.memory_usage(deep=True).sum() / 1024 ** 2
+    logger.info(f'compacted {table_name} from {memory_mb:.1f}MB to {compact_memory_mb:.1f}MB')
+    return df_compact
+
+def expand_dtypes(df):
+    # the dtypes engineer_features computes with: categoricals as object, float32 and nullable integers
+    # as float64 and uint8 indicators as int64, the values are the same
+    dict_dtypes = {}
+    for column, dtype in df.dtypes.items():
+        if isinstance(dtype, pd.CategoricalDtype):
+            dict_dtypes[column] = object
+        elif dtype == 'float32' or (isinstance(dtype, pd.api.extensions.ExtensionDtype) and dtype.kind in 'iu'):
+            dict_dtypes[column] = 'float64'
+        elif dtype == 'uint8':
+            dict_dtypes[column] = 'int64'
+    return df.astype(dict_dtypes)
+
+@instrumented
+def engineer_features(df_factset_campaign_cleaned, df_factset_betas, beta_column='beta', dict_history_mappings=None):
+
+    # beta_column picks the beta used for residual returns, e.g. an estimation window beta like beta_m250_m30
+    # dict_history_mappings defaults to the mapping files, see read_history_mappings
 
-def write_table(df, file_path):
-    logger.info(f'writing to {file_path}')
-    df.to_csv(file_path, index=False)
-    return
+    df_engineering = df_factset_campaign_cleaned.copy()
+
+    # campaign tactics
+    # explode the tactics into one row per tactic, pivot to dummies and merge back onto the main data set
+    logger.info('calculating campaign tactics')
+    df_tactics_indicators = calculate_tactic_indicators(calculate_campaign_tactics(df_engineering))
+    df_engineering = pd.merge(
+        df_engineering, df_tactics_indicators,
+        on='campaign_id', how='left'
+    ) 
+
+    # betas
+    logger.info('merging betas and market returns')
+    df_engineering = pd.merge(
+        df_engineering,
+        df_factset_betas.assign(beta=lambda df: df[beta_column])[
+            ['campaign_id', 'company_id'] +
+            get_horizon_columns(get_horizon_specs(list_horizon_specs, 'residual_return'), 'market_return') +
+            ['beta']
+        ],
+        how='left',
+        on=['campaign_id', 'company_id']
+    )
+
+    # earnings yields, returns by horizon and cumulative abnormal returns
+    df_engineering = engineer_horizon_features(df_engineering)
+
+    # past successes, merged back onto the main data set
+    logger.info('calculating past successes')
+    df_engineering = merge_past_successes(df_engineering, calculate_cumulative_successes(df_engineering))
+
+    # calculating board seat features
+    logger.info('calculating board seat features')
+    df_engineering = engineer_board_seat_features(df_engineering)
+
+    # activist history ratios
+    logger.info('calculating activist history features')
+    df_engineering = engineer_history_features(df_engineering, dict_history_mappings or read_history_mappings())
+
+    return df_engineering
+
+# incremental updates
+# a refresh only recomputes the campaign_ids whose inputs changed since the stored tables were written
+# each campaign_id gets a fingerprint hashing everything its outputs depend on, and the stored
+# fingerprints are compared against the current ones
+# outputs are identical to a full rebuild: rows, order, columns and values
+
+def get_campaign_fingerprints(df, columns, salt):
+    # one uint64 per campaign_id over its rows in order
+    # salt covers what applies to every campaign, like parameters and the code version
+    row_hashes = pd.util.hash_pandas_object(
+        df[columns].assign(
+            campaign_row_number=df.groupby('campaign_id', dropna=False).cumcount().values,
+            salt=salt
+        ),
+        index=False
+    )
+    # sums of uint64 wrap around, which is fine for hashes
+    return row_hashes.groupby(df.campaign_id.values, dropna=False).sum().rename_axis('campaign_id').rename('fingerprint')
+
+def get_changed_campaign_ids(sr_fingerprints, sr_stored_fingerprints):
+    # new, changed and removed campaign_ids
+    list_changed_ids = sr_fingerprints.index[sr_fingerprints.ne(sr_stored_fingerprints.reindex(sr_fingerprints.index))]
+    list_removed_ids = sr_stored_fingerprints.index.difference(sr_fingerprints.index)
+    return list_changed_ids.append(list_removed_ids)
+
+def read_fingerprints(table_path):
+    return read_table(table_path).set_index('campaign_id').fingerprint
+
+@instrumented
+def get_betas_fingerprints(df_factset_campaign, df_factset_pricing, df_yahoo_finance_pricing, estimation_windows, salt):
+
+    # a campaign row's betas depend on its window dates and on the pricing rows from the start of its
+    # estimation windows (or pre_18m) to the end of its pre_18m..post_18m window (or estimation windows),
+    # so only those rows are hashed: prices appended after a campaign's windows leave it unchanged
+
+    company_codes, _ = pd.factorize(
+        pd.concat([df_factset_pricing.company_id.astype(object), df_factset_campaign.company_id.astype(object)], ignore_index=True),
+        sort=True
+    )
+    pricing_codes = company_codes[:len(df_factset_pricing)]
+    campaign_codes = company_codes[len(df_factset_pricing):]
+    pricing_order = np.lexsort((df_factset_pricing.date.values, pricing_codes))
+    pricing_codes = pricing_codes[pricing_order]
+    pricing_dates = df_factset_pricing.date.values[pricing_order]
+
+    sr_market_returns = df_yahoo_finance_pricing.drop_duplicates('date').set_index('date').sp_daily_return
+    pricing_hashes = pd.util.hash_pandas_object(
+        pd.DataFrame({
+            'date': pricing_dates,
+            'stock_daily_return': df_factset_pricing.stock_daily_return.values.astype(float)[pricing_order],
+            'sp_daily_return': pd.Series(pricing_dates).map(sr_market_returns).values.astype(float),
+        }),
+        index=False
+    ).values
+    cumulative_hashes = np.concatenate([np.zeros(1, dtype='uint64'), np.cumsum(pricing_hashes, dtype='uint64')])
+
+    # the rows spanned by the pre_18m..post_18m window and by every estimation window, see
+    # calculate_betas and calculate_partition_estimation_betas
+    window_left, window_right = locate_windows(
+        pricing_codes, pricing_dates, campaign_codes,
+        df_factset_campaign.pre_18m_announcement_date.values,
+        df_factset_campaign.post_18m_announcement_date.values
+    )
+    announcement_dates = df_factset_campaign.campaign_announcement_date.values
+    announcement_row, _ = locate_windows(pricing_codes, pricing_dates, campaign_codes, announcement_dates, announcement_dates)
+    company_left = np.searchsorted(pricing_codes, campaign_codes, side='left')
+    company_right = np.searchsorted(pricing_codes, campaign_codes, side='right')
+    offsets = np.array([0] + [offset for window in estimation_windows for offset in window])
+    left = np.clip(announcement_row + offsets.min(), company_left, company_right)
+    right = np.clip(announcement_row + offsets.max() + 1, company_left, company_right)
+    has_window = window_right > window_left
+    left = np.where(has_window, np.minimum(left, window_left), left)
+    right = np.where(has_window, np.maximum(right, window_right), right)
+
+    df_hashed = (
+        df_factset_campaign[['campaign_id', 'company_id'] + list_campaign_window_columns]
+        .assign(pricing_hash=cumulative_hashes[right] - cumulative_hashes[left])
+    )
+    return get_campaign_fingerprints(df_hashed, df_hashed.columns.tolist(), salt)
+
+@instrumented
+def get_engineering_fingerprints(df_factset_campaign_cleaned, df_factset_betas, beta_column, salt):
+    # a campaign's features depend on its cleaned rows and its betas and market returns,
+    # past successes are handled separately by activist
+    df_hashed = pd.merge(
+        df_factset_campaign_cleaned,
+        df_factset_betas[
+            ['campaign_id', 'company_id'] +
+            get_horizon_columns(get_horizon_specs(list_horizon_specs, 'residual_return'), 'market_return') +
+            [beta_column]
+        ],
+        how='left',
+        on=['campaign_id', 'company_id']
+    )
+    return get_campaign_fingerprints(df_hashed, df_hashed.columns.tolist(), salt)
+
+def get_tactic_columns(df_factset_campaign_cleaned):
+    # tactic name to column, for the tactics of every campaign
+    return (
+        calculate_campaign_tactics(df_factset_campaign_cleaned)
+        [['activist_campaign_tactic']]
+        .drop_duplicates()
+        .loc[lambda df: df.activist_campaign_tactic != 'Unknown']
+        .assign(column=lambda df: df.activist_campaign_tactic.map(get_tactic_column))
+        .reset_index(drop=True)
+    )
+
+@instrumented
+def update_engineered_features(df_factset_campaign_cleaned, df_factset_betas, df_engineered, df_cumulative_successes, df_tactic_columns, changed_ids, beta_column='beta', dict_history_mappings=None):
+
+    # upserts the features of changed_ids into df_engineered, as engineered by engineer_features
+    # df_cumulative_successes (per activist cumulative successes) and df_tactic_columns (tactic name to
+    # column, for every tactic seen so far) are the state kept from the previous update
+    # only activists with a changed campaign get their past successes recalculated, history ratios are
+    # recalculated for every row since they are cheap and also depend on the mappings
+
+    df_changed = df_factset_campaign_cleaned.loc[lambda df: df.campaign_id.isin(changed_ids)]
+    df_kept = df_engineered.loc[lambda df: ~df.campaign_id.isin(changed_ids)]
+    logger.info(f'updating {df_changed.campaign_id.nunique()} of {df_factset_campaign_cleaned.campaign_id.nunique()} campaigns')
+
+    dict_history_mappings = dict_history_mappings or read_history_mappings()
+    list_parts = [df_kept]
+    list_affected_activists = df_engineered.loc[lambda df: df.campaign_id.isin(changed_ids), 'activist_id'].tolist()
+    if len(df_changed):
+        df_changed_engineered = engineer_features(
+            df_changed,
+            df_factset_betas.loc[lambda df: df.campaign_id.isin(changed_ids)],
+            beta_column=beta_column, dict_history_mappings=dict_history_mappings
+        )
+        df_tactic_columns = (
+            pd.concat([df_tactic_columns, get_tactic_columns(df_changed)], ignore_index=True)
+            .drop_duplicates('activist_campaign_tactic')
+        )
+        list_parts.append(df_changed_engineered)
+        list_affected_activists += df_changed.activist_id.tolist()
+    df_template = list_parts[-1]
+
+    # tactics columns only exist for tactics some campaign uses, ordered by tactic name
+    df_engineering = pd.concat(list_parts, ignore_index=True)
+    list_known_tactic_columns = df_tactic_columns.sort_values('activist_campaign_tactic').column.drop_duplicates().tolist()
+    list_tactic_columns = []
+    for column in list_known_tactic_columns:
+        if column in df_engineering.columns:
+            df_engineering[column] = df_engineering[column].fillna(0).astype('int64')
+            if df_engineering[column].any():
+                list_tactic_columns.append(column)
+    list_columns = df_factset_campaign_cleaned.columns.tolist() + list_tactic_columns + [
+        column for column in df_template.columns
+        if column not in df_factset_campaign_cleaned.columns and column not in list_known_tactic_columns
+    ]
+
+    # a row is identified by its campaign_id and its position among the campaign's cleaned rows
+    # every part keeps the cleaned order within each campaign, so rows can be put back in the order
+    # of a full rebuild: cleaned order, then stably sorted by announcement date as in merge_past_successes
+    sr_clean_rows = pd.Series(
+        np.arange(len(df_factset_campaign_cleaned)),
+        index=pd.MultiIndex.from_arrays([
+            df_factset_campaign_cleaned.campaign_id.values,
+            df_factset_campaign_cleaned.groupby('campaign_id', dropna=False).cumcount().values
+        ])
+    )
+    df_engineering = df_engineering.loc[:, list_columns].assign(clean_row=sr_clean_rows.reindex(pd.MultiIndex.from_arrays([
+        df_engineering.campaign_id.values,
+        df_engineering.groupby('campaign_id', dropna=False).cumcount().values
+    ])).values)
+    def sort_like_rebuild(df):
+        return (
+            df
+            .sort_values('clean_row', kind='mergesort')
+            .sort_values('campaign_announcement_date', kind='mergesort')
+        )
+
+    # past successes are cumulative by activist, so every campaign of an affected activist is redone
+    is_affected = df_engineering.activist_id.isin(list_affected_activists)
+    df_affected = sort_like_rebuild(df_engineering.loc[is_affected].drop(columns=['lagged_campaign_announcement_date', 'past_return_successes']))
+    df_affected_successes = calculate_cumulative_successes(df_affected)
+    df_cumulative_successes = (
+        pd.concat([df_cumulative_successes.loc[lambda df: ~df.activist_id.isin(list_affected_activists)], df_affected_successes], ignore_index=True)
+        .sort_values(['activist_id', 'campaign_announcement_date'])
+        .reset_index(drop=True)
+    )
+    df_affected = merge_past_successes(df_affected, df_affected_successes)
+
+    df_engineering = (
+        sort_like_rebuild(pd.concat([df_engineering.loc[~is_affected], df_affected], ignore_index=True))
+        .loc[:, list_columns]
+        .reset_index(drop=True)
+    )
+    # dropped first so they come last in the same order as a rebuild even when a mapping gained a group
+    df_engineering = engineer_history_features(
+        df_engineering.drop(columns=[column for column in df_engineering.columns if column.startswith(tuple(f'ratio_{prefix}_' for prefix in dict_history_groups))]),
+        dict_history_mappings
+    )
+
+    return df_engineering, df_cumulative_successes, df_tactic_columns
 
 def h1(x):
     return '\n'.join([
@@ -543,58 +1436,404 @@ def h1(x):
         ''
     ])
 
-def main():
-
-    logging.basicConfig(
-        level=logging.DEBUG,
-        format='%(asctime)s %(levelname)s [%(name)s] %(message)s'
+def run_read_stage():
+    df_factset_campaign = read_factset_campaign_data()
+
+    # only pricing for companies with a campaign is kept while reading
+    company_ids = clean_factset_campaign_data(df_factset_campaign).company_id
+    df_factset_pricing = read_factset_pricing_data(company_ids=company_ids)
+    df_yahoo_finance_pricing = read_yahoo_finance_pricing_data()
+
+    # raw excel columns can mix types, pickle stores them as they are
+    write_table(df_factset_campaign, 'data/raw_factset_campaign', table_format='pickle')
+    write_table(df_factset_pricing, 'data/raw_factset_pricing', table_format='pickle')
+    write_table(df_yahoo_finance_pricing, 'data/raw_yahoo_finance_pricing', table_format='pickle')
+
+def run_clean_stage():
+    df_factset_campaign = read_table('data/raw_factset_campaign')
+    df_factset_pricing = read_table('data/raw_factset_pricing')
+    df_yahoo_finance_pricing = read_table('data/raw_yahoo_finance_pricing')
+
+    df_factset_campaign_cleaned = clean_factset_campaign_data(df_factset_campaign)
+    df_factset_pricing_cleaned = clean_factset_pricing_data(df_factset_pricing, df_factset_campaign_cleaned)
+    df_yahoo_finance_pricing_cleaned = clean_yahoo_finance_pricing_data(df_yahoo_finance_pricing)
+
+    write_table(df_factset_campaign_cleaned, 'data/clean_factset_campaign')
+    write_table(df_factset_pricing_cleaned, 'data/clean_factset_pricing', dtypes={'company_id': 'category', 'price': 'float32'})
+    write_table(df_yahoo_finance_pricing_cleaned, 'data/clean_yahoo_finance_pricing')
+
+def calculate_campaign_betas(df_factset_campaign, df_factset_pricing, df_yahoo_finance_pricing, estimation_windows, min_observations, n_workers=1):
+    df_factset_betas = calculate_betas(df_factset_campaign, df_factset_pricing, df_yahoo_finance_pricing, n_workers=n_workers)
+    df_factset_estimation_betas = calculate_estimation_window_betas(
+        df_factset_campaign, df_factset_pricing, df_yahoo_finance_pricing,
+        estimation_windows=[tuple(window) for window in estimation_windows], min_observations=min_observations, n_workers=n_workers
     )
+    return pd.merge(df_factset_betas, df_factset_estimation_betas, how='left', on=['campaign_id', 'company_id'])
 
-    if True:
-
-        print(h1('reading raw data'))
-        df_factset_campaign = read_factset_campaign_data()
-        df_factset_pricing = read_factset_pricing_data()
-        df_yahoo_finance_pricing = read_yahoo_finance_pricing_data()
-
-        print(h1('cleaning data'))
-        df_factset_campaign_cleaned = clean_factset_campaign_data(df_factset_campaign)
-        df_factset_pricing_cleaned = clean_factset_pricing_data(df_factset_pricing, df_factset_campaign_cleaned)
-        df_yahoo_finance_pricing_cleaned = clean_yahoo_finance_pricing_data(df_yahoo_finance_pricing)
-
-        print(h1('writing clean data'))
-        write_table(df_factset_campaign_cleaned, 'data/clean_factset_campaign.csv')
-        write_table(df_factset_pricing_cleaned, 'data/clean_factset_pricing.csv')
-        write_table(df_yahoo_finance_pricing_cleaned, 'data/clean_yahoo_finance_pricing.csv')
+def run_betas_stage(estimation_windows, min_observations, n_workers=1, incremental=False):
+    df_factset_campaign_cleaned = read_table('data/clean_factset_campaign')
+    df_factset_pricing_cleaned = read_table('data/clean_factset_pricing')
+    df_yahoo_finance_pricing_cleaned = read_table('data/clean_yahoo_finance_pricing')
 
-    if False:
+    # incremental only recomputes campaigns whose windows or pricing changed since the stored betas
+    sr_fingerprints = get_betas_fingerprints(
+        df_factset_campaign_cleaned, df_factset_pricing_cleaned, df_yahoo_finance_pricing_cleaned, estimation_windows,
+        salt=json.dumps([estimation_windows, min_observations, get_code_version(run_betas_stage)])
+    )
+    if incremental and table_exists('data/factset_betas') and table_exists('data/factset_betas_fingerprints'):
+        changed_ids = get_changed_campaign_ids(sr_fingerprints, read_fingerprints('data/factset_betas_fingerprints'))
+        logger.info(f'recalculating betas of {len(changed_ids)} changed campaigns')
+        list_parts = [read_table('data/factset_betas').loc[lambda df: ~df.campaign_id.isin(changed_ids)]]
+        df_changed = df_factset_campaign_cleaned.loc[lambda df: df.campaign_id.isin(changed_ids)]
+        if len(df_changed):
+            list_parts.append(calculate_campaign_betas(
+                df_changed, df_factset_pricing_cleaned, df_yahoo_finance_pricing_cleaned,
+                estimation_windows, min_observations, n_workers=n_workers
+            ))
+        df_factset_betas = (
+            pd.concat(list_parts, ignore_index=True)
+            .sort_values(['campaign_id', 'company_id'])
+            .reset_index(drop=True)
+        )
+    else:
+        df_factset_betas = calculate_campaign_betas(
+            df_factset_campaign_cleaned, df_factset_pricing_cleaned, df_yahoo_finance_pricing_cleaned,
+            estimation_windows, min_observations, n_workers=n_workers
+        )
 
-        print(h1('reading clean data'))
-        df_factset_campaign_cleaned = read_table('data/clean_factset_campaign.csv')
-        df_factset_pricing_cleaned = read_table('data/clean_factset_pricing.csv')
-        df_yahoo_finance_pricing_cleaned = read_table('data/clean_yahoo_finance_pricing.csv')
+    write_table(df_factset_betas, 'data/factset_betas')
+    write_table(sr_fingerprints.reset_index(), 'data/factset_betas_fingerprints')
 
-        print(h1('calculating betas'))
-        df_factset_betas = calculate_betas(df_factset_campaign_cleaned, df_factset_pricing_cleaned, df_yahoo_finance_pricing_cleaned)
+def run_engineer_stage(beta_column, incremental=False):
+    df_factset_campaign_cleaned = read_table('data/clean_factset_campaign')
+    df_factset_betas = read_table('data/factset_betas')
 
-        print(h1('writing betas'))
-        write_table(df_factset_betas, 'data/factset_betas.csv')
+    # incremental only re-engineers campaigns whose cleaned rows or betas changed since the stored table,
+    # alongside it are kept the state it needs: the table as engineered (the stored table is compact, see
+    # compact_dtypes, and its rounded values would change the rows that are recalculated), fingerprints,
+    # cumulative successes and known tactics
+    sr_fingerprints = get_engineering_fingerprints(
+        df_factset_campaign_cleaned, df_factset_betas, beta_column,
+        salt=json.dumps([beta_column, get_code_version(run_engineer_stage)])
+    )
+    list_state_tables = [
+        'data/engineered_factset_campaign_state', 'data/engineered_factset_campaign_fingerprints',
+        'data/engineered_cumulative_successes', 'data/engineered_tactic_columns'
+    ]
+    if incremental and all(table_exists(table_path) for table_path in list_state_tables):
+        changed_ids = get_changed_campaign_ids(sr_fingerprints, read_fingerprints('data/engineered_factset_campaign_fingerprints'))
+        df_factset_campaign_engineered, df_cumulative_successes, df_tactic_columns = update_engineered_features(
+            df_factset_campaign_cleaned, df_factset_betas,
+            read_table('data/engineered_factset_campaign_state'),
+            read_table('data/engineered_cumulative_successes'),
+            read_table('data/engineered_tactic_columns'),
+            changed_ids, beta_column=beta_column
+        )
+    else:
+        df_factset_campaign_engineered = engineer_features(df_factset_campaign_cleaned, df_factset_betas, beta_column=beta_column)
+        df_cumulative_successes = calculate_cumulative_successes(df_factset_campaign_engineered).reset_index(drop=True)
+        df_tactic_columns = get_tactic_columns(df_factset_campaign_cleaned)
+
+    # stored compact for the stages and the dashboard, exported to csv for the notebooks as engineered
+    write_table(compact_dtypes(df_factset_campaign_engineered, table_name='data/engineered_factset_campaign'), 'data/engineered_factset_campaign')
+    write_table(df_factset_campaign_engineered, 'data/engineered_factset_campaign', table_format='csv')
+    write_table(df_factset_campaign_engineered, 'data/engineered_factset_campaign_state')
+    write_table(sr_fingerprints.reset_index(), 'data/engineered_factset_campaign_fingerprints')
+    write_table(df_cumulative_successes, 'data/engineered_cumulative_successes')
+    write_table(df_tactic_columns, 'data/engineered_tactic_columns')
+
+def run_encode_stage():
+    df_encoded, df_design_matrix, df_vocabularies = encode_mappings(read_table(
+        'data/engineered_factset_campaign',
+        columns=['campaign_id'] + [dict_table['column'] for dict_table in dict_mapping_tables.values()]
+    ))
+    write_table(df_encoded, 'data/encoded_factset_campaign')
+    write_table(df_design_matrix, 'data/encoded_design_matrix')
+    write_table(df_vocabularies, 'data/encoding_vocabularies', export_csv=True)
+
+def run_bundle_stage():
+    # the dashboard's memory-mappable bundle, with the campaign return model when it has been trained
+    write_dashboard_bundle(
+        read_table('data/engineered_factset_campaign'),
+        read_table('data/clean_factset_pricing', columns=['company_id', 'date', 'price']),
+        read_table('data/engineered_cumulative_successes')
+    )
 
-    if True:
+# the pipeline is a chain of stages, each one reads the tables written by the stages it depends on
+# a stage is recomputed only when its cache key changes: the key hashes the input files, the output
+# tables of upstream stages, the parameters and the source code of the functions the stage runs (see
+# get_code_version), so a rerun that writes different tables (like --force read refreshing the market
+# prices) also reruns every stage downstream of it
+# runtime options that do not change outputs (like the number of workers or incremental updates)
+# are passed separately
+dict_pipeline_stages = {
+    'read': {
+        'title': 'reading raw data',
+        'function': run_read_stage,
+        'input_files': ['data/factset_campaign_v9.xlsx', 'data/factset_pricing.txt'],
+        'upstream_stages': [],
+        'outputs': ['data/raw_factset_campaign', 'data/raw_factset_pricing', 'data/raw_yahoo_finance_pricing'],
+        'parameters': {},
+    },
+    'clean': {
+        'title': 'cleaning data',
+        'function': run_clean_stage,
+        'input_files': [],
+        'upstream_stages': ['read'],
+        'outputs': ['data/clean_factset_campaign', 'data/clean_factset_pricing', 'data/clean_yahoo_finance_pricing'],
+        'parameters': {},
+    },
+    'betas': {
+        'title': 'calculating betas',
+        'function': run_betas_stage,
+        'input_files': [],
+        'upstream_stages': ['clean'],
+        'outputs': ['data/factset_betas'],
+        # estimation windows are (first, last) trading days relative to the announcement
+        'parameters': {'estimation_windows': [[-250, -30]], 'min_observations': 60},
+    },
+    'engineer': {
+        'title': 'merging data and engineering features',
+        'function': run_engineer_stage,
+        'input_files': [dict_mapping_tables[name]['mapping_path'] for name in dict_history_groups.values()] + [column_schema_path],
+        'upstream_stages': ['clean', 'betas'],
+        'outputs': ['data/engineered_factset_campaign', 'data/engineered_cumulative_successes'],
+        # the full-window beta by default, or one of the estimation window betas like beta_m250_m30
+        'parameters': {'beta_column': 'beta'},
+    },
+    'encode': {
+        'title': 'encoding mapped groups',
+        'function': run_encode_stage,
+        'input_files': [dict_table['mapping_path'] for dict_table in dict_mapping_tables.values()],
+        'upstream_stages': ['engineer'],
+        'outputs': ['data/encoded_factset_campaign', 'data/encoded_design_matrix', 'data/encoding_vocabularies'],
+        'parameters': {},
+    },
+    'bundle': {
+        'title': 'building the dashboard bundle',
+        'function': run_bundle_stage,
+        'input_files': ['results/campaign_return_model.joblib', 'results/campaign_return_model_data.csv'],
+        'upstream_stages': ['clean', 'engineer'],
+        'outputs': ['data/dashboard_bundle/campaigns'],
+        'parameters': {},
+    },
+}
 
-        print(h1('reading clean data'))
-        df_factset_campaign_cleaned = read_table('data/clean_factset_campaign.csv')
-        df_factset_betas = read_table('data/factset_betas.csv')
+pipeline_manifest_path = 'data/pipeline_manifest.json'
+pipeline_report_path = 'data/pipeline_report.json'
+pipeline_report_history_path = 'data/pipeline_report_history.csv'
+pipeline_profile_directory = 'data/pipeline_profiles'
+
+def read_pipeline_manifest():
+    if not os.path.exists(pipeline_manifest_path):
+        return {'stages': {}, 'file_hashes': {}}
+    with open(pipeline_manifest_path) as f:
+        return json.load(f)
+
+def write_pipeline_manifest(dict_manifest):
+    with open(pipeline_manifest_path, 'w') as f:
+        json.dump(dict_manifest, f, indent=2, sort_keys=True)
+
+# the code of a stage is found from its function rather than listed: the source of every function of this
+# repository it references, directly or through the functions, nested functions and lambdas it calls,
+# and the values of the module level constants they use (like dict_manual_renamings)
+# functions of installed packages, modules and other objects (like logger) are not part of it
+repository_directory = os.path.dirname(os.path.abspath(__file__))
+
+def is_repository_function(value):
+    # by file rather than module name, which is __main__ when main.py is run
+    return inspect.isfunction(value) and os.path.dirname(os.path.abspath(inspect.getsourcefile(value))) == repository_directory
+
+def get_code_objects(code):
+    # a function's code and the code of the functions and lambdas defined in it
+    yield code
+    for constant in code.co_consts:
+        if inspect.iscode(constant):
+            yield from get_code_objects(constant)
+
+def get_code_version(function):
+    code_hash = hashlib.sha256()
+    set_visited = set()
+
+    def describe(value):
+        # functions are hashed once by their source and described by name, data by its values
+        if is_repository_function(value):
+            value = inspect.unwrap(value)
+            name = f'{os.path.basename(inspect.getsourcefile(value))}:{value.__qualname__}'
+            # by identity, lambdas share their name
+            if id(value) not in set_visited:
+                set_visited.add(id(value))
+                code_hash.update(inspect.getsource(value).encode())
+                for code in get_code_objects(value.__code__):
+                    for global_name in code.co_names:
+                        if global_name in value.__globals__:
+                            code_hash.update(f'{global_name}={describe(value.__globals__[global_name])};'.encode())
+            return name
+        if isinstance(value, dict):
+            return '{' + ', '.join(f'{describe(key)}: {describe(item)}' for key, item in value.items()) + '}'
+        if isinstance(value, (list, tuple)):
+            return '[' + ', '.join(describe(item) for item in value) + ']'
+        if isinstance(value, (set, frozenset)):
+            return '{' + ', '.join(sorted(describe(item) for item in value)) + '}'
+        if value is None or isinstance(value, (str, bytes, int, float, bool)):
+            return repr(value)
+        return ''
+
+    describe(function)
+    return code_hash.hexdigest()
+
+def get_stage_key(stage, dict_manifest):
+    dict_stage = dict_pipeline_stages[stage]
+    dict_key = {
+        # a missing input file is allowed for optional inputs like the trained model
+        'input_files': {
+            file_path: hash_file(file_path, dict_manifest['file_hashes']) if os.path.exists(file_path) else None
+            for file_path in dict_stage['input_files']
+        },
+        'upstream_stages': {upstream_stage: dict_manifest['stages'].get(upstream_stage, {}).get('output_version') for upstream_stage in dict_stage['upstream_stages']},
+        'parameters': dict_stage['parameters'],
+        'code_version': get_code_version(dict_stage['function']),
+    }
+    return hashlib.sha256(json.dumps(dict_key, sort_keys=True, default=str).encode()).hexdigest()
+
+def get_output_version(stage, dict_manifest):
+    # hash of the tables a stage wrote, the file hashes are cached in the manifest by size and mtime
+    dict_output_hashes = {
+        table_path: hash_file(find_table_file_path(table_path)[0], dict_manifest['file_hashes'])
+        for table_path in dict_pipeline_stages[stage]['outputs']
+    }
+    return hashlib.sha256(json.dumps(dict_output_hashes, sort_keys=True).encode()).hexdigest()
+
+def get_input_file_hashes(dict_manifest):
+    # hashes of the input files of every stage, the version of the data a run report is about
+    return {
+        file_path: hash_file(file_path, dict_manifest['file_hashes']) if os.path.exists(file_path) else None
+        for dict_stage in dict_pipeline_stages.values() for file_path in dict_stage['input_files']
+    }
+
+def run_pipeline(force_stages=(), skip_stages=(), dict_runtime_parameters=None, profile_directory=None):
+    # every stage, and the instrumented functions and table reads and writes in it, is measured in a run
+    # report written to pipeline_report_path and appended to pipeline_report_history_path
+    # with profile_directory, the stages that run are profiled to <profile_directory>/<stage>.prof
+    dict_manifest = read_pipeline_manifest()
+    dict_runtime_parameters = dict_runtime_parameters or {}
+    dict_input_file_hashes = get_input_file_hashes(dict_manifest)
+    dict_report = {
+        'started_at': pd.Timestamp('now').isoformat(),
+        'arguments': sys.argv[1:],
+        'input_files': dict_input_file_hashes,
+        'input_version': hashlib.sha256(json.dumps(dict_input_file_hashes, sort_keys=True).encode()).hexdigest()[:12],
+        'versions': {'python': platform.python_version(), 'pandas': pd.__version__, 'numpy': np.__version__},
+        'status': None,
+    }
+
+    list_steps = []
+    try:
+        with record_run_report() as list_steps:
+            for stage, dict_stage in dict_pipeline_stages.items():
+                print(h1(dict_stage['title']))
+
+                with measure_stage(stage) as dict_stage_step:
+                    # skipped stages keep their outputs and recorded key, whatever their inputs
+                    if stage in skip_stages:
+                        logger.info(f'skipping stage {stage}')
+                        dict_stage_step['status'] = 'skipped'
+                        continue
+
+                    stage_key = get_stage_key(stage, dict_manifest)
+                    is_up_to_date = (
+                        dict_manifest['stages'].get(stage, {}).get('key') == stage_key and
+                        all(table_exists(table_path) for table_path in dict_stage['outputs'])
+                    )
+                    if is_up_to_date and stage not in force_stages:
+                        logger.info(f'stage {stage} is up to date ({stage_key[:12]})')
+                        dict_stage_step['status'] = 'up to date'
+                    else:
+                        logger.info(f'running stage {stage} ({stage_key[:12]})')
+                        # failed until the stage function returns, the error is raised after writing the report
+                        dict_stage_step['status'] = 'failed'
+                        dict_parameters = {**dict_stage['parameters'], **dict_runtime_parameters.get(stage, {})}
+                        if profile_directory:
+                            run_profiled(dict_stage['function'], os.path.join(profile_directory, f'{stage}.prof'), **dict_parameters)
+                        else:
+                            dict_stage['function'](**dict_parameters)
+                        dict_stage_step['status'] = 'ran'
+
+                if dict_stage_step['status'] == 'ran':
+                    dict_manifest['stages'][stage] = {
+                        'key': stage_key,
+                        'completed_at': pd.Timestamp('now').isoformat(),
+                    }
+                    logger.info(
+                        f'stage {stage} took {dict_stage_step["wall_seconds"]:.1f}s ({dict_stage_step["cpu_seconds"]:.1f}s cpu), '
+                        f'peak rss {dict_stage_step["peak_rss_mb"]:.0f} MB'
+                    )
+                # also for up to date stages, whose tables may have been rewritten since (or were written
+                # before output versions were recorded), only changed tables are hashed again
+                dict_manifest['stages'][stage]['output_version'] = get_output_version(stage, dict_manifest)
+                write_pipeline_manifest(dict_manifest)
+        dict_report['status'] = 'completed'
+    except BaseException:
+        dict_report['status'] = 'failed'
+        raise
+    finally:
+        dict_report['finished_at'] = pd.Timestamp('now').isoformat()
+        write_run_report(dict_report, list_steps, pipeline_report_path, pipeline_report_history_path)
+    return dict_manifest
+
+def parse_arguments(arguments=None):
+    list_stages = list(dict_pipeline_stages)
+    parser = argparse.ArgumentParser(description='Run the campaign data pipeline, recomputing only stages whose inputs changed.')
+    parser.add_argument('--force', nargs='+', default=[], choices=list_stages + ['all'], metavar='STAGE', help=f'rerun these stages even if up to date, one of {list_stages} or all')
+    parser.add_argument('--skip', nargs='+', default=[], choices=list_stages, metavar='STAGE', help='do not run these stages and use their existing outputs')
+    parser.add_argument('--workers', type=int, default=1, help='number of worker processes for calculating betas')
+    parser.add_argument('--estimation-window', action='append', dest='estimation_windows', metavar='START:END', help='trading day window relative to the announcement for estimation betas, repeatable, e.g. --estimation-window=-250:-30')
+    parser.add_argument('--incremental', action='store_true', help='only recalculate betas and features of new or changed campaigns, the stored tables are updated in place')
+    parser.add_argument('--profile', action='store_true', help=f'profile the stages that run with cProfile, written to {pipeline_profile_directory}/<stage>.prof')
+    parser.add_argument('--beta-column', help='beta used for residual returns, e.g. beta_m250_m30 (default beta, over the full pre_18m..post_18m window)')
+    args = parser.parse_args(arguments)
+    if 'all' in args.force:
+        args.force = list_stages
+    if args.estimation_windows:
+        try:
+            args.estimation_windows = [[int(offset) for offset in window.split(':')] for window in args.estimation_windows]
+        except ValueError:
+            parser.error(f'--estimation-window must be START:END trading days, e.g. -250:-30, got {args.estimation_windows}')
+        if any(len(window) != 2 for window in args.estimation_windows):
+            parser.error(f'--estimation-window must be START:END trading days, e.g. -250:-30, got {args.estimation_windows}')
+
+    # checked here rather than failing in the engineer stage after the betas have been calculated
+    estimation_windows = args.estimation_windows or dict_pipeline_stages['betas']['parameters']['estimation_windows']
+    list_beta_column_choices = ['beta'] + [get_estimation_window_column(start_offset, end_offset) for start_offset, end_offset in estimation_windows]
+    if args.beta_column and args.beta_column not in list_beta_column_choices:
+        parser.error(f'--beta-column must be one of {list_beta_column_choices} with these estimation windows, got {args.beta_column}')
+    return args
+
+def main(arguments=None):
 
-        print(h1('merging data and engineering features'))
-        df_factset_campaign_engineered = engineer_features(df_factset_campaign_cleaned, df_factset_betas)
+    logging.basicConfig(
+        level=logging.DEBUG,
+        format='%(asctime)s %(levelname)s [%(name)s] %(message)s'
+    )
 
-        print(h1('writing features'))
-        write_table(df_factset_campaign_engineered, 'data/engineered_factset_campaign.csv')
+    args = parse_arguments(arguments)
+    if args.estimation_windows:
+        dict_pipeline_stages['betas']['parameters']['estimation_windows'] = args.estimation_windows
+    if args.beta_column:
+        dict_pipeline_stages['engineer']['parameters']['beta_column'] = args.beta_column
+    run_pipeline(
+        force_stages=args.force,
+        skip_stages=args.skip,
+        dict_runtime_parameters={
+            'betas': {'n_workers': args.workers, 'incremental': args.incremental},
+            'engineer': {'incremental': args.incremental},
+        },
+        profile_directory=pipeline_profile_directory if args.profile else None
+    )
 
     print(h1('complete'))
 
     return
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,99 @@
+import argparse as argparse
+import functools as functools
+import logging as logging
+import os as os
+import pandas as pd
+
+from joblib import load
+
+logger = logging.getLogger(__name__)
+
+# campaign return predictions for the dashboard
+# every campaign in the model data is scored in one vectorized predict call when the service loads,
+# or read from a scores file written by the bulk scoring command (e.g. on a schedule) when it is
+# newer than the model and its data, and single predictions are cached by campaign and filtration date
+# run from the repository root to score a csv of (hypothetical) campaigns in one predict call:
+# python prediction_service.py --input results/campaign_return_model_data.csv --output results/campaign_return_scores.csv
+
+campaign_return_model_path = 'results/campaign_return_model.joblib'
+campaign_return_model_data_path = 'results/campaign_return_model_data.csv'
+campaign_return_scores_path = 'results/campaign_return_scores.csv'
+prediction_cache_size = 4096
+
+
+def load_campaign_return_model(model_path=campaign_return_model_path):
+    logger.info(f'loading model from {model_path}')
+    return load(model_path)
+
+def score_campaigns(campaign_return_model, df_campaign_return_data):
+    # one predict call for all rows, the first column is the campaign_id and the rest are the model inputs
+    df_x = df_campaign_return_data.iloc[:, 1::]
+    df_scores = df_campaign_return_data.iloc[:, :1].assign(predicted_return=campaign_return_model.predict(df_x))
+    if hasattr(campaign_return_model, 'predict_proba'):
+        df_scores['predicted_probability'] = campaign_return_model.predict_proba(df_x)[:, -1]
+    return df_scores
+
+def score_campaign_file(input_path, output_path, model_path=campaign_return_model_path):
+    df_campaign_return_data = pd.read_csv(input_path)
+    logger.info(f'scoring {len(df_campaign_return_data)} campaigns from {input_path}')
+    df_scores = score_campaigns(load_campaign_return_model(model_path), df_campaign_return_data)
+    logger.info(f'writing to {output_path}')
+    df_scores.to_csv(output_path, index=False)
+    return df_scores
+
+def is_newer_than(file_path, list_file_paths):
+    return os.path.exists(file_path) and all(
+        os.path.getmtime(file_path) >= os.path.getmtime(other_file_path) for other_file_path in list_file_paths
+    )
+
+def load_batch_scores(campaign_return_model, df_campaign_return_data, scores_path=campaign_return_scores_path, model_path=campaign_return_model_path, model_data_path=campaign_return_model_data_path):
+    # predicted return by campaign_id, a campaign with several rows keeps its first as before
+    if is_newer_than(scores_path, [model_path, model_data_path]):
+        logger.info(f'reading scores from {scores_path}')
+        df_scores = pd.read_csv(scores_path)
+    else:
+        logger.info(f'scoring {len(df_campaign_return_data)} campaigns')
+        df_scores = score_campaigns(campaign_return_model, df_campaign_return_data)
+    return df_scores.drop_duplicates(df_scores.columns[0]).set_index(df_scores.columns[0]).predicted_return
+
+def make_campaign_predictor(campaign_return_model, df_campaign_return_data, sr_announcement_dates=None, cache_size=prediction_cache_size, **kwargs):
+
+    # returns predict_campaign_return(campaign_id, filtration_date=None), cached in a bounded LRU cache
+    # (see predict_campaign_return.cache_info() for hits and misses)
+    # with a filtration date, campaigns announced after it have no prediction, sr_announcement_dates
+    # maps campaign_id to announcement date
+    # campaigns missing from the batch scores are scored on their own
+
+    sr_batch_scores = load_batch_scores(campaign_return_model, df_campaign_return_data, **kwargs)
+    sr_announcement_dates = sr_announcement_dates if sr_announcement_dates is not None else pd.Series(dtype='datetime64[ns]')
+
+    @functools.lru_cache(maxsize=cache_size)
+    def predict_campaign_return(campaign_id, filtration_date=None):
+        if filtration_date is not None:
+            announcement_date = sr_announcement_dates.get(campaign_id)
+            if announcement_date is None or pd.isnull(announcement_date) or announcement_date > pd.Timestamp(filtration_date):
+                return None
+        if campaign_id in sr_batch_scores.index:
+            return sr_batch_scores.loc[campaign_id]
+        df_campaign = df_campaign_return_data[lambda df: df.iloc[:, 0] == campaign_id]
+        if df_campaign.empty:
+            return None
+        return score_campaigns(campaign_return_model, df_campaign.iloc[:1]).predicted_return.iloc[0]
+
+    return predict_campaign_return
+
+
+if __name__ == '__main__':
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s %(levelname)s [%(name)s] %(message)s'
+    )
+
+    parser = argparse.ArgumentParser(description='Score a csv of campaigns (campaign_id followed by the model inputs) with the campaign return model.')
+    parser.add_argument('--input', default=campaign_return_model_data_path)
+    parser.add_argument('--output', default=campaign_return_scores_path)
+    parser.add_argument('--model', default=campaign_return_model_path)
+    args = parser.parse_args()
+
+    score_campaign_file(args.input, args.output, model_path=args.model)
@@ -0,0 +1,179 @@
+import hashlib as hashlib
+import json as json
+import logging as logging
+import os as os
+import pandas as pd
+
+from instrumentation import instrumented
+
+logger = logging.getLogger(__name__)
+
+try:
+    import pyarrow as pyarrow
+except ImportError:
+    pyarrow = None
+
+
+# each format stores a table under <table_path><extension>
+# parquet and feather need pyarrow, pickle is the typed fallback without it
+# parquet and feather only read the requested columns, pickle and csv read the whole table
+# all three keep datetime64, categorical and float32 columns as written
+dict_table_formats = {
+    'parquet': {
+        'extension': '.parquet',
+        'read': lambda file_path, columns: pd.read_parquet(file_path, columns=columns),
+        'write': lambda df, file_path, compression: df.to_parquet(file_path, index=False, compression=compression),
+        'default_compression': 'snappy',
+    },
+    'feather': {
+        'extension': '.feather',
+        'read': lambda file_path, columns: pd.read_feather(file_path, columns=columns),
+        'write': lambda df, file_path, compression: df.reset_index(drop=True).to_feather(file_path, compression=compression or 'uncompressed'),
+        'default_compression': 'lz4',
+    },
+    'pickle': {
+        'extension': '.pkl',
+        'read': lambda file_path, columns: pd.read_pickle(file_path),
+        'write': lambda df, file_path, compression: df.to_pickle(file_path, compression=compression),
+        'default_compression': None,
+    },
+    'csv': {
+        'extension': '.csv',
+        'read': lambda file_path, columns: read_csv_table(file_path),
+        'write': lambda df, file_path, compression: df.to_csv(file_path, index=False, compression=compression),
+        'default_compression': None,
+    },
+}
+
+default_table_format = 'parquet' if pyarrow is not None else 'pickle'
+
+
+def read_csv_table(file_path):
+    # csv has no types, so re-parse every column that looks like a date
+    df = pd.read_csv(file_path)
+    for column in df.columns:
+        if 'date' in column:
+            df[column] = pd.to_datetime(df[column], infer_datetime_format=True)
+    return df
+
+def split_table_path(table_path):
+    # 'data/table.csv' -> ('data/table', 'csv'), 'data/table' -> ('data/table', None)
+    base_path, extension = os.path.splitext(table_path)
+    for table_format, dict_format in dict_table_formats.items():
+        if extension == dict_format['extension']:
+            return base_path, table_format
+    return table_path, None
+
+def get_table_file_path(table_path, table_format):
+    base_path, _ = split_table_path(table_path)
+    return base_path + dict_table_formats[table_format]['extension']
+
+def find_table_file_path(table_path, table_format=None):
+    # prefer the requested (or default) format, then any other typed format, then csv
+    base_path, path_format = split_table_path(table_path)
+    list_formats = [table_format or path_format or default_table_format] + [
+        f for f in dict_table_formats if f not in ('csv', table_format, path_format)
+    ] + ['csv']
+    for candidate_format in list_formats:
+        if candidate_format in ('parquet', 'feather') and pyarrow is None:
+            continue
+        file_path = get_table_file_path(base_path, candidate_format)
+        if os.path.exists(file_path):
+            return file_path, candidate_format
+    raise FileNotFoundError(f'no stored table found for {table_path}')
+
+@instrumented(label_argument='table_path')
+def read_table(table_path, table_format=None, columns=None):
+    file_path, table_format = find_table_file_path(table_path, table_format)
+    logger.info(f'reading from {file_path}')
+    df = dict_table_formats[table_format]['read'](file_path, columns)
+    if columns is not None:
+        # in the requested order, and the columns of formats that read the whole table
+        df = df.loc[:, columns]
+    return df
+
+@instrumented(label_argument='table_path')
+def write_table(df, table_path, table_format=None, compression='default', dtypes=None, export_csv=False):
+    # dtypes optionally casts columns before writing, e.g. {'price': 'float32', 'company_id': 'category'}
+    # export_csv additionally writes a csv copy for notebooks and spreadsheets, it is never read back
+    # while a typed copy exists
+    base_path, _ = split_table_path(table_path)
+    table_format = table_format or default_table_format
+    dict_format = dict_table_formats[table_format]
+    if compression == 'default':
+        compression = dict_format['default_compression']
+    if dtypes:
+        df = df.astype({column: dtype for column, dtype in dtypes.items() if column in df.columns})
+
+    file_path = get_table_file_path(base_path, table_format)
+    logger.info(f'writing to {file_path}')
+    dict_format['write'](df, file_path, compression)
+
+    if export_csv and table_format != 'csv':
+        csv_file_path = get_table_file_path(base_path, 'csv')
+        logger.info(f'exporting to {csv_file_path}')
+        df.to_csv(csv_file_path, index=False)
+
+    return file_path
+
+def hash_file(file_path, dict_file_hashes=None):
+    # sha256 of the file contents
+    # dict_file_hashes remembers hashes by path, size and mtime so unchanged files are not re-read
+    file_stat = os.stat(file_path)
+    file_signature = [file_stat.st_size, file_stat.st_mtime_ns]
+    if dict_file_hashes is not None:
+        dict_cached = dict_file_hashes.get(file_path)
+        if dict_cached is not None and dict_cached['signature'] == file_signature:
+            return dict_cached['hash']
+
+    logger.info(f'hashing {file_path}')
+    file_hash = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 23), b''):
+            file_hash.update(block)
+    file_hash = file_hash.hexdigest()
+
+    if dict_file_hashes is not None:
+        dict_file_hashes[file_path] = {'signature': file_signature, 'hash': file_hash}
+    return file_hash
+
+def table_exists(table_path):
+    try:
+        find_table_file_path(table_path)
+    except FileNotFoundError:
+        return False
+    return True
+
+def read_snapshot(source_path, snapshot_path, read_source, options=None):
+    # loads a slow-to-parse source file through a typed snapshot of its parsed table
+    # the snapshot is reused while the source keeps its size and mtime, or failing that its hash,
+    # and while the read options are the same; otherwise the source is parsed again
+    options = options or {}
+    stamp_path = snapshot_path + '.json'
+    source_stat = os.stat(source_path)
+    source_signature = [source_stat.st_size, source_stat.st_mtime_ns]
+
+    dict_stamp = {}
+    if os.path.exists(stamp_path) and table_exists(snapshot_path):
+        with open(stamp_path) as f:
+            dict_stamp = json.load(f)
+
+    if dict_stamp.get('options') == options:
+        if dict_stamp.get('signature') == source_signature:
+            return read_table(snapshot_path, table_format='pickle')
+        source_hash = hash_file(source_path)
+        if dict_stamp.get('hash') == source_hash:
+            dict_stamp['signature'] = source_signature
+            with open(stamp_path, 'w') as f:
+                json.dump(dict_stamp, f, indent=2)
+            return read_table(snapshot_path, table_format='pickle')
+    else:
+        source_hash = hash_file(source_path)
+
+    logger.info(f'snapshot of {source_path} is missing or stale, parsing it')
+    df = read_source()
+    write_table(df, snapshot_path, table_format='pickle')
+    with open(stamp_path, 'w') as f:
+        json.dump({'signature': source_signature, 'hash': source_hash, 'options': options}, f, indent=2)
+
+    return df
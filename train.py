@@ -0,0 +1,319 @@
+import argparse as argparse
+import logging as logging
+import math as math
+import os as os
+import time as time
+import joblib as joblib
+import numpy as np
+import pandas as pd
+
+from concurrent.futures import ProcessPoolExecutor
+from sklearn.base import clone
+from sklearn.compose import ColumnTransformer
+from sklearn.ensemble import GradientBoostingClassifier, RandomForestClassifier
+from sklearn.impute import SimpleImputer
+from sklearn.linear_model import LogisticRegression
+from sklearn.model_selection import GridSearchCV, ParameterGrid, StratifiedKFold, train_test_split
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import StandardScaler
+from sklearn.svm import SVC
+from main import expand_dtypes
+from prediction_service import campaign_return_model_data_path, campaign_return_model_path
+from table_store import read_table
+
+try:
+    from xgboost import XGBClassifier
+except ImportError:
+    XGBClassifier = None
+
+logger = logging.getLogger(__name__)
+
+# training harness for the campaign return model of campaign_return.ipynb
+# the model data is built from the pipeline's engineered and encoded tables, then candidate models are
+# searched with successive halving: every candidate is scored on a small part of each fold's training
+# rows, the best third go on to three times as many rows and so on until the last ones use all of them
+# the preprocessing is fitted once per fold (instead of once per candidate and fold as in GridSearchCV)
+# and the transformed matrices are cached in data/training_cache by a hash of the data, fold and
+# preprocessing, so candidates only fit the model and a rerun on the same data skips the preprocessing
+# candidates are scored in parallel processes, the best one is refitted as a preprocessor and model
+# pipeline on the training set and exported with its data for the dashboard
+# only the campaign return model is harnessed, the one app.py loads, campaign_primary_objective.ipynb is
+# still trained in its notebook: its multiclass target, one-hot encoded sector and activist columns and
+# objective history ratios need their own model data, preprocessing and scoring
+# run from the repository root after the pipeline's encode stage:
+# python train.py --workers 4 --baseline
+
+training_cache_directory = 'data/training_cache'
+twitter_count_path = 'data/twitter_count.csv'
+
+list_campaign_return_features = [
+    'ownership_percent_on_announcement',
+    'ownership_percent_exceeds_5_indicator',
+    'past_return_successes',
+    'independent_support_indicator',
+    'total_number_of_board_seats',
+    'board_seats_percentage_sought',
+    'poison_pill_indicator',
+    'poison_pill_adopted_indicator',
+    'pre_12m_earnings_yield',
+    'tweet_count',
+    'beta'
+]
+
+# one-hot groups from the encode stage's design matrix, without the first (missing) group like drop_first
+list_campaign_return_mappings = ['campaign_objective', 'value_demand', 'governance_demand']
+
+list_regularization_grid = [0.00001, 0.0001, 0.001, 0.01, 0.1, 1, 10, 100, 1000, 10000]
+
+dict_candidate_models = {
+    'lasso_logistic_regression': {
+        'model': LogisticRegression(penalty='l1', solver='liblinear', tol=0.001, max_iter=1000),
+        'grid': {'C': list_regularization_grid}
+    },
+    'ridge_logistic_regression': {
+        'model': LogisticRegression(penalty='l2', solver='lbfgs', tol=0.001, max_iter=1000),
+        'grid': {'C': list_regularization_grid}
+    },
+    'random_forest': {
+        'model': RandomForestClassifier(random_state=1),
+        'grid': {'n_estimators': [100, 500], 'max_features': ['log2', 'sqrt'], 'min_samples_leaf': [1, 5]}
+    },
+    'gradient_boosting': {
+        'model': GradientBoostingClassifier(random_state=1),
+        'grid': {'n_estimators': [100, 300], 'learning_rate': [0.03, 0.1], 'max_depth': [2, 3]}
+    },
+    'support_vector_machine': {
+        'model': SVC(),
+        'grid': {'C': [0.1, 1, 10], 'kernel': ['linear', 'rbf']}
+    }
+}
+
+if XGBClassifier is not None:
+    dict_candidate_models['xgboost'] = {
+        'model': XGBClassifier(random_state=1),
+        'grid': {'max_depth': list(range(3, 10, 2))}
+    }
+
+
+def prepare_campaign_return_data():
+    # the model data of campaign_return.ipynb, rows with a known 6 month return
+    # with the dtypes of the notebook, float columns are the numeric features (see get_feature_types)
+    df_engineered = expand_dtypes(read_table('data/engineered_factset_campaign'))
+    df_design_matrix = read_table('data/encoded_design_matrix')
+    if not df_design_matrix.campaign_id.equals(df_engineered.campaign_id):
+        raise ValueError('data/encoded_design_matrix does not match data/engineered_factset_campaign, rerun the encode stage')
+
+    list_mapping_columns = [
+        column for column in df_design_matrix.columns
+        if column.split('=')[0] in list_campaign_return_mappings and not column.endswith('=(Missing)')
+    ]
+    df = pd.concat([df_engineered, df_design_matrix[list_mapping_columns]], axis=1)
+
+    if os.path.exists(twitter_count_path):
+        df = pd.merge(df, pd.read_csv(twitter_count_path)[['campaign_id', 'tweet_count']], how='left', on='campaign_id')
+    else:
+        logger.warning(f'{twitter_count_path} not found, tweet counts are set to 0')
+        df['tweet_count'] = np.nan
+
+    df = (
+        df
+        .assign(tweet_count=lambda df: df.tweet_count.fillna(0))
+        .assign(independent_support_indicator=lambda df: 1 * ((df.glass_lewis_support == 'Management') | (df.iss_support == 'Management')))
+        .assign(poison_pill_indicator=lambda df: 1 * (df.poison_pill_in_force_prior_to_announcement == 'Yes'))
+        .assign(poison_pill_adopted_indicator=lambda df: 1 * (df.poison_pill_adopted_in_response_to_campaign == 'Yes'))
+        .assign(ownership_percent_on_announcement=lambda df: df.ownership_pecent_on_announcement.fillna(0).clip(0, 0.20))
+        .assign(ownership_percent_exceeds_5_indicator=lambda df: 1 * (df.ownership_pecent_on_announcement > 0.05))
+        .assign(campaign_return=lambda df: df.cumulative_6m_residual_return.clip(-0.30, 0.30))
+        .assign(campaign_return_is_positive=lambda df: np.where(df.campaign_return.isnull(), np.nan, 1 * (df.campaign_return > 0)))
+        .dropna(subset=['campaign_return_is_positive'])
+        .reset_index(drop=True)
+    )
+
+    list_x_columns = list_campaign_return_features + [c for c in df.columns if 'used_' in c] + list_mapping_columns
+    return df, list_x_columns
+
+def get_feature_types(df_x):
+    # float columns are numeric, the indicators are categorical
+    list_numeric_features = [c for c in df_x.columns if df_x[c].dtype == float]
+    list_categorical_features = [c for c in df_x.columns if df_x[c].dtype != float]
+    return list_numeric_features, list_categorical_features
+
+def make_preprocessor(df_x):
+    # as in the notebook, numeric columns are median imputed and scaled and categorical ones are imputed
+    list_numeric_features, list_categorical_features = get_feature_types(df_x)
+    return ColumnTransformer(transformers=[
+        ('numeric', Pipeline(steps=[('imputer', SimpleImputer(strategy='median')), ('scaler', StandardScaler())]), list_numeric_features),
+        ('categorical', Pipeline(steps=[('imputer', SimpleImputer(strategy='most_frequent'))]), list_categorical_features)
+    ])
+
+def get_candidates(list_model_names=None):
+    # (model name, parameters) of every grid point
+    return [
+        (model_name, params)
+        for model_name in (list_model_names or dict_candidate_models)
+        for params in ParameterGrid(dict_candidate_models[model_name]['grid'])
+    ]
+
+def make_model(model_name, params):
+    return clone(dict_candidate_models[model_name]['model']).set_params(**params)
+
+def get_stratified_order(y, seed):
+    # a random order of the rows in which every prefix has about the class shares of y, so the
+    # successive halving subsets are the first rows of a fold
+    rng = np.random.default_rng(seed)
+    sr_y = pd.Series(y)
+    sr_position = pd.Series(rng.random(len(y))).groupby(sr_y.values).rank() / sr_y.map(sr_y.value_counts())
+    return np.argsort(sr_position.values, kind='stable')
+
+def get_fold_file_path(preprocessor, df_x, y, train_index, valid_index, seed, cache_directory=training_cache_directory):
+    # the fitted preprocessing of one fold and its transformed training (in stratified order) and
+    # validation matrices, cached by a hash of everything they depend on
+    fold_hash = joblib.hash([preprocessor, df_x, y, train_index, valid_index, seed])
+    file_path = os.path.join(cache_directory, f'fold_{fold_hash}.npz')
+    if os.path.exists(file_path):
+        logger.info(f'reading fold from {file_path}')
+        return file_path
+
+    logger.info(f'preprocessing fold of {len(train_index)} training rows')
+    fitted_preprocessor = clone(preprocessor).fit(df_x.iloc[train_index], y[train_index])
+    order = get_stratified_order(y[train_index], seed)
+    os.makedirs(cache_directory, exist_ok=True)
+    # written to a temporary file first so a concurrent run never reads a partial file
+    temporary_file_path = f'{file_path}.{os.getpid()}.tmp.npz'
+    np.savez(
+        temporary_file_path,
+        x_train=fitted_preprocessor.transform(df_x.iloc[train_index])[order],
+        y_train=y[train_index][order],
+        x_valid=fitted_preprocessor.transform(df_x.iloc[valid_index]),
+        y_valid=y[valid_index]
+    )
+    os.replace(temporary_file_path, file_path)
+    return file_path
+
+def prepare_folds(preprocessor, df_x, y, n_folds=5, seed=0):
+    # the same folds as GridSearchCV(cv=5) for a classifier
+    return [
+        get_fold_file_path(preprocessor, df_x, y, train_index, valid_index, seed)
+        for train_index, valid_index in StratifiedKFold(n_splits=n_folds).split(df_x, y)
+    ]
+
+def get_fold_rows(list_fold_file_paths):
+    # training rows of the largest fold, the last round uses all rows of every fold
+    list_rows = []
+    for fold_file_path in list_fold_file_paths:
+        with np.load(fold_file_path) as fold:
+            list_rows.append(len(fold['y_train']))
+    return max(list_rows)
+
+def score_candidate(model_name, params, fold_file_path, n_rows):
+    # accuracy on the fold's validation rows of the model fitted on its first n_rows training rows
+    with np.load(fold_file_path) as fold:
+        model = make_model(model_name, params).fit(fold['x_train'][:n_rows], fold['y_train'][:n_rows])
+        return model.score(fold['x_valid'], fold['y_valid'])
+
+def map_candidates(list_tasks, n_workers):
+    if n_workers <= 1:
+        return [score_candidate(*task) for task in list_tasks]
+    with ProcessPoolExecutor(max_workers=n_workers) as executor:
+        list_futures = [executor.submit(score_candidate, *task) for task in list_tasks]
+        return [future.result() for future in list_futures]
+
+def get_halving_rows(n_candidates, n_train_rows, factor=3, min_rows=100):
+    # rows per round, each round has factor times the rows of the previous one and ends with all of them
+    n_rounds = 1 + min(
+        math.ceil(math.log(max(n_candidates, 1), factor)),
+        max(int(math.log(max(n_train_rows / min_rows, 1), factor)), 0)
+    )
+    return [int(n_train_rows / factor ** (n_rounds - 1 - i)) for i in range(n_rounds)]
+
+def successive_halving(list_candidates, list_fold_file_paths, n_train_rows, n_workers=1, factor=3, min_rows=100):
+    # returns the scores of every round, the best candidate is the top one of the last round
+    list_scores = []
+    list_rows = get_halving_rows(len(list_candidates), n_train_rows, factor, min_rows)
+    for round_number, n_rows in enumerate(list_rows):
+        logger.info(f'round {round_number}: {len(list_candidates)} candidates on {n_rows} rows of {len(list_fold_file_paths)} folds')
+        list_tasks = [
+            (model_name, params, fold_file_path, n_rows)
+            for model_name, params in list_candidates
+            for fold_file_path in list_fold_file_paths
+        ]
+        fold_scores = np.array(map_candidates(list_tasks, n_workers)).reshape(len(list_candidates), len(list_fold_file_paths))
+        df_round = pd.DataFrame({
+            'round': round_number,
+            'rows': n_rows,
+            'model': [model_name for model_name, _ in list_candidates],
+            'params': [params for _, params in list_candidates],
+            'mean_score': fold_scores.mean(axis=1),
+            'std_score': fold_scores.std(axis=1)
+        }).sort_values('mean_score', ascending=False, kind='stable')
+        list_scores.append(df_round)
+        n_kept = math.ceil(len(list_candidates) / factor) if round_number < len(list_rows) - 1 else 1
+        list_candidates = [list_candidates[i] for i in df_round.index[:n_kept]]
+    return pd.concat(list_scores, ignore_index=True)
+
+def run_grid_search_baseline(preprocessor, X_train, y_train, list_model_names=None, n_folds=5):
+    # the notebook's search: a GridSearchCV of the preprocessor and model pipeline for each model, serially
+    list_results = []
+    for model_name in (list_model_names or dict_candidate_models):
+        grid_search = GridSearchCV(
+            Pipeline([('preprocessor', preprocessor), ('model', clone(dict_candidate_models[model_name]['model']))]),
+            {f'model__{name}': values for name, values in dict_candidate_models[model_name]['grid'].items()},
+            scoring='accuracy', cv=n_folds, refit=False
+        ).fit(X_train, y_train)
+        list_results.append((model_name, grid_search.best_params_, grid_search.best_score_))
+    return pd.DataFrame(list_results, columns=['model', 'params', 'mean_score']).sort_values('mean_score', ascending=False, kind='stable')
+
+def train_campaign_return_model(list_model_names=None, n_workers=1, n_folds=5, factor=3, min_rows=100, run_baseline=False):
+    df, list_x_columns = prepare_campaign_return_data()
+    df_train, df_test = train_test_split(df, test_size=0.2, shuffle=True, random_state=777, stratify=df.campaign_return_is_positive)
+    X_train, y_train = df_train[list_x_columns], df_train.campaign_return_is_positive.values
+    X_test, y_test = df_test[list_x_columns], df_test.campaign_return_is_positive.values
+    preprocessor = make_preprocessor(df[list_x_columns])
+    list_candidates = get_candidates(list_model_names)
+    logger.info(f'{len(list_candidates)} candidates, {len(X_train)} training and {len(X_test)} test rows, {len(list_x_columns)} features')
+
+    start_time = time.perf_counter()
+    list_fold_file_paths = prepare_folds(preprocessor, X_train, y_train, n_folds)
+    df_scores = successive_halving(list_candidates, list_fold_file_paths, get_fold_rows(list_fold_file_paths), n_workers, factor, min_rows)
+    search_seconds = time.perf_counter() - start_time
+
+    sr_best = df_scores[lambda df: df['round'] == df['round'].max()].iloc[0]
+    best_model_name, best_params = sr_best.model, sr_best.params
+    campaign_return_model = Pipeline([('preprocessor', preprocessor), ('model', make_model(best_model_name, best_params))]).fit(X_train, y_train)
+    logger.info(f'best candidate {best_model_name} {best_params}, test accuracy {campaign_return_model.score(X_test, y_test):.3f}')
+
+    logger.info(f'writing to {campaign_return_model_path} and {campaign_return_model_data_path}')
+    os.makedirs(os.path.dirname(campaign_return_model_path), exist_ok=True)
+    joblib.dump(campaign_return_model, campaign_return_model_path)
+    df[['campaign_id'] + list_x_columns].to_csv(campaign_return_model_data_path, index=False)
+
+    list_timings = [('successive halving', len(df_scores) * n_folds, search_seconds, best_model_name, sr_best.mean_score)]
+    if run_baseline:
+        start_time = time.perf_counter()
+        df_baseline = run_grid_search_baseline(preprocessor, X_train, y_train, list_model_names, n_folds)
+        list_timings.append(('grid search (notebook)', len(list_candidates) * n_folds, time.perf_counter() - start_time, df_baseline.iloc[0].model, df_baseline.iloc[0].mean_score))
+    df_timings = pd.DataFrame(list_timings, columns=['search', 'fits', 'seconds', 'best_model', 'best_score'])
+    return campaign_return_model, df_scores, df_timings
+
+def parse_arguments(arguments=None):
+    parser = argparse.ArgumentParser(description='Search and train the campaign return model.')
+    parser.add_argument('--workers', type=int, default=1, help='processes scoring candidates in parallel')
+    parser.add_argument('--models', nargs='+', choices=list(dict_candidate_models), default=None, help='candidate models to search, all by default')
+    parser.add_argument('--folds', type=int, default=5)
+    parser.add_argument('--factor', type=int, default=3, help='successive halving keeps 1 / factor candidates per round')
+    parser.add_argument('--min-rows', type=int, default=100, help='training rows per fold in the first round')
+    parser.add_argument('--baseline', action='store_true', help="also time the notebook's serial GridSearchCV over the same candidates")
+    return parser.parse_args(arguments)
+
+
+if __name__ == '__main__':
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s %(levelname)s [%(name)s] %(message)s'
+    )
+
+    args = parse_arguments()
+    _, df_scores, df_timings = train_campaign_return_model(args.models, args.workers, args.folds, args.factor, args.min_rows, args.baseline)
+    df_scores.to_csv('results/campaign_return_search_scores.csv', index=False)
+    print(df_timings.to_string(index=False, float_format=lambda value: f'{value:.3f}'))
@@ -0,0 +1,24 @@
+import gc as gc
+import logging as logging
+
+from app import app, get_campaign_predictor
+from dashboard_data import get_dashboard_data
+
+# production entry point for the dashboard, run from the repository root with
+# gunicorn wsgi:server
+# (settings in gunicorn.conf.py, python app.py is still the single process dev server)
+# with preload_app the data and the model are loaded here once, before gunicorn forks its workers,
+# and every worker shares them: the bundle's memory-mapped arrays through the OS page cache and
+# everything else copy-on-write, gc.freeze keeps the garbage collector of each worker from
+# touching (and so copying) the preloaded objects
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s %(levelname)s [%(name)s] %(message)s'
+)
+
+get_dashboard_data()
+get_campaign_predictor()
+gc.freeze()
+
+server = app.server